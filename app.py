@@ -1,61 +1,85 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, abort
+from markupsafe import Markup
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation, ArchivedReservation
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from collections import defaultdict
-import math
-from utils.utils import generate_qr_image, build_booking_email, send_email_with_qr
+import click
+from utils.utils import build_booking_email
+from utils.inventory import reserve_spot, check_in_reservation, free_spot, add_spots, bump_lot_version, remove_unused_spots, purge_completed_reservations, close_spots, reopen_spots, delete_spots, reconcile_lot_counters
+from utils.intervals import spot_schedules, reservation_window, DEFAULT_BOOKING_HOURS, MAX_BOOKING_HOURS, CHECK_IN_MARGIN
+from utils.pricing import charge, billed_hours, reservation_charge, cancellation_fee
+from utils.billing import lot_usage
+from utils.archive import archive_reservations, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from utils.pagination import keyset_page, cursor_url
+from utils.cache import fragment_cache, init_fragment_cache, template_digest
+from utils.gate import release_scans, log_gate_changes, gate_snapshot, GATE_BATCH_LIMIT
+from utils.qrcache import qr_cache, init_qr_cache, QR_FORMATS
+from utils.qrtoken import init_qr_signing, issue_token, signer, revocations, accept_legacy, InvalidToken, TOKEN_PREFIX, LEGACY_PREFIX
+from utils.ledger import record_release, total_revenue, revenue_by_lot, forget_lot_revenue, backfill_revenue
+from utils.outbox import enqueue_email, run_worker
+from utils.search import search_lots
+from utils.migrations import migrate, pending_migrations
+from utils.geo import parse_coordinates, nearest_available_lots, lot_index
+from utils.metrics import init_metrics, metrics
+from utils.seed import seed_data, create_default_admin, DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD
+from utils.events import event_bus, init_event_bus, lot_snapshot, publish_spot_change, publish_spot_changes, format_sse, KEEPALIVE_SECONDS
 from dotenv import load_dotenv
 import os
 from functools import wraps
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import and_
-
-load_dotenv()
+from sqlalchemy import and_, select, delete, func, case
+from sqlalchemy.orm import joinedload
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
+app.add_template_global(cursor_url)
 
 
-# Database configuration - automatically chooses the right database
-if os.environ.get('DATABASE_URL'):
-    # Production (Render) - uses PostgreSQL  
+def database_uri():
+    """PostgreSQL from DATABASE_URL in production, a local SQLite file otherwise."""
     database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        return 'sqlite:///database.sqlite3'
     # Handle potential postgresql:// vs postgres:// URL difference
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    # Development (your computer) - uses SQLite
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.sqlite3'
+    return database_url
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db.init_app(app)
-with app.app_context():
-    try:
-        # Create all tables if they don't exist
-        db.create_all()
-        
-        # Create default admin if it doesn't exist
-        if not User.query.filter_by(role='admin').first():
-            from werkzeug.security import generate_password_hash
-            hashed_pw = generate_password_hash("admin123")
-            admin = User(
-                email="admin@parkease.com",
-                password=hashed_pw,
-                fullname="Administrator", 
-                address="Admin Office",
-                pincode="000000",
-                role="admin"
-            )
-            db.session.add(admin)
-            db.session.commit()
-            print("✅ Default admin created!")
-    except Exception as e:
-        print(f"Database initialization: {e}")
-        
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
+def create_app():
+    """Configure the app from .env and the environment, and return it.
+
+    Only binds the database, without connecting to it, so every worker
+    starts in the same short time however many start at once. The schema
+    and the default admin are created once per deploy by `flask init-db`.
+    Calling it again returns the already configured app.
+    """
+    if 'sqlalchemy' in app.extensions:
+        return app
+    load_dotenv()
+
+    secret_key = os.environ.get('SECRET_KEY')
+    if not secret_key:
+        # Sessions signed with a throwaway key do not survive a restart or
+        # carry over to the other workers
+        print("SECRET_KEY is not set; sessions are signed with a per-process key")
+        secret_key = os.urandom(24)
+    app.secret_key = secret_key
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+    with app.app_context():
+        init_metrics(app, db.engine)
+        init_event_bus(db.engine)
+        init_fragment_cache()
+        init_qr_signing()
+        init_qr_cache(os.path.join(app.instance_path, 'qr_cache'))
+    return app
+
+
+USERS_PER_PAGE = 50
 
 def admin_required(f):
     @wraps(f)
@@ -235,13 +259,40 @@ def login():
 
     return render_template('login.html')
 
+def lot_cards(lots):
+    """The admin dashboard's card for each lot, as {lot_id: Markup}.
+
+    Cards are cached under the lot's version, which every booking, release
+    and edit bumps, so only lots that changed since they were last rendered
+    load their spots and render again.
+    """
+    digest = template_digest(app.jinja_env, 'lot_card.html')
+    keys = {
+        lot.id: f"lot-card:{digest}:{lot.id}:{lot.version}:{lot.created_at.timestamp() if lot.created_at else 0}"
+        for lot in lots
+    }
+    cached = fragment_cache.get_many(list(keys.values()))
+
+    stale = [lot for lot in lots if keys[lot.id] not in cached]
+    if stale:
+        spots = defaultdict(list)
+        for spot in db.session.execute(
+            select(ParkingSpot.lot_id, ParkingSpot.id, ParkingSpot.status)
+            .where(ParkingSpot.lot_id.in_([lot.id for lot in stale]))
+            .order_by(ParkingSpot.id)
+        ):
+            spots[spot.lot_id].append(spot)
+        rendered = {keys[lot.id]: render_template('lot_card.html', lot=lot, spots=spots[lot.id]) for lot in stale}
+        fragment_cache.set_many(rendered)
+        cached.update(rendered)
+
+    return {lot_id: Markup(cached[key]) for lot_id, key in keys.items()}
+
 @app.route('/admin_dashboard')
 @admin_required
 def admin_dashboard():
     try:
         lots = ParkingLot.query.all()
-        for lot in lots:
-            lot.spot_statuses = [{'status': spot.status} for spot in lot.spots]
 
         total_users = User.query.filter_by(role='user').count()
         total_lots = len(lots)
@@ -252,28 +303,7 @@ def admin_dashboard():
             and_(User.role == 'user', Reservation.leaving_time == None)
         ).distinct().count()
         
-        completed_reservations = db.session.query(
-            Reservation.parking_time,
-            Reservation.leaving_time,
-            Reservation.planned_start_time,
-            ParkingLot.price_per_hour
-        ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)\
-        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)\
-        .filter(Reservation.leaving_time.isnot(None))\
-        .all()
-
-        total_revenue = 0
-        for parking_time, leaving_time, planned_start_time, price_per_hour in completed_reservations:
-            planned_start = planned_start_time or parking_time
-            
-            if leaving_time < planned_start:
-                cost = price_per_hour * 0.25
-            else:
-                duration = (leaving_time - planned_start).total_seconds() / 3600
-                cost = math.ceil(max(0, duration)) * price_per_hour
-            
-            total_revenue += cost
-
+        revenue = total_revenue()
 
         stats = {
             'total_users': total_users,
@@ -281,22 +311,24 @@ def admin_dashboard():
             'total_spots': total_spots,
             'occupied_spots': occupied_spots,
             'active_users': active_users,
-            'total_revenue': round(total_revenue, 2),
+            'total_revenue': round(revenue, 2),
             'occupancy_rate': round((occupied_spots/total_spots)*100, 1) if total_spots > 0 else 0
         }
 
         return render_template('admin_dashboard.html', 
                              parking_lots=lots, 
+                             lot_cards=lot_cards(lots),
                              stats=stats,
                              total_spots=total_spots,
                              active_users=active_users,
-                             total_revenue=round(total_revenue, 2))
+                             total_revenue=round(revenue, 2))
 
     except SQLAlchemyError as e:
         flash("Error loading dashboard", "danger")
         print(f"Dashboard error: {e}")
         return render_template('admin_dashboard.html', 
                              parking_lots=[], 
+                             lot_cards={},
                              stats={},
                              total_spots=0,
                              active_users=0,
@@ -309,24 +341,29 @@ def search_parking():
     query = request.args.get('location', '').strip()
     results = []
 
-    if query:
+    if request.args.get('lat') or request.args.get('lng'):
         try:
-            results = ParkingLot.query.filter(
-                (ParkingLot.address.ilike(f'%{query}%')) |
-                (ParkingLot.pin_code.ilike(f'%{query}%')) |
-                (ParkingLot.prime_location_name.ilike(f'%{query}%'))
-            ).all()
-            results = [lot for lot in results if lot.available_spots_count > 0]
+            lat, lng = parse_coordinates(request.args.get('lat'), request.args.get('lng'))
+            k = min(max(request.args.get('k', 5, type=int), 1), 50)
+            for lot, distance in nearest_available_lots(lat, lng, k=k):
+                lot.distance_km = round(distance, 2)
+                results.append(lot)
+        except ValueError:
+            flash("Invalid location coordinates", "danger")
+        except SQLAlchemyError as e:
+            flash("Error searching parking lots", "danger")
+            print(f"Nearby search error: {e}")
+    elif query:
+        try:
+            results = search_lots(query)
         except SQLAlchemyError as e:
             flash("Error searching parking lots", "danger")
             print(f"Search error: {e}")
 
     try:
-        reservations = Reservation.query.filter_by(
-            user_id=session.get('user_id')
-        ).order_by(Reservation.parking_time.desc()).all()
+        reservations, total_bookings, active_bookings = _reservation_page(session.get('user_id'))
     except SQLAlchemyError as e:
-        reservations = []
+        reservations, total_bookings, active_bookings = [], 0, 0
         print(f"Reservations error: {e}")
 
     return render_template(
@@ -334,9 +371,27 @@ def search_parking():
         results=results,
         user_id=session.get('user_id'),
         reservations=reservations,
+        total_bookings=total_bookings,
+        active_bookings=active_bookings,
         search_results=bool(results)
     )
 
+def _reservation_page(user_id):
+    """One page of a user's reservations, newest first, with their total and active counts."""
+    reservations = keyset_page(
+        [(Reservation.query.filter_by(user_id=user_id).options(
+            joinedload(Reservation.spot).joinedload(ParkingSpot.lot)
+        ), (Reservation.parking_time, Reservation.id))],
+        key=lambda r: (r.parking_time, r.id),
+        cursor=request.args.get('cursor'),
+        descending=True,
+    )
+    total, active = db.session.query(
+        func.count(Reservation.id),
+        func.count(case((Reservation.leaving_time.is_(None), 1))),
+    ).filter(Reservation.user_id == user_id).one()
+    return reservations, total, active
+
 @app.route('/dashboard')
 @user_required
 def user_dashboard():
@@ -346,32 +401,22 @@ def user_dashboard():
 
     if location_query:
         try:
-            results = ParkingLot.query.filter(
-                (ParkingLot.address.ilike(f"%{location_query}%")) |
-                (ParkingLot.pin_code.ilike(f"%{location_query}%")) |
-                (ParkingLot.prime_location_name.ilike(f"%{location_query}%"))
-            ).all()
-            results = [lot for lot in results if lot.available_spots_count > 0]
+            results = search_lots(location_query)
         except SQLAlchemyError as e:
             flash("Error searching parking lots", "danger")
             print(f"Search error: {e}")
 
     try:
-        reservations = Reservation.query.filter_by(
-            user_id=user_id
-        ).order_by(Reservation.parking_time.desc()).all()
-        
-        active_bookings = len([r for r in reservations if r.leaving_time is None])
-        
+        reservations, total_bookings, active_bookings = _reservation_page(user_id)
     except SQLAlchemyError as e:
-        reservations = []
-        active_bookings = 0
+        reservations, total_bookings, active_bookings = [], 0, 0
         print(f"Reservations error: {e}")
 
     return render_template('user_dashboard.html',
                          results=results,
                          reservations=reservations,
                          user_id=user_id,
+                         total_bookings=total_bookings,
                          active_bookings=active_bookings,
                          search_results=bool(results) if location_query else None)
 
@@ -387,11 +432,16 @@ def book_spot(lot_id, user_id):
         vehicle_number = request.form.get('vehicle_number', '').strip()
         booking_date = request.form.get('booking_date', '').strip()
         booking_time = request.form.get('booking_time', '').strip()
+        duration_hours = request.form.get('duration_hours', DEFAULT_BOOKING_HOURS, type=int)
 
         if not all([vehicle_number, booking_date, booking_time]):
             flash('Vehicle number, booking date, and booking time are required', 'danger')
             return redirect(url_for('book_spot', lot_id=lot_id, user_id=user_id))
 
+        if not duration_hours or not 1 <= duration_hours <= MAX_BOOKING_HOURS:
+            flash(f'Duration must be between 1 and {MAX_BOOKING_HOURS} hours.', 'danger')
+            return redirect(url_for('book_spot', lot_id=lot_id, user_id=user_id))
+
         try:
             booking_datetime_str = f"{booking_date} {booking_time}"
             booking_datetime = datetime.strptime(booking_datetime_str, '%d-%m-%Y %H:%M')
@@ -422,41 +472,45 @@ def book_spot(lot_id, user_id):
             user = User.query.get_or_404(user_id)
             lot = ParkingLot.query.get_or_404(lot_id)
 
-            spot = ParkingSpot.query.filter_by(
-                lot_id=lot_id, status='A'
-            ).first()
+            # A booking only occupies its spot from check-in; one starting now
+            # is checked in straight away.
+            end_datetime = booking_datetime + timedelta(hours=duration_hours)
+            check_in_now = booking_datetime <= current_time + CHECK_IN_MARGIN
+            window_start = min(booking_datetime, current_time) if check_in_now else booking_datetime
+            spot_id = reserve_spot(lot_id, window_start, end_datetime, occupy=check_in_now)
 
-            if not spot:
-                flash('No available spots in this lot.', 'danger')
+            if not spot_id:
+                db.session.rollback()
+                flash('No spots in this lot are free for that time. Try a different time or lot.', 'danger')
                 return redirect(url_for('user_dashboard'))
 
-            spot.status = 'O'
-
             reservation = Reservation(
-                spot_id=spot.id,
+                spot_id=spot_id,
                 user_id=user_id,
                 vehicle_number=vehicle_number,
                 parking_time=booking_datetime,
-                planned_start_time=booking_datetime
+                planned_start_time=booking_datetime,
+                planned_end_time=end_datetime,
+                checked_in_at=datetime.utcnow() if check_in_now else None
             )
 
             db.session.add(reservation)
-            db.session.commit()
-
-            try:
-                qr_buffer = generate_qr_image(f"reservation_id:{reservation.id}")
-                html_body = build_booking_email(user, lot, str(reservation.id), booking_datetime)
-                success, message = send_email_with_qr(user.email, "Booking Confirmation - ParkEase", html_body, qr_buffer)
-
-                if success:
-                    flash("Booking confirmed! Check your email for details.", "success")
-                else:
-                    flash(f"Booking confirmed! Email notification failed: {message} - Reservation ID: {reservation.id}", "warning")
+            db.session.flush()
 
-            except Exception as email_error:
-                print(f"Email error: {email_error}")
-                flash("Booking confirmed. Email notification failed - please save your reservation ID: {}".format(reservation.id), "warning")
+            # The confirmation is queued in the booking transaction and sent by
+            # the outbox worker, so SMTP latency never holds up this request.
+            html_body = build_booking_email(user, lot, str(reservation.id), booking_datetime)
+            enqueue_email(user.email, "Booking Confirmation - ParkEase", html_body,
+                          qr_data=issue_token(reservation))
+            if check_in_now:
+                log_gate_changes([(lot_id, reservation.id)])
+            db.session.commit()
+            spot_schedules.add(lot_id, spot_id, reservation.id, window_start, end_datetime)
+            if check_in_now:
+                publish_spot_change(lot_id, spot_id, 'O', reservation_id=reservation.id,
+                                    planned_start=booking_datetime.isoformat(), price_per_hour=lot.price_per_hour)
 
+            flash(f"Booking confirmed! Your confirmation email with QR code is on its way - Reservation ID: {reservation.id}", "success")
             return redirect(url_for('user_dashboard'))
 
         except SQLAlchemyError as e:
@@ -467,24 +521,96 @@ def book_spot(lot_id, user_id):
 
     try:
         lot = ParkingLot.query.get_or_404(lot_id)
-        available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
-
-        if not available_spot:
-            flash('No available spots in this lot.', 'danger')
-            return redirect(url_for('user_dashboard'))
 
+        # The spot is picked when the booking is made, once the time window is
+        # known; a lot that is full right now may still take later bookings.
         return render_template(
             'booking.html',
             user_id=user_id,
             lot_id=lot_id,
             lot=lot,
-            spot_id=available_spot.id
+            max_booking_hours=MAX_BOOKING_HOURS,
+            default_booking_hours=DEFAULT_BOOKING_HOURS,
+            cancellation_fee=cancellation_fee(lot.price_per_hour)
         )
 
     except SQLAlchemyError as e:
         flash('Error loading booking page', 'danger')
         return redirect(url_for('user_dashboard'))
 
+@app.route('/check_in/<int:reservation_id>', methods=['POST'])
+@user_required
+def check_in(reservation_id):
+    reservation = Reservation.query.get_or_404(reservation_id)
+
+    if reservation.user_id != session.get('user_id'):
+        flash('Unauthorized access to reservation', 'danger')
+        return redirect(url_for('user_dashboard'))
+
+    if reservation.leaving_time or reservation.checked_in_at:
+        flash('This reservation is already checked in or completed.', 'info')
+        return redirect(url_for('user_dashboard'))
+
+    start, end = reservation_window(reservation)
+    # Booking times are entered, and stored, in server local time.
+    now = datetime.now()
+    if now < start - CHECK_IN_MARGIN:
+        flash(f"Check-in opens at {(start - CHECK_IN_MARGIN).strftime('%d-%m-%Y %H:%M')}.", 'warning')
+        return redirect(url_for('user_dashboard'))
+
+    try:
+        booked_spot_id = reservation.spot_id
+        lot_id = reservation.spot.lot_id
+        spot_id = check_in_reservation(reservation, lot_id, now)
+        if not spot_id:
+            db.session.rollback()
+            flash('No spot is free in this lot right now. Please try again shortly.', 'danger')
+            return redirect(url_for('user_dashboard'))
+
+        log_gate_changes([(lot_id, reservation.id)])
+        db.session.commit()
+        if spot_id != booked_spot_id:
+            spot_schedules.add(lot_id, spot_id, reservation.id, now, end)
+        publish_spot_change(lot_id, spot_id, 'O', reservation_id=reservation.id,
+                            planned_start=start.isoformat(), price_per_hour=reservation.spot.lot.price_per_hour)
+
+        if spot_id != booked_spot_id:
+            flash(f'Checked in. Your booked spot is still occupied, so you have been moved to spot {spot_id}.', 'success')
+        else:
+            flash(f'Checked in to spot {spot_id}.', 'success')
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Check-in error: {e}")
+        flash('Check-in failed. Please try again.', 'danger')
+
+    return redirect(url_for('user_dashboard'))
+
+@app.route('/reservation/<int:reservation_id>/qr')
+@login_required
+def reservation_qr(reservation_id):
+    """The QR code of an open reservation; ?format=png (default), png1 or svg.
+
+    The ETag is the image's content address, so a revalidation is answered
+    without rendering anything.
+    """
+    fmt = request.args.get('format', 'png')
+    if fmt not in QR_FORMATS:
+        abort(404)
+    reservation = Reservation.query.get_or_404(reservation_id)
+    if reservation.leaving_time or (session.get('role') != 'admin' and reservation.user_id != session.get('user_id')):
+        abort(404)
+
+    qr_data = issue_token(reservation) if reservation.planned_end_time else f"{LEGACY_PREFIX}{reservation.id}"
+    etag = qr_cache.key(qr_data, fmt)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        image, etag = qr_cache.get(qr_data, fmt)
+        response = Response(image, mimetype=QR_FORMATS[fmt][0])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
 @app.route('/release/<int:reservation_id>', methods=['GET', 'POST'])
 @login_required
 def release_spot(reservation_id):
@@ -501,10 +627,19 @@ def release_spot(reservation_id):
             try:
                 if not reservation.leaving_time:
                     reservation.leaving_time = datetime.utcnow()
-                    spot.status = 'A'
+                    # Releasing a booking that never checked in just cancels it
+                    if reservation.checked_in_at:
+                        free_spot(spot.id, spot.lot_id)
+                        log_gate_changes([(spot.lot_id, reservation.id)])
+                    amount = record_release(reservation, lot)
+                    revoked = revocations.revoke(reservation)
                     db.session.commit()
+                    revocations.remember(revoked)
+                    spot_schedules.remove(reservation.id)
+                    if reservation.checked_in_at:
+                        publish_spot_change(spot.lot_id, spot.id, 'A', reservation_id=reservation.id, amount=amount)
 
-                flash("Spot released successfully!", "success")
+                flash("Spot released successfully!" if reservation.checked_in_at else "Booking cancelled.", "success")
 
                 if session.get('role') == 'admin':
                     return redirect(url_for('admin_dashboard'))
@@ -518,17 +653,8 @@ def release_spot(reservation_id):
 
         release_time = datetime.utcnow()
         planned_start = reservation.planned_start_time or reservation.parking_time
-        
-        if release_time < planned_start:
-            total_cost = round(lot.price_per_hour * 0.25, 2)
-            time_difference = 0
-        else:
-            time_difference = (release_time - planned_start).total_seconds() / 3600
-            
-            if session.get('role') == 'admin':
-                total_cost = round(math.ceil(time_difference) * lot.price_per_hour, 2)
-            else:
-                total_cost = round(math.ceil(time_difference) * lot.price_per_hour, 2)
+        total_cost = charge(lot.price_per_hour, planned_start, release_time)
+        time_difference = billed_hours(planned_start, release_time)
 
         template_name = 'release.html' if session.get('role') == 'user' else 'admin_release.html'
 
@@ -540,7 +666,7 @@ def release_spot(reservation_id):
             release_time=release_time,
             total_cost=total_cost,
             planned_start=planned_start,
-            time_difference=round(max(0, time_difference), 2)
+            time_difference=round(time_difference, 2)
         )
 
     except SQLAlchemyError as e:
@@ -574,22 +700,29 @@ def add_lot():
             flash("Invalid price or spots number.", 'danger')
             return render_template('add_lot.html')
 
+        try:
+            coordinates = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError:
+            flash("Latitude and longitude must both be valid numbers, or both left empty.", 'danger')
+            return render_template('add_lot.html')
+        latitude, longitude = coordinates or (None, None)
+
         try:
             new_lot = ParkingLot(
                 prime_location_name=prime_location_name,
                 address=address,
                 pin_code=pin_code,
-                price_per_hour=price_per_hour
+                price_per_hour=price_per_hour,
+                latitude=latitude,
+                longitude=longitude
             )
 
             db.session.add(new_lot)
             db.session.flush()
-
-            for _ in range(available_spots):
-                spot = ParkingSpot(lot_id=new_lot.id, status='A')
-                db.session.add(spot)
+            add_spots(new_lot.id, available_spots)
 
             db.session.commit()
+            lot_index.upsert(new_lot.id, latitude, longitude)
             flash(f"Parking lot '{prime_location_name}' added successfully!", 'success')
             return redirect(url_for('admin_dashboard'))
 
@@ -604,8 +737,14 @@ def add_lot():
 @admin_required
 def view_users():
     try:
-        users = User.query.filter(User.role != 'admin').all()
-        return render_template('view_users.html', users=users)
+        users = keyset_page(
+            [(User.query.filter(User.role != 'admin'), (User.id,))],
+            key=lambda u: (u.id,),
+            cursor=request.args.get('cursor'),
+            per_page=USERS_PER_PAGE,
+        )
+        total_users = db.session.query(func.count(User.id)).filter(User.role != 'admin').scalar()
+        return render_template('view_users.html', users=users, total_users=total_users)
     except SQLAlchemyError as e:
         flash("Error loading users", "danger")
         print(f"View users error: {e}")
@@ -642,38 +781,34 @@ def edit_lot(lot_id):
                 error_message = "Invalid price or spots number."
                 return render_template('edit_lot.html', lot=lot, error_message=error_message)
 
+            try:
+                coordinates = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+            except ValueError:
+                error_message = "Latitude and longitude must both be valid numbers, or both left empty."
+                return render_template('edit_lot.html', lot=lot, error_message=error_message)
+
             try:
                 lot.prime_location_name = prime_location_name
                 lot.address = address
                 lot.pin_code = pin_code
                 lot.price_per_hour = price_per_hour
+                lot.latitude, lot.longitude = coordinates or (None, None)
+                bump_lot_version(lot.id)
 
                 current_total_spots = lot.total_spots
 
                 if new_total_spots > current_total_spots:
-                    for _ in range(new_total_spots - current_total_spots):
-                        new_spot = ParkingSpot(lot_id=lot.id, status='A')
-                        db.session.add(new_spot)
+                    add_spots(lot.id, new_total_spots - current_total_spots)
 
                 elif new_total_spots < current_total_spots:
-                    spots_to_remove = current_total_spots - new_total_spots
-
-                    available_spots = []
-                    for spot in lot.spots:
-                        if spot.status == 'A':
-                            has_reservations = Reservation.query.filter_by(spot_id=spot.id).first()
-                            if not has_reservations:
-                                available_spots.append(spot)
-
-                    if spots_to_remove > len(available_spots):
+                    if not remove_unused_spots(lot.id, current_total_spots - new_total_spots):
+                        db.session.rollback()
                         error_message = "Cannot reduce spots: Not enough unused available spots to remove."
                         return render_template('edit_lot.html', lot=lot, error_message=error_message)
 
-                    spots_to_delete = available_spots[:spots_to_remove]
-                    for spot in spots_to_delete:
-                        db.session.delete(spot)
-
                 db.session.commit()
+                lot_index.upsert(lot.id, lot.latitude, lot.longitude)
+                spot_schedules.invalidate(lot.id)
                 flash(f"Lot '{lot.prime_location_name}' updated successfully!", 'success')
                 return redirect(url_for('admin_dashboard'))
 
@@ -698,6 +833,16 @@ def delete_lot_confirm(lot_id):
         flash("Error accessing lot", "danger")
         return redirect(url_for('admin_dashboard'))
 
+def reopen_after_failed_delete(lot_id, spot_id=None):
+    """Put spots closed for a delete that failed back in service."""
+    try:
+        reopen_spots(lot_id, spot_id)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        # They stay closed; deleting them again picks up where this left off
+        db.session.rollback()
+        print(f"Reopen spots error: {e}")
+
 @app.route('/delete_lot/<int:lot_id>', methods=['GET', 'POST'])
 @admin_required
 def delete_lot(lot_id):
@@ -706,28 +851,49 @@ def delete_lot(lot_id):
         error_message = None
 
         if request.method == 'POST':
-            occupied_spots = [s for s in lot.spots if s.status == 'O']
-            if occupied_spots:
-                occupied_count = len(occupied_spots)
+            if lot.occupied_spots_count:
+                occupied_count = lot.occupied_spots_count
                 error_message = f"Cannot delete lot: {occupied_count} spot(s) are currently occupied. Please wait for all users to release their spots first."
                 return render_template('delete_lot.html', lot=lot, error_message=error_message)
 
+            upcoming_count = db.session.query(Reservation.id).join(ParkingSpot).filter(
+                ParkingSpot.lot_id == lot.id,
+                Reservation.leaving_time.is_(None)
+            ).count()
+            if upcoming_count:
+                error_message = f"Cannot delete lot: {upcoming_count} upcoming booking(s) must be cancelled first."
+                return render_template('delete_lot.html', lot=lot, error_message=error_message)
+
             try:
-                for spot in lot.spots:
-                    reservations = Reservation.query.filter_by(spot_id=spot.id).all()
-                    for res in reservations:
-                        db.session.delete(res)
-                    db.session.delete(spot)
+                lot_name = lot.prime_location_name
+                # The spots close first, so nothing can be booked while the
+                # history goes in short transactions; the lot itself in one
+                if not close_spots(lot_id):
+                    db.session.rollback()
+                    error_message = "Cannot delete lot: spots were booked or occupied meanwhile. Please try again."
+                    return render_template('delete_lot.html', lot=lot, error_message=error_message)
+                db.session.commit()
+
+                purge_completed_reservations(select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id))
+                if not delete_spots(lot_id):
+                    db.session.rollback()
+                    reopen_after_failed_delete(lot_id)
+                    error_message = "Cannot delete lot: spots were added meanwhile. Please try again."
+                    return render_template('delete_lot.html', lot=lot, error_message=error_message)
 
-                db.session.delete(lot)
+                forget_lot_revenue(lot_id)
+                db.session.execute(delete(ParkingLot).where(ParkingLot.id == lot_id))
                 db.session.commit()
+                lot_index.remove(lot_id)
+                spot_schedules.invalidate(lot_id)
 
-                flash(f"Lot '{lot.prime_location_name}' deleted successfully!", 'success')
+                flash(f"Lot '{lot_name}' deleted successfully!", 'success')
                 return redirect(url_for('admin_dashboard'))
 
             except SQLAlchemyError as e:
                 db.session.rollback()
                 print(f"Delete lot error: {e}")
+                reopen_after_failed_delete(lot_id)
                 error_message = "Error deleting lot. Please try again."
 
         return render_template('delete_lot.html', lot=lot, error_message=error_message)
@@ -756,13 +922,23 @@ def delete_spot_final(spot_id):
             flash("Cannot delete occupied spot. Please wait for the user to release it first.", "danger")
             return redirect(url_for('spot_details', spot_id=spot_id))
 
+        if Reservation.query.filter_by(spot_id=spot.id, leaving_time=None).first():
+            flash("Cannot delete a spot with upcoming bookings. They must be cancelled first.", "danger")
+            return redirect(url_for('delete_spot', spot_id=spot_id))
+
         try:
-            reservations = Reservation.query.filter_by(spot_id=spot.id).all()
-            for res in reservations:
-                db.session.delete(res)
+            lot_id = spot.lot_id
+            if not close_spots(lot_id, spot_id):
+                db.session.rollback()
+                flash("Cannot delete spot: it was booked or occupied meanwhile.", "danger")
+                return redirect(url_for('delete_spot', spot_id=spot_id))
+            db.session.commit()
 
-            db.session.delete(spot)
+            purge_completed_reservations(select(ParkingSpot.id).where(ParkingSpot.id == spot_id))
+            # A closed spot cannot have been booked since
+            delete_spots(lot_id, spot_id)
             db.session.commit()
+            spot_schedules.invalidate(lot_id)
 
             flash("Spot deleted successfully!", 'success')
             return redirect(url_for('admin_dashboard'))
@@ -770,6 +946,7 @@ def delete_spot_final(spot_id):
         except SQLAlchemyError as e:
             db.session.rollback()
             print(f"Delete spot error: {e}")
+            reopen_after_failed_delete(lot_id, spot_id)
             flash("Error deleting spot. Please try again.", 'danger')
             return redirect(url_for('delete_spot', spot_id=spot_id))
 
@@ -787,9 +964,10 @@ def spot_details(spot_id):
         if spot.status == 'A':
             return redirect(url_for('delete_spot', spot_id=spot_id))
         
-        reservation = Reservation.query.filter_by(
-            spot_id=spot_id,
-            leaving_time=None
+        reservation = Reservation.query.filter(
+            Reservation.spot_id == spot_id,
+            Reservation.leaving_time.is_(None),
+            Reservation.checked_in_at.isnot(None)
         ).first()
 
         if not reservation:
@@ -801,21 +979,16 @@ def spot_details(spot_id):
         now = datetime.utcnow()
         planned_start = reservation.planned_start_time or reservation.parking_time
         
-        if now < planned_start:
-            hours_parked = 0
-            estimated_cost = spot.lot.price_per_hour * 0.25 
-            status_message = "Scheduled - Not Started"
-        else:
-            hours_parked = (now - planned_start).total_seconds() / 3600
-            estimated_cost = math.ceil(hours_parked) * spot.lot.price_per_hour
-            status_message = "Active Parking"
+        hours_parked = billed_hours(planned_start, now)
+        estimated_cost = charge(spot.lot.price_per_hour, planned_start, now)
+        status_message = "Scheduled - Not Started" if now < planned_start else "Active Parking"
 
         return render_template('spot_details.html',
                              spot=spot,
                              reservation=reservation,
                              user=user,
-                             hours_parked=round(max(0, hours_parked), 2),
-                             estimated_cost=round(estimated_cost, 2),
+                             hours_parked=round(hours_parked, 2),
+                             estimated_cost=estimated_cost,
                              planned_start=planned_start,
                              status_message=status_message)
 
@@ -836,65 +1009,25 @@ def admin_search():
     if query:
         try:
             if search_by == 'user_id' or query.isdigit():
-                user_id = int(query)
-                user = User.query.filter_by(id=user_id, role='user').first()
-                
-                if user:
-                    active_reservations = Reservation.query.filter_by(
-                        user_id=user_id,
-                        leaving_time=None
-                    ).all()
-                    
-                    spots = []
-                    for reservation in active_reservations:
-                        spot = ParkingSpot.query.get(reservation.spot_id)
-                        if spot:
-                            spot.reservation = reservation
-                            spot.user = user
-                            spots.append(spot)
-
-            elif search_by == 'username':
+                user = User.query.filter_by(id=int(query), role='user').first()
+            else:
                 user = User.query.filter(
                     User.fullname.ilike(f'%{query}%'),
                     User.role == 'user'
                 ).first()
-                
-                if user:
-                    active_reservations = Reservation.query.filter_by(
-                        user_id=user.id,
-                        leaving_time=None
-                    ).all()
-                    
-                    spots = []
-                    for reservation in active_reservations:
-                        spot = ParkingSpot.query.get(reservation.spot_id)
-                        if spot:
-                            spot.reservation = reservation
-                            spot.user = user
-                            spots.append(spot)
 
-            else:
-                if query.isdigit():
-                    user = User.query.filter_by(id=int(query), role='user').first()
-                else:
-                    user = User.query.filter(
-                        User.fullname.ilike(f'%{query}%'),
-                        User.role == 'user'
-                    ).first()
-                
-                if user:
-                    active_reservations = Reservation.query.filter_by(
-                        user_id=user.id,
-                        leaving_time=None
-                    ).all()
-                    
-                    spots = []
-                    for reservation in active_reservations:
-                        spot = ParkingSpot.query.get(reservation.spot_id)
-                        if spot:
-                            spot.reservation = reservation
-                            spot.user = user
-                            spots.append(spot)
+            if user:
+                # One joined query for every active reservation, its spot and lot
+                active = db.session.query(Reservation, ParkingSpot)\
+                    .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)\
+                    .options(joinedload(ParkingSpot.lot))\
+                    .filter(Reservation.user_id == user.id, Reservation.leaving_time == None)\
+                    .all()
+
+                for reservation, spot in active:
+                    spot.reservation = reservation
+                    spot.user = user
+                    spots.append(spot)
 
         except (ValueError, SQLAlchemyError) as e:
             flash("Error performing search", "danger")
@@ -916,9 +1049,10 @@ def scan_release(spot_id):
             flash("This spot is not occupied", "warning")
             return redirect(url_for('admin_dashboard'))
         
-        reservation = Reservation.query.filter_by(
-            spot_id=spot_id,
-            leaving_time=None
+        reservation = Reservation.query.filter(
+            Reservation.spot_id == spot_id,
+            Reservation.leaving_time.is_(None),
+            Reservation.checked_in_at.isnot(None)
         ).first()
         
         if not reservation:
@@ -933,6 +1067,14 @@ def scan_release(spot_id):
         flash("Error accessing scan page", "danger")
         return redirect(url_for('admin_dashboard'))
 
+def _reservation_parked_at(reservation_id, spot_id):
+    return db.session.query(Reservation.query.filter(
+        Reservation.id == reservation_id,
+        Reservation.spot_id == spot_id,
+        Reservation.leaving_time.is_(None),
+        Reservation.checked_in_at.isnot(None)
+    ).exists()).scalar()
+
 @app.route('/verify_qr', methods=['POST'])
 @admin_required
 def verify_qr():
@@ -941,16 +1083,32 @@ def verify_qr():
         qr_data = data.get('qr_data', '')
         spot_id = data.get('spot_id')
         
-        if qr_data.startswith('reservation_id:'):
+        if qr_data.startswith(TOKEN_PREFIX + '.'):
+            # Signed codes are checked without the database; the release
+            # page reads the reservation when the admin confirms
+            claims = signer().verify(qr_data)
+            if revocations.is_revoked(claims):
+                return jsonify({
+                    'success': False,
+                    'error': 'This booking has already been released or cancelled'
+                })
+            reservation_id = claims.reservation_id
+            # Check-in may have moved the car to another spot than the one booked
+            if claims.spot_id != spot_id and not _reservation_parked_at(reservation_id, spot_id):
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid QR code or reservation not found'
+                })
+            return jsonify({
+                'success': True,
+                'reservation_id': reservation_id,
+                'redirect_url': url_for('admin_release_spot', reservation_id=reservation_id)
+            })
+
+        elif qr_data.startswith(LEGACY_PREFIX) and accept_legacy():
             reservation_id = int(qr_data.split(':')[1])
-            
-            reservation = Reservation.query.filter_by(
-                id=reservation_id,
-                spot_id=spot_id,
-                leaving_time=None
-            ).first()
-            
-            if reservation:
+
+            if _reservation_parked_at(reservation_id, spot_id):
                 return jsonify({
                     'success': True,
                     'reservation_id': reservation_id,
@@ -966,13 +1124,73 @@ def verify_qr():
                 'success': False,
                 'error': 'Invalid QR code format'
             })
-    
+
+    except InvalidToken as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
     except (ValueError, SQLAlchemyError) as e:
         return jsonify({
             'success': False,
             'error': 'Error processing QR code'
         })
 
+@app.route('/admin/gate/release', methods=['POST'])
+@admin_required
+def gate_release():
+    """Verify a queue of scanned QR codes and release them all in one transaction.
+
+    Takes {"scans": [{"qr_data": ..., "spot_id": ...}, ...]} (spot_id is
+    optional) and answers with one result per scan, in order, each with the
+    amount charged if it was released.
+    """
+    data = request.get_json(silent=True) or {}
+    scans = data.get('scans')
+    if not isinstance(scans, list) or not all(
+        isinstance(scan, dict) and isinstance(scan.get('spot_id'), (int, type(None))) for scan in scans
+    ):
+        return jsonify({'success': False, 'error': 'Expected {"scans": [{"qr_data": ..., "spot_id": ...}]}'}), 400
+    if len(scans) > GATE_BATCH_LIMIT:
+        return jsonify({'success': False, 'error': f'At most {GATE_BATCH_LIMIT} scans per batch'}), 400
+
+    try:
+        results, changes, revoked = release_scans(
+            [(str(scan.get('qr_data') or ''), scan.get('spot_id')) for scan in scans]
+        )
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"Gate release error: {e}")
+        return jsonify({'success': False, 'error': 'Could not release this batch. Try again.'}), 500
+
+    revocations.remember(revoked)
+
+    for _, _, _, details in changes:
+        spot_schedules.remove(details['reservation_id'])
+    if changes:
+        publish_spot_changes(changes)
+
+    released = [result for result in results if result['success']]
+    return jsonify({
+        'success': True,
+        'released': len(released),
+        'total_amount': round(sum(result['amount'] for result in released), 2),
+        'results': results,
+    })
+
+@app.route('/admin/gate/<int:lot_id>/snapshot')
+@admin_required
+def gate_snapshot_export(lot_id):
+    """Checked-in reservations of a lot for offline scanners; ?since=<version> for a delta."""
+    try:
+        if db.session.get(ParkingLot, lot_id) is None:
+            return jsonify({'error': 'Lot not found'}), 404
+        return jsonify(gate_snapshot(lot_id, request.args.get('since', type=int)))
+    except SQLAlchemyError as e:
+        print(f"Gate snapshot error: {e}")
+        return jsonify({'error': 'Could not build the snapshot'}), 500
+
 @app.route('/admin_release/<int:reservation_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_release_spot(reservation_id):
@@ -985,10 +1203,19 @@ def admin_release_spot(reservation_id):
             try:
                 if not reservation.leaving_time:
                     reservation.leaving_time = datetime.utcnow()
-                    spot.status = 'A'
+                    # Releasing a booking that never checked in just cancels it
+                    if reservation.checked_in_at:
+                        free_spot(spot.id, spot.lot_id)
+                        log_gate_changes([(spot.lot_id, reservation.id)])
+                    amount = record_release(reservation, lot)
+                    revoked = revocations.revoke(reservation)
                     db.session.commit()
+                    revocations.remember(revoked)
+                    spot_schedules.remove(reservation.id)
+                    if reservation.checked_in_at:
+                        publish_spot_change(spot.lot_id, spot.id, 'A', reservation_id=reservation.id, amount=amount)
 
-                flash("Spot released successfully via admin scan!", "success")
+                flash("Spot released successfully via admin scan!" if reservation.checked_in_at else "Booking cancelled by admin.", "success")
                 return redirect(url_for('admin_dashboard'))
 
             except SQLAlchemyError as e:
@@ -998,13 +1225,8 @@ def admin_release_spot(reservation_id):
 
         release_time = datetime.utcnow()
         planned_start = reservation.planned_start_time or reservation.parking_time
-        
-        if release_time < planned_start:
-            total_cost = round(lot.price_per_hour * 0.25, 2)
-            time_difference = 0
-        else:
-            time_difference = (release_time - planned_start).total_seconds() / 3600
-            total_cost = round(math.ceil(time_difference) * lot.price_per_hour, 2)
+        total_cost = charge(lot.price_per_hour, planned_start, release_time)
+        time_difference = billed_hours(planned_start, release_time)
 
         return render_template(
             'admin_release.html',
@@ -1014,7 +1236,7 @@ def admin_release_spot(reservation_id):
             release_time=release_time,
             total_cost=total_cost,
             planned_start=planned_start,
-            time_difference=round(max(0, time_difference), 2)
+            time_difference=round(time_difference, 2)
         )
 
     except SQLAlchemyError as e:
@@ -1133,66 +1355,31 @@ def edit_profile_admin():
 def user_summary():
     try:
         user_id = session.get('user_id')
-        
-        reservations = (
-            db.session.query(Reservation, ParkingLot)
-            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
-            .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
-            .filter(Reservation.user_id == user_id)
-            .filter(Reservation.leaving_time.isnot(None))
-            .all()
-        )
+        include_archived = request.args.get('include_archived') == '1'
 
-        lot_times = {}
-        for res, lot in reservations:
-            planned_start = res.planned_start_time or res.parking_time
-            
-            if res.leaving_time > planned_start:
-                time_spent = (res.leaving_time - planned_start).total_seconds() / 3600
-                time_spent = max(0, time_spent)
-                
-                if time_spent > 0.01:
-                    if lot.prime_location_name in lot_times:
-                        lot_times[lot.prime_location_name] += time_spent
-                    else:
-                        lot_times[lot.prime_location_name] = time_spent
+        # One row per lot, aggregated in the database
+        lot_times = defaultdict(float)
+        for _, lot_name, _, hours, _ in lot_usage(user_id, include_archived=include_archived):
+            if hours > 0:
+                lot_times[lot_name] += hours
 
         labels = list(lot_times.keys())
         data = [round(t, 2) for t in lot_times.values()]
 
-        return render_template('user_summary.html', labels=labels, data=data)
+        return render_template('user_summary.html', labels=labels, data=data, include_archived=include_archived)
 
     except SQLAlchemyError as e:
         flash("Error loading summary", "danger")
         print(f"User summary error: {e}")
-        return render_template('user_summary.html', labels=[], data=[])
+        return render_template('user_summary.html', labels=[], data=[], include_archived=False)
 
 @app.route('/admin_summary')
 @admin_required
 def admin_summary():
     try:
-        completed_reservations = db.session.query(
-            ParkingLot.prime_location_name,
-            ParkingLot.price_per_hour,
-            Reservation.parking_time,
-            Reservation.leaving_time,
-            Reservation.planned_start_time
-        ).join(ParkingSpot, ParkingLot.id == ParkingSpot.lot_id)\
-         .join(Reservation, Reservation.spot_id == ParkingSpot.id)\
-         .filter(Reservation.leaving_time.isnot(None))\
-         .all()
-
         lot_revenue = defaultdict(float)
-        for lot_name, price_per_hour, parking_time, leaving_time, planned_start_time in completed_reservations:
-            planned_start = planned_start_time or parking_time
-            
-            if leaving_time < planned_start:
-                cost = price_per_hour * 0.25
-            else:
-                duration = (leaving_time - planned_start).total_seconds() / 3600
-                cost = math.ceil(max(0.01, duration)) * price_per_hour
-            
-            lot_revenue[lot_name] += cost
+        for lot_name, amount in revenue_by_lot():
+            lot_revenue[lot_name] += amount
 
 
         lot_names = list(lot_revenue.keys()) if lot_revenue else []
@@ -1200,20 +1387,13 @@ def admin_summary():
 
         lot_spot_counts = db.session.query(
             ParkingLot.prime_location_name,
-            ParkingSpot.status,
-            db.func.count(ParkingSpot.id)
-        ).join(ParkingLot, ParkingLot.id == ParkingSpot.lot_id)\
-        .group_by(ParkingLot.prime_location_name, ParkingSpot.status)\
-        .all()
-
-        status_labels = list(set(lot_name for lot_name, _, _ in lot_spot_counts)) if lot_spot_counts else []
-        available_counts, occupied_counts = [], []
+            ParkingLot.spots_available,
+            ParkingLot.spots_occupied
+        ).filter(ParkingLot.spots_total > 0).all()
 
-        for lot_name in status_labels:
-            available = sum(count for ln, status, count in lot_spot_counts if ln == lot_name and status == 'A')
-            occupied = sum(count for ln, status, count in lot_spot_counts if ln == lot_name and status == 'O')
-            available_counts.append(available)
-            occupied_counts.append(occupied)
+        status_labels = [lot_name for lot_name, _, _ in lot_spot_counts]
+        available_counts = [available for _, available, _ in lot_spot_counts]
+        occupied_counts = [occupied for _, _, occupied in lot_spot_counts]
 
         return render_template(
             'admin_summary.html',
@@ -1236,6 +1416,12 @@ def admin_summary():
             occupied_counts=[]
         )
 
+@app.route('/metrics')
+@admin_required
+def metrics_endpoint():
+    # Counts are per worker process; see MetricsRegistry.
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/check_availability/<int:lot_id>')
 @user_required
 def check_availability(lot_id):
@@ -1250,6 +1436,48 @@ def check_availability(lot_id):
     except Exception as e:
         return jsonify({'error': 'Could not fetch availability'}), 500
 
+@app.route('/events/availability')
+@login_required
+def availability_events():
+    """Server-Sent Events stream of lot counters, and spot changes for admins.
+
+    ?lot=<id> (repeatable) narrows the stream to those lots; admins may also
+    pass ?spot=<id> or ?spots=1 for spot status changes. Each connection
+    starts with a snapshot of the requested lots and then only receives
+    changes, so open screens cost no queries while idle.
+    """
+    is_admin = session.get('role') == 'admin'
+    lot_ids = request.args.getlist('lot', type=int)
+    spot_ids = request.args.getlist('spot', type=int) if is_admin else []
+
+    topics = [f'lot:{lot_id}' for lot_id in lot_ids] + [f'spot:{spot_id}' for spot_id in spot_ids]
+    if not lot_ids and not spot_ids:
+        topics.append('lots')
+    if is_admin and request.args.get('spots'):
+        topics.append('spots')
+
+    try:
+        snapshot = lot_snapshot(lot_ids or None) if not spot_ids or lot_ids else []
+    except SQLAlchemyError as e:
+        print(f"Availability stream error: {e}")
+        return jsonify({'error': 'Could not fetch availability'}), 500
+
+    subscription = event_bus.subscribe(topics)
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            for event in snapshot:
+                yield format_sse(event)
+            while True:
+                event = subscription.get(timeout=KEEPALIVE_SECONDS)
+                yield format_sse(event) if event else ": keepalive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/user_active_reservation')
 @user_required
 def user_active_reservation():
@@ -1265,8 +1493,9 @@ def user_active_reservation():
         if active_reservation:
             res, spot, lot = active_reservation
             current_time = datetime.utcnow()
-            duration = (current_time - res.parking_time).total_seconds() / 3600
-            cost = round(math.ceil(duration) * lot.price_per_hour, 2)
+            planned_start = res.planned_start_time or res.parking_time
+            duration = billed_hours(planned_start, current_time)
+            cost = charge(lot.price_per_hour, planned_start, current_time)
 
             return render_template('active_reservation.html',
                                  reservation=res,
@@ -1292,22 +1521,27 @@ def reservation_history(user_id):
             return redirect(url_for('user_dashboard'))
 
         user = User.query.get_or_404(user_id)
-        reservations = db.session.query(Reservation, ParkingSpot, ParkingLot)\
-            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)\
-            .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)\
-            .filter(Reservation.user_id == user_id)\
-            .order_by(Reservation.parking_time.desc())\
-            .all()
+        include_archived = request.args.get('include_archived') == '1'
+        models = (Reservation, ArchivedReservation) if include_archived else (Reservation,)
+        sources = [
+            (db.session.query(model, ParkingSpot, ParkingLot)
+                .join(ParkingSpot, model.spot_id == ParkingSpot.id)
+                .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+                .filter(model.user_id == user_id),
+             (model.parking_time, model.id))
+            for model in models
+        ]
+        reservations = keyset_page(sources, key=lambda row: (row[0].parking_time, row[0].id),
+                                   cursor=request.args.get('cursor'), descending=True)
 
         reservation_data = []
-        total_spent = 0
+        # Over the whole history, not just this page
+        total_spent = sum(revenue for *_, revenue in lot_usage(user_id, include_archived=include_archived))
 
         for res, spot, lot in reservations:
             cost = 0
             if res.leaving_time:
-                duration = (res.leaving_time - res.parking_time).total_seconds() / 3600
-                cost = round(math.ceil(duration) * lot.price_per_hour, 2)
-                total_spent += cost
+                cost = reservation_charge(res, lot.price_per_hour)
 
             reservation_data.append({
                 'reservation': res,
@@ -1319,7 +1553,9 @@ def reservation_history(user_id):
         return render_template('reservation_history.html',
                              user=user,
                              reservation_data=reservation_data,
-                             total_spent=round(total_spent, 2))
+                             page=reservations,
+                             total_spent=round(total_spent, 2),
+                             include_archived=include_archived)
 
     except SQLAlchemyError as e:
         flash("Error loading reservation history", "danger")
@@ -1348,32 +1584,116 @@ def forbidden_error(error):
     flash("Access forbidden", 'danger')
     return redirect(url_for('home'))
 
+@app.cli.command('reconcile-counters')
+@click.option('--dry-run', is_flag=True, help='Report drift without repairing it.')
+def reconcile_counters_command(dry_run):
+    """Detect and repair drift in the per-lot spot counters."""
+    drift = reconcile_lot_counters(fix=not dry_run)
+    if not drift:
+        click.echo("✅ All lot counters match the spot table.")
+        return
+
+    for lot_id, stored, actual in drift:
+        click.echo(f"Lot {lot_id}: stored (total, available, occupied)={stored} actual={actual}")
+    click.echo(f"{'Found' if dry_run else 'Repaired'} drift in {len(drift)} lot(s).")
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='List pending migrations without applying them.')
+def migrate_command(status):
+    """Apply pending schema migrations."""
+    if status:
+        pending = pending_migrations()
+        for version, name in pending:
+            click.echo(f"Pending migration {version}: {name}")
+        click.echo(f"{len(pending)} pending migration(s).")
+        return
+
+    applied = migrate(log=click.echo)
+    click.echo(f"✅ Database schema up to date ({len(applied)} migration(s) applied).")
+
+@app.cli.command('backfill-revenue')
+@click.option('--batch-size', default=5000, show_default=True, help='Reservations per transaction.')
+def backfill_revenue_command(batch_size):
+    """Populate the revenue ledger from completed reservations."""
+    written = backfill_revenue(batch_size=batch_size, log=click.echo)
+    click.echo(f"✅ Revenue ledger backfilled with {written} new entr{'y' if written == 1 else 'ies'}.")
+
+@app.cli.command('archive-reservations')
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True, envvar='ARCHIVE_AFTER_DAYS',
+              help='Archive completed reservations that ended longer ago than this.')
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help='Reservations per transaction.')
+def archive_reservations_command(older_than_days, batch_size):
+    """Move old completed reservations into the archive table. Run it on a schedule."""
+    moved = archive_reservations(older_than_days=older_than_days, batch_size=batch_size, log=click.echo)
+    click.echo(f"✅ Archived {moved} reservation{'' if moved == 1 else 's'} older than {older_than_days} days.")
+
+@app.cli.command('send-emails')
+@click.option('--once', is_flag=True, help='Drain what is due now and exit instead of polling.')
+@click.option('--poll-interval', default=2.0, show_default=True, help='Seconds to sleep when the outbox is empty.')
+@click.option('--batch-size', default=50, show_default=True)
+def send_emails_command(once, poll_interval, batch_size):
+    """Deliver queued emails from the outbox, retrying failures with backoff."""
+    click.echo("📨 Outbox worker started")
+    run_worker(poll_interval=poll_interval, batch_size=batch_size, once=once, log=click.echo)
+
+@app.cli.command('seed-data')
+@click.option('--users', default=100000, show_default=True)
+@click.option('--lots', default=1000, show_default=True)
+@click.option('--spots', default=200000, show_default=True, help='Total spots, spread evenly over the lots.')
+@click.option('--reservations', default=5000000, show_default=True, help='Total reservations, active ones included.')
+@click.option('--occupancy', default=0.3, show_default=True, help='Fraction of spots held by an active reservation (at most one per user).')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per INSERT batch.')
+@click.option('--seed', default=42, show_default=True, help='Random seed, for repeatable data sets.')
+@click.option('--skip-revenue', is_flag=True, help='Do not backfill the revenue ledger afterwards.')
+def seed_data_command(users, lots, spots, reservations, occupancy, batch_size, seed, skip_revenue):
+    """Bulk-load synthetic users, lots, spots and reservations for load testing."""
+    try:
+        counts = seed_data(users=users, lots=lots, spots=spots, reservations=reservations,
+                           occupancy=occupancy, batch_size=batch_size, seed=seed, log=click.echo)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    if not skip_revenue:
+        backfill_revenue(batch_size=batch_size, log=click.echo)
+    click.echo(f"✅ Seeded {counts['users']} users, {counts['lots']} lots, {counts['spots']} spots and "
+               f"{counts['reservations']} reservations ({counts['active']} active).")
+
+def init_db(log=print):
+    """Create or migrate the schema and the default admin; returns the migrations applied.
+
+    A one-shot deploy step (`flask init-db`), run before the workers start
+    rather than by each of them. Needs an app context.
+    """
+    applied = migrate(log=log)
+    if create_default_admin():
+        log(f"✅ Default admin created: {DEFAULT_ADMIN_EMAIL}")
+    return applied
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or migrate the schema and the default admin. Run once per deploy."""
+    applied = init_db(log=click.echo)
+    click.echo(f"✅ Database schema up to date ({len(applied)} migration(s) applied).")
+
+
+# `gunicorn app:app`, `flask run` and the CLI commands all use this module's
+# app; `gunicorn 'app:create_app()'` gets the same one
+create_app()
+
+
 if __name__ == '__main__':
     with app.app_context():
         try:
-            # Create all tables
-            db.create_all()
-            print("✅ Database tables created successfully!")
-
-            if not User.query.filter_by(role='admin').first():
-                hashed_pw = generate_password_hash("admin123")
-                admin = User(
-                    email="admin@parkease.com",
-                    password=hashed_pw,
-                    fullname="Administrator",
-                    address="Admin Office",
-                    pincode="000000",
-                    role="admin"
-                )
-
-                db.session.add(admin)
-                db.session.commit()
+            migrate()
+            print("✅ Database schema up to date!")
+
+            if create_default_admin():
                 print("✅ Default admin created!")
-                print("📧 Email: admin@parkease.com")
-                print("🔑 Password: admin123")
+                print(f"📧 Email: {DEFAULT_ADMIN_EMAIL}")
+                print(f"🔑 Password: {DEFAULT_ADMIN_PASSWORD}")
 
         except SQLAlchemyError as e:
             print(f"❌ Database initialization error: {e}")
             
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,139 @@
+"""Per-lot usage and revenue aggregates: in Python vs GROUP BY in the database.
+
+For each history size, seeds a fresh database and computes hours parked and
+revenue per lot two ways: the old way (fetch every completed reservation and
+add them up in Python, pricing each with utils.pricing.charge) and
+utils.billing.lot_usage() (one row per lot from the database). Both are run
+over all users (a report) and for the single busiest user (the user summary
+page). Reports rows fetched and latency, and checks that the two ways agree.
+Also times the revenue ledger backfill at each size and checks its daily
+rollups against the entries. Run from the project root:
+
+    python -m benchmarks.bench_aggregates --sizes 10000,100000,500000
+    python -m benchmarks.bench_aggregates --database-url postgresql://...
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+from sqlalchemy import select, func
+
+from benchmarks.bench_booking import build_app
+from models.models import db, ParkingLot, ParkingSpot, Reservation, RevenueEntry, RevenueRollup
+from utils.billing import lot_usage, MIN_USAGE_HOURS
+from utils.ledger import backfill_revenue
+from utils.pricing import charge, billed_hours
+from utils.seed import seed_data
+
+
+def python_usage(user_id=None):
+    """The per-row approach the summary pages used before: (rows fetched, {lot_id: (hours, revenue)})."""
+    query = (
+        select(Reservation.parking_time, Reservation.planned_start_time, Reservation.leaving_time,
+               ParkingLot.id, ParkingLot.price_per_hour)
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+        .where(Reservation.leaving_time.isnot(None))
+    )
+    if user_id is not None:
+        query = query.where(Reservation.user_id == user_id)
+    rows = db.session.execute(query).all()
+
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for parking_time, planned_start_time, leaving_time, lot_id, price_per_hour in rows:
+        planned_start = planned_start_time or parking_time
+        hours = billed_hours(planned_start, leaving_time)
+        if hours > MIN_USAGE_HOURS:
+            totals[lot_id][0] += hours
+        totals[lot_id][1] += charge(price_per_hour, planned_start, leaving_time)
+    return len(rows), {lot_id: (hours, round(revenue, 2)) for lot_id, (hours, revenue) in totals.items()}
+
+
+def sql_usage(user_id=None):
+    rows = lot_usage(user_id)
+    return len(rows), {lot_id: (hours, revenue) for lot_id, _, _, hours, revenue in rows}
+
+
+def disagreements(expected, actual):
+    bad = []
+    for lot_id in expected.keys() | actual.keys():
+        hours_a, revenue_a = expected.get(lot_id, (0.0, 0.0))
+        hours_b, revenue_b = actual.get(lot_id, (0.0, 0.0))
+        # julianday() resolves to about a millisecond on SQLite, and SQL sums
+        # the charges before rounding to the paisa
+        if abs(hours_a - hours_b) > 1e-4 * max(1.0, hours_a) or abs(revenue_a - revenue_b) > 0.01 + 1e-9 * revenue_a:
+            bad.append((lot_id, expected.get(lot_id), actual.get(lot_id)))
+    return bad
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        db.session.rollback()
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,50000,200000', help='Comma-separated reservation counts.')
+    parser.add_argument('--lots', type=int, default=200)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    failures = 0
+    print(f"{'history':>9} {'scope':<9} {'method':<7} {'rows':>8} {'ms':>9}")
+
+    with app.app_context():
+        for size in [int(s) for s in args.sizes.split(',')]:
+            db.drop_all()
+            db.create_all()
+            seed_data(users=args.users, lots=args.lots, spots=args.lots * 20, reservations=size,
+                      log=lambda message: None)
+            busiest = db.session.execute(
+                select(Reservation.user_id).group_by(Reservation.user_id)
+                .order_by(func.count(Reservation.id).desc()).limit(1)
+            ).scalar()
+
+            for scope, user_id in (('all', None), ('one user', busiest)):
+                python_ms, (python_rows, expected) = timed(python_usage, user_id)
+                sql_ms, (sql_rows, actual) = timed(sql_usage, user_id)
+                print(f"{size:>9} {scope:<9} {'python':<7} {python_rows:>8} {python_ms:>9.1f}")
+                print(f"{size:>9} {scope:<9} {'sql':<7} {sql_rows:>8} {sql_ms:>9.1f}")
+                bad = disagreements(expected, actual)
+                for lot_id, a, b in bad[:5]:
+                    print(f"  lot {lot_id}: python {a} vs sql {b}")
+                failures += len(bad)
+
+            started = time.perf_counter()
+            written = backfill_revenue(log=lambda message: None)
+            backfill_s = time.perf_counter() - started
+            entries = db.session.execute(select(func.count(RevenueEntry.id), func.sum(RevenueEntry.amount))).one()
+            rollups = db.session.execute(select(func.sum(RevenueRollup.reservations), func.sum(RevenueRollup.amount))).one()
+            consistent = entries[0] == rollups[0] and abs((entries[1] or 0) - (rollups[1] or 0)) < 0.01
+            failures += 0 if consistent else 1
+            print(f"{size:>9} ledger backfill: {written} entries in {backfill_s:.2f}s, "
+                  f"rollups {'match' if consistent else 'DO NOT match'} entries")
+
+    if tmp_path:
+        os.remove(tmp_path)
+    print(f"disagreements: {failures}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
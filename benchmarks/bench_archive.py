@@ -0,0 +1,122 @@
+"""Archiving old reservations: what it moves, what it costs and what it changes.
+
+Seeds a history, then runs utils.archive.archive_reservations() and checks
+that nothing is lost: per-lot usage with include_archived gives the same
+answer as before archiving, and a revenue ledger backfilled afterwards has
+an entry for every completed reservation. Times the archiver, and the
+per-lot usage queries (one user's summary, the report over all users) before
+archiving, after it, and after it with the archive unioned back in. Exits
+non-zero if the two sides disagree. Run from the project root:
+
+    python -m benchmarks.bench_archive --reservations 500000
+    python -m benchmarks.bench_archive --database-url postgresql://...
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import select, func
+
+from benchmarks.bench_booking import build_app
+from models.models import db, Reservation, ArchivedReservation, RevenueEntry
+from utils.archive import archive_reservations, ARCHIVE_AFTER_DAYS
+from utils.billing import lot_usage
+from utils.ledger import backfill_revenue
+from utils.seed import seed_data
+
+
+def timed(fn, *args, repeat=3, **kwargs):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        db.session.rollback()
+    return best * 1000, result
+
+
+def counts():
+    live = db.session.execute(select(func.count(Reservation.id))).scalar()
+    archived = db.session.execute(select(func.count(ArchivedReservation.id))).scalar()
+    return live, archived
+
+
+def same_usage(before, after):
+    if [row[:3] for row in before] != [row[:3] for row in after]:
+        return False
+    return all(abs(a[3] - b[3]) < 1e-6 * max(1.0, a[3]) and abs(a[4] - b[4]) < 0.005
+               for a, b in zip(before, after))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=200000)
+    parser.add_argument('--lots', type=int, default=200)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    failures = 0
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_data(users=args.users, lots=args.lots, spots=args.lots * 20, reservations=args.reservations,
+                  log=lambda message: None)
+        db.session.commit()
+        busiest = db.session.execute(
+            select(Reservation.user_id).group_by(Reservation.user_id)
+            .order_by(func.count(Reservation.id).desc()).limit(1)
+        ).scalar()
+
+        queries = [
+            ('one user', lambda: lot_usage(busiest)),
+            ('all users', lambda: lot_usage()),
+        ]
+        before = {name: timed(fn) for name, fn in queries}
+
+        started = time.perf_counter()
+        moved = archive_reservations(older_than_days=args.older_than_days, log=lambda message: None)
+        archive_s = time.perf_counter() - started
+        live, archived = counts()
+        print(f"archived {moved} of {live + archived} reservations older than {args.older_than_days} days "
+              f"in {archive_s:.2f}s; {live} left live ({db.engine.dialect.name})")
+
+        print(f"{'query':<10} {'before ms':>10} {'live ms':>10} {'+archive ms':>12}  same answer")
+        for name, fn in queries:
+            before_ms, expected = before[name]
+            live_ms, _ = timed(fn)
+            user_id = busiest if name == 'one user' else None
+            union_ms, actual = timed(lot_usage, user_id, include_archived=True)
+            ok = same_usage(expected, actual)
+            failures += 0 if ok else 1
+            print(f"{name:<10} {before_ms:>10.1f} {live_ms:>10.1f} {union_ms:>12.1f}  {'yes' if ok else 'NO'}")
+
+        written = backfill_revenue(log=lambda message: None)
+        completed = db.session.execute(
+            select(func.count(Reservation.id)).where(Reservation.leaving_time.isnot(None))
+        ).scalar() + archived
+        entries = db.session.execute(select(func.count(RevenueEntry.id))).scalar()
+        ok = entries == completed
+        failures += 0 if ok else 1
+        print(f"ledger backfill: {written} entries for {completed} completed reservations "
+              f"({'complete' if ok else 'INCOMPLETE'})")
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,282 @@
+"""Concurrent booking benchmark.
+
+Hammers reserve_spot() from many threads the way book_spot does, mixing
+bookings that check in straight away (occupy=True) with bookings ahead
+(occupy=False), all for overlapping windows, until every lot is full. Then
+half the threads check the ahead bookings in with check_in_reservation()
+while the other half keep trying to book each lot for right now. Last,
+one parked car per lot leaves without this worker's index hearing of it,
+and each lot is booked once more. Fails
+unless:
+- no spot holds two open reservations;
+- every check-in lands on its own booked spot;
+- no booking lands once the lots are full;
+- a spot released behind this worker's interval index (as another worker
+  would) is booked again rather than the lot reported full;
+- occupied spots match checked-in reservations and the lot counters.
+Run from the project root:
+
+    python -m benchmarks.bench_booking --lots 4 --spots 250 --threads 16
+    python -m benchmarks.bench_booking --database-url postgresql://...
+"""
+import argparse
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, select
+
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from utils.intervals import spot_schedules
+from utils.inventory import reserve_spot, check_in_reservation, free_spot, reconcile_lot_counters
+
+
+def build_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 32, 'max_overflow': 32}
+    db.init_app(app)
+    return app
+
+
+def seed(lots, spots_per_lot, users):
+    db.drop_all()
+    db.create_all()
+
+    db.session.add_all([
+        User(email=f'bench{i}@parkease.test', password='x', fullname=f'Bench {i}',
+             address='Bench Street', pincode='000000')
+        for i in range(users)
+    ])
+    lot_objs = [
+        ParkingLot(prime_location_name=f'Bench Lot {i}', address='Bench Street',
+                   pin_code='000000', price_per_hour=10,
+                   spots_total=spots_per_lot, spots_available=spots_per_lot)
+        for i in range(lots)
+    ]
+    db.session.add_all(lot_objs)
+    db.session.flush()
+
+    for lot in lot_objs:
+        db.session.add_all([ParkingSpot(lot_id=lot.id, status='A') for _ in range(spots_per_lot)])
+    db.session.commit()
+
+    user_ids = [u.id for u in User.query.all()]
+    lot_ids = [lot.id for lot in lot_objs]
+    return user_ids, lot_ids
+
+
+def book(lot_id, user_id, start, end, occupy):
+    """book_spot's allocation: reserve_spot(), then the reservation, in one transaction."""
+    spot_id = reserve_spot(lot_id, start, end, occupy=occupy)
+    if spot_id is None:
+        db.session.rollback()
+        return None
+    reservation = Reservation(spot_id=spot_id, user_id=user_id, vehicle_number='BENCH', parking_time=start,
+                              planned_start_time=start, planned_end_time=end,
+                              checked_in_at=datetime.utcnow() if occupy else None)
+    db.session.add(reservation)
+    db.session.commit()
+    spot_schedules.add(lot_id, spot_id, reservation.id, start, end)
+    return reservation.id
+
+
+def fill(app, lot_ids, user_ids, windows, now_share, stats, errors):
+    rng = random.Random()
+    open_lots = list(lot_ids)
+
+    with app.app_context():
+        while open_lots:
+            lot_id = rng.choice(open_lots)
+            occupy = rng.random() < now_share
+            start, end = windows['now' if occupy else 'ahead']
+            started = time.perf_counter()
+            try:
+                if book(lot_id, rng.choice(user_ids), start, end, occupy) is None:
+                    open_lots.remove(lot_id)
+                    continue
+                stats['book now' if occupy else 'book ahead'].append(time.perf_counter() - started)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(f'{type(e).__name__}: {e}')
+        db.session.remove()
+
+
+def check_in_all(app, pending, stats, moved, failed, errors):
+    with app.app_context():
+        while True:
+            try:
+                reservation_id = pending.get_nowait()
+            except queue.Empty:
+                break
+            started = time.perf_counter()
+            try:
+                reservation = db.session.get(Reservation, reservation_id)
+                booked_spot_id = reservation.spot_id
+                lot_id = db.session.execute(
+                    select(ParkingSpot.lot_id).where(ParkingSpot.id == booked_spot_id)
+                ).scalar()
+                spot_id = check_in_reservation(reservation, lot_id, datetime.now())
+                if spot_id is None:
+                    db.session.rollback()
+                    failed.append(reservation_id)
+                    continue
+                db.session.commit()
+                if spot_id != booked_spot_id:
+                    moved.append(reservation_id)
+                stats['check in'].append(time.perf_counter() - started)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(f'{type(e).__name__}: {e}')
+        db.session.remove()
+
+
+def book_full_lots(app, lot_ids, user_ids, window, done, landed, errors):
+    rng = random.Random()
+    with app.app_context():
+        while not done.is_set():
+            try:
+                reservation_id = book(rng.choice(lot_ids), rng.choice(user_ids), *window, occupy=True)
+                if reservation_id is not None:
+                    landed.append(reservation_id)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(f'{type(e).__name__}: {e}')
+        db.session.remove()
+
+
+def run_threads(threads):
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lots', type=int, default=4)
+    parser.add_argument('--spots', type=int, default=250, help='spots per lot')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--now-share', type=float, default=0.5, help='Share of bookings that check in at once.')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    with app.app_context():
+        user_ids, lot_ids = seed(args.lots, args.spots, max(args.threads, 1))
+    spot_schedules.invalidate()
+
+    # Every window overlaps every other, so each spot can take one booking
+    now = datetime.now().replace(microsecond=0)
+    windows = {'now': (now, now + timedelta(hours=2)),
+               'ahead': (now + timedelta(minutes=10), now + timedelta(hours=2, minutes=10))}
+    stats = defaultdict(list)
+    errors = []
+    fill_s = run_threads([
+        threading.Thread(target=fill, args=(app, lot_ids, user_ids, windows, args.now_share, stats, errors))
+        for _ in range(args.threads)
+    ])
+
+    with app.app_context():
+        ahead = db.session.execute(
+            select(Reservation.id).where(Reservation.checked_in_at.is_(None))
+        ).scalars().all()
+    pending = queue.Queue()
+    for reservation_id in ahead:
+        pending.put(reservation_id)
+    moved, failed, landed = [], [], []
+    done = threading.Event()
+    checkers = [threading.Thread(target=check_in_all, args=(app, pending, stats, moved, failed, errors))
+                for _ in range(max(args.threads // 2, 1))]
+    bookers = [threading.Thread(target=book_full_lots,
+                                args=(app, lot_ids, user_ids, windows['now'], done, landed, errors))
+               for _ in range(max(args.threads // 2, 1))]
+    for t in bookers:
+        t.start()
+    check_in_s = run_threads(checkers)
+    done.set()
+    for t in bookers:
+        t.join()
+
+    # Released through another worker: the database changes, this worker's index does not
+    missed = []
+    with app.app_context():
+        for lot_id in lot_ids:
+            reservation = db.session.execute(
+                select(Reservation).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+                .where(ParkingSpot.lot_id == lot_id, Reservation.leaving_time.is_(None))
+                .order_by(Reservation.id).limit(1)
+            ).scalar()
+            reservation.leaving_time = datetime.now()
+            free_spot(reservation.spot_id, lot_id)
+            db.session.commit()
+        for lot_id in lot_ids:
+            if book(lot_id, user_ids[0], *windows['now'], occupy=True) is None:
+                missed.append(lot_id)
+        db.session.remove()
+
+    with app.app_context():
+        per_spot = Counter(db.session.execute(
+            select(Reservation.spot_id).where(Reservation.leaving_time.is_(None))
+        ).scalars())
+        double_allocated = {spot_id: n for spot_id, n in per_spot.items() if n > 1}
+        occupied = db.session.execute(
+            select(func.count(ParkingSpot.id)).where(ParkingSpot.status == 'O')
+        ).scalar()
+        checked_in = db.session.execute(
+            select(func.count(Reservation.id))
+            .where(Reservation.checked_in_at.isnot(None), Reservation.leaving_time.is_(None))
+        ).scalar()
+        drift = reconcile_lot_counters(fix=False)
+
+    print(f"lots={args.lots} spots/lot={args.spots} threads={args.threads} now-share={args.now_share}")
+    print(f"{'step':<12} {'count':>7} {'per s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for step, elapsed in (('book now', fill_s), ('book ahead', fill_s), ('check in', check_in_s)):
+        samples = sorted(stats[step])
+        if not samples:
+            print(f"{step:<12} {0:>7}")
+            continue
+        print(f"{step:<12} {len(samples):>7} {len(samples) / elapsed:>9.1f} {percentile(samples, 0.5):>8.2f} "
+              f"{percentile(samples, 0.99):>8.2f}")
+
+    print(f"open reservations:  {sum(per_spot.values())} on {args.lots * args.spots} spots")
+    print(f"double allocations: {len(double_allocated)}")
+    print(f"check-ins moved:    {len(moved)}, failed: {len(failed)}")
+    print(f"booked when full:   {len(landed)}")
+    print(f"lots refused after a release elsewhere: {len(missed)} of {len(lot_ids)}")
+    print(f"occupied spots:     {occupied} (checked in: {checked_in}), drifted lots: {len(drift)}")
+    if errors:
+        print(f"errors:             {len(errors)} (first: {errors[0]})")
+
+    if tmp_path:
+        os.remove(tmp_path)
+
+    return 1 if (double_allocated or moved or failed or landed or missed or occupied != checked_in or drift
+                 or errors) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
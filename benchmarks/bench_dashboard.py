@@ -0,0 +1,146 @@
+"""Admin dashboard with and without the lot card fragment cache.
+
+Seeds lots with many spots, then times GET /admin_dashboard with the cache
+disabled, warm in the in-process LRU, and warm in a shared RESP cache (the
+local stand-in from benchmarks.resp_standin, or --cache-url). It also times
+the request right after one lot changes, which re-renders only that lot.
+Every cached page must match a page rendered without the cache. Run from
+the project root:
+
+    python -m benchmarks.bench_dashboard --lots 200 --spots 500
+    python -m benchmarks.bench_dashboard --cache-url redis://localhost:6379/0
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event, select, update
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lots', type=int, default=200)
+    parser.add_argument('--spots', type=int, default=500, help='Spots per lot.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cache-url', default=None, help='Shared cache to use instead of the local stand-in.')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from benchmarks.resp_standin import StandinRESPServer
+    from models.models import db, User, ParkingLot, ParkingSpot
+    from utils.cache import fragment_cache, LRUCache, RedisCache
+    from utils.inventory import add_spots, adjust_lot_counters
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    rng = random.Random(7)
+    with app.app_context():
+        for i in range(args.lots):
+            lot = ParkingLot(prime_location_name=f'Dashboard Lot {i}', address='Bench Street', pin_code='000000',
+                             price_per_hour=10)
+            db.session.add(lot)
+            db.session.flush()
+            add_spots(lot.id, args.spots)
+            occupied = db.session.execute(
+                select(ParkingSpot.id).where(ParkingSpot.lot_id == lot.id).limit(rng.randint(0, args.spots))
+            ).scalars().all()
+            if occupied:
+                db.session.execute(update(ParkingSpot).where(ParkingSpot.id.in_(occupied)).values(status='O'))
+                adjust_lot_counters(lot.id, available=-len(occupied), occupied=len(occupied))
+        db.session.commit()
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+        lot_ids = db.session.execute(select(ParkingLot.id)).scalars().all()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id
+        sess['role'] = 'admin'
+        sess['user_name'] = 'Bench'
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    def get():
+        statements.clear()
+        started = time.perf_counter()
+        response = client.get('/admin_dashboard')
+        elapsed = (time.perf_counter() - started) * 1000
+        assert response.status_code == 200, response.status_code
+        return elapsed, len(statements), response.data
+
+    def best(repeat):
+        runs = [get() for _ in range(repeat)]
+        return min(run[0] for run in runs), runs[-1][1], runs[-1][2]
+
+    def change_one_lot():
+        with app.app_context():
+            lot_id = rng.choice(lot_ids)
+            spot = db.session.execute(
+                select(ParkingSpot.id, ParkingSpot.status).where(ParkingSpot.lot_id == lot_id).limit(1)
+            ).one()
+            flipped = 'A' if spot.status == 'O' else 'O'
+            db.session.execute(update(ParkingSpot).where(ParkingSpot.id == spot.id).values(status=flipped))
+            delta = 1 if flipped == 'O' else -1
+            adjust_lot_counters(lot_id, available=-delta, occupied=delta)
+            db.session.commit()
+
+    def uncached_page():
+        backend = fragment_cache.backend
+        fragment_cache.backend = LRUCache(max_bytes=0)
+        try:
+            return get()[2]
+        finally:
+            fragment_cache.backend = backend
+
+    standin = None
+    if args.cache_url:
+        shared = RedisCache.from_url(args.cache_url)
+    else:
+        standin = StandinRESPServer().start()
+        shared = RedisCache.from_url(standin.url)
+
+    failures = 0
+    print(f"{args.lots} lots x {args.spots} spots")
+    print(f"{'cache':<24} {'ms':>9} {'statements':>10} {'KB':>8}  same page")
+
+    fragment_cache.backend = LRUCache(max_bytes=0)
+    ms, count, page = best(args.repeat)
+    print(f"{'none':<24} {ms:>9.1f} {count:>10} {len(page) / 1024:>8.0f}  -")
+
+    for name, backend in (('in-process LRU', LRUCache()), ('shared (RESP)', shared)):
+        fragment_cache.backend = backend
+        ms, count, page = get()
+        print(f"{name + ', cold':<24} {ms:>9.1f} {count:>10} {len(page) / 1024:>8.0f}  -")
+        ms, count, page = best(args.repeat)
+        same = page == uncached_page()
+        failures += 0 if same else 1
+        print(f"{name + ', warm':<24} {ms:>9.1f} {count:>10} {len(page) / 1024:>8.0f}  {'yes' if same else 'NO'}")
+        change_one_lot()
+        ms, count, page = get()
+        same = page == uncached_page()
+        failures += 0 if same else 1
+        print(f"{name + ', 1 lot changed':<24} {ms:>9.1f} {count:>10} {len(page) / 1024:>8.0f}  {'yes' if same else 'NO'}")
+
+    if standin:
+        standin.shutdown()
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Deleting a lot with a long reservation history, and what it does to other writers.
+
+Seeds one lot with many completed reservations and deletes it the way
+delete_lot does: either the old way (one ORM delete per reservation and per
+spot, in one transaction) or through close_spots(),
+purge_completed_reservations() and delete_spots(). Meanwhile a writer thread
+keeps committing small updates to another lot and records how long each one
+waits, which is how long bookings elsewhere would stall. Once the lot is
+closed it also tries to book it, and fails the run if a booking lands.
+Run from the project root:
+
+    python -m benchmarks.bench_delete_lot --reservations 1000000
+    python -m benchmarks.bench_delete_lot --method orm --reservations 50000
+    python -m benchmarks.bench_delete_lot --database-url postgresql://...
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func
+
+from benchmarks.bench_booking import build_app
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from utils.inventory import (close_spots, purge_completed_reservations, delete_spots, reserve_spot, PURGE_CHUNK_SIZE,
+                             PURGE_PAUSE_SECONDS)
+
+
+def seed(spots, reservations):
+    db.drop_all()
+    db.create_all()
+    user = User(email='history@parkease.test', password='x', fullname='History', address='Bench Street', pincode='000000')
+    lots = [ParkingLot(prime_location_name=name, address='Bench Street', pin_code='000000', price_per_hour=10,
+                       spots_total=spots, spots_available=spots) for name in ('Doomed Lot', 'Busy Lot')]
+    db.session.add(user)
+    db.session.add_all(lots)
+    db.session.flush()
+    for lot in lots:
+        db.session.execute(ParkingSpot.__table__.insert(), [{'lot_id': lot.id, 'status': 'A'} for _ in range(spots)])
+    doomed_spots = db.session.execute(select(ParkingSpot.id).where(ParkingSpot.lot_id == lots[0].id)).scalars().all()
+
+    start = datetime.utcnow() - timedelta(days=365)
+    batch = []
+    for i in range(reservations):
+        t = start + timedelta(minutes=i % 500000)
+        batch.append({'spot_id': doomed_spots[i % spots], 'user_id': user.id, 'vehicle_number': 'HIST',
+                      'parking_time': t, 'planned_start_time': t, 'leaving_time': t + timedelta(hours=1)})
+        if len(batch) == 20000:
+            db.session.execute(Reservation.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Reservation.__table__.insert(), batch)
+    db.session.commit()
+    return lots[0].id, lots[1].id
+
+
+def delete_orm(lot_id):
+    lot = db.session.get(ParkingLot, lot_id)
+    for spot in lot.spots:
+        for res in Reservation.query.filter_by(spot_id=spot.id).all():
+            db.session.delete(res)
+        db.session.delete(spot)
+    db.session.delete(lot)
+    db.session.commit()
+
+
+def delete_bulk(lot_id, chunk_size, pause, closed):
+    if not close_spots(lot_id):
+        raise RuntimeError('lot unexpectedly busy')
+    db.session.commit()
+    closed.set()
+    purge_completed_reservations(select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id), chunk_size, pause)
+    if not delete_spots(lot_id):
+        raise RuntimeError('spots added to the lot meanwhile')
+    db.session.execute(delete(ParkingLot).where(ParkingLot.id == lot_id))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=1000000)
+    parser.add_argument('--spots', type=int, default=2000)
+    parser.add_argument('--method', choices=['bulk', 'orm'], default='bulk')
+    parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE)
+    parser.add_argument('--pause', type=float, default=PURGE_PAUSE_SECONDS, help='Seconds between chunks.')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    with app.app_context():
+        started = time.perf_counter()
+        doomed_id, busy_id = seed(args.spots, args.reservations)
+        print(f"seeded {args.reservations} reservations on {args.spots} spots in "
+              f"{time.perf_counter() - started:.1f}s ({db.engine.dialect.name})")
+
+    stop = threading.Event()
+    closed = threading.Event()
+    waits = []
+    attempts = []
+    landed = []
+
+    def writer():
+        with app.app_context():
+            while not stop.is_set():
+                started = time.perf_counter()
+                db.session.execute(
+                    update(ParkingLot).where(ParkingLot.id == busy_id)
+                    .values(spots_available=ParkingLot.spots_available)
+                )
+                db.session.commit()
+                waits.append(time.perf_counter() - started)
+                if closed.is_set():
+                    now = datetime.utcnow()
+                    spot_id = reserve_spot(doomed_id, now, now + timedelta(hours=1), occupy=len(attempts) % 2 == 0)
+                    attempts.append(spot_id)
+                    if spot_id:
+                        landed.append(spot_id)
+                    db.session.rollback()
+                time.sleep(0.005)
+            db.session.remove()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+
+    with app.app_context():
+        started = time.perf_counter()
+        if args.method == 'orm':
+            delete_orm(doomed_id)
+        else:
+            delete_bulk(doomed_id, args.chunk_size, args.pause, closed)
+        elapsed = time.perf_counter() - started
+
+        left = db.session.execute(
+            select(func.count(Reservation.id)).join(ParkingSpot).where(ParkingSpot.lot_id == doomed_id)
+        ).scalar() + db.session.execute(
+            select(func.count(ParkingSpot.id)).where(ParkingSpot.lot_id == doomed_id)
+        ).scalar()
+
+    stop.set()
+    thread.join()
+
+    print(f"{args.method}: deleted the lot in {elapsed:.2f}s; rows left behind: {left}")
+    if waits:
+        print(f"concurrent writer: {len(waits)} commits, median wait {statistics.median(waits) * 1000:.1f} ms, "
+              f"max wait {max(waits) * 1000:.1f} ms")
+    if args.method == 'bulk':
+        print(f"bookings tried on the closed lot: {len(attempts)}, landed: {len(landed)}")
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if left or landed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""Gate exits: one car at a time through the scan page vs the batch endpoint.
+
+Seeds checked-in reservations across a few lots, releases half of them the
+way scan_release.html does (POST /verify_qr, GET /admin_release/<id>, POST
+/admin_release/<id>) and the other half through POST /admin/gate/release
+in batches. Prints cars per second and statements per car for each, then
+fails unless every car was released, charged the same as the single path
+would charge, revoked, and left the lot counters in step with the spots.
+Repeated, released and never-checked-in codes must be refused, and
+/verify_qr must refuse a released code straight away, not only after the
+worker next refreshes its revocations. Run from the project root:
+
+    python -m benchmarks.bench_gate --cars 2000 --batch 100
+    python -m benchmarks.bench_gate --database-url postgresql://...
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, func
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--lots', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, ParkingSpot, Reservation, RevenueEntry, RevokedQRToken
+    from utils.inventory import add_spots, adjust_lot_counters, reconcile_lot_counters
+    from utils.pricing import reservation_charge
+    from utils.qrtoken import issue_token, revocations
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    # No refresh during the run, so only what the releasing worker remembers refuses a code
+    revocations.REFRESH_SECONDS = 3600
+    now = datetime.now()
+    cars_per_lot = args.cars // args.lots
+    with app.app_context():
+        user = User(email='exit@parkease.test', password='x', fullname='Exit', address='Bench Street',
+                    pincode='000000')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(args.lots):
+            lot = ParkingLot(prime_location_name=f'Exit Lot {i}', address='Bench Street', pin_code='000000',
+                             price_per_hour=10 + i)
+            db.session.add(lot)
+            db.session.flush()
+            add_spots(lot.id, cars_per_lot + 1)
+            spot_ids = db.session.execute(
+                select(ParkingSpot.id).where(ParkingSpot.lot_id == lot.id).order_by(ParkingSpot.id)
+            ).scalars().all()
+            db.session.execute(ParkingSpot.__table__.update().where(ParkingSpot.id.in_(spot_ids[:-1])),
+                               {'status': 'O'})
+            adjust_lot_counters(lot.id, available=-cars_per_lot, occupied=cars_per_lot)
+            rows = [
+                {'spot_id': spot_id, 'user_id': user.id, 'vehicle_number': 'EXIT',
+                 'parking_time': now - timedelta(minutes=30 + n), 'planned_start_time': now - timedelta(minutes=30 + n),
+                 'planned_end_time': now + timedelta(hours=2), 'checked_in_at': now}
+                for n, spot_id in enumerate(spot_ids[:-1])
+            ]
+            # The spare spot holds a booking that has not checked in yet
+            rows.append({'spot_id': spot_ids[-1], 'user_id': user.id, 'vehicle_number': 'LATE',
+                         'parking_time': now, 'planned_start_time': now, 'planned_end_time': now + timedelta(hours=2),
+                         'checked_in_at': None})
+            db.session.execute(Reservation.__table__.insert(), rows)
+        db.session.commit()
+        reservations = Reservation.query.filter_by(user_id=user.id).order_by(Reservation.id).all()
+        cars = [(r.id, r.spot_id, issue_token(r)) for r in reservations if r.checked_in_at]
+        late = [issue_token(r) for r in reservations if not r.checked_in_at]
+        prices = {r.id: r.spot.lot.price_per_hour for r in reservations}
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id
+        sess['role'] = 'admin'
+        sess['user_name'] = 'Bench'
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    single, batched = cars[0::2], cars[1::2]
+    failures = 0
+    print(f"{len(cars)} cars in {args.lots} lots")
+    print(f"{'path':<22} {'cars/s':>9} {'statements/car':>15}")
+
+    statements.clear()
+    started = time.perf_counter()
+    for reservation_id, spot_id, token in single:
+        reply = client.post('/verify_qr', json={'qr_data': token, 'spot_id': spot_id}).get_json()
+        failures += 0 if reply['success'] else 1
+        client.get(reply['redirect_url'])
+        client.post(reply['redirect_url'])
+    elapsed = time.perf_counter() - started
+    print(f"{'scan page, 1 by 1':<22} {len(single) / elapsed:>9.0f} {len(statements) / len(single):>15.1f}")
+
+    statements.clear()
+    started = time.perf_counter()
+    replies = []
+    for i in range(0, len(batched), args.batch):
+        chunk = batched[i:i + args.batch]
+        replies.append(client.post('/admin/gate/release', json={
+            'scans': [{'qr_data': token, 'spot_id': spot_id} for _, spot_id, token in chunk]
+        }).get_json())
+    elapsed = time.perf_counter() - started
+    print(f"{f'batch of {args.batch}':<22} {len(batched) / elapsed:>9.0f} {len(statements) / len(batched):>15.1f}")
+    failures += sum(len(reply['results']) - reply['released'] for reply in replies)
+
+    refused = client.post('/admin/gate/release', json={'scans': [
+        {'qr_data': batched[0][2]},
+        {'qr_data': late[0]},
+        {'qr_data': 'reservation_id:999999999'},
+        {'qr_data': 'PE1.not-a-token'},
+    ] + [{'qr_data': single[1][2]}] * 2}).get_json()
+    for result in refused['results']:
+        print(f"{'refused' if not result['success'] else 'RELEASED':<9} {result.get('error', '')}")
+        failures += 0 if not result['success'] else 1
+    for path, (_, spot_id, token) in (('batch', batched[-1]), ('one by one', single[-1])):
+        reply = client.post('/verify_qr', json={'qr_data': token, 'spot_id': spot_id}).get_json()
+        print(f"{'refused' if not reply['success'] else 'VERIFIED':<9} rescan after {path} release: "
+              f"{reply.get('error', '')}")
+        failures += 0 if not reply['success'] else 1
+
+    with app.app_context():
+        ids = [reservation_id for reservation_id, _, _ in cars]
+        still_open = db.session.execute(
+            select(func.count()).where(Reservation.id.in_(ids), Reservation.leaving_time.is_(None))
+        ).scalar()
+        wrong_amounts = 0
+        for reservation in Reservation.query.filter(Reservation.id.in_(ids)):
+            entry = RevenueEntry.query.filter_by(reservation_id=reservation.id).first()
+            if entry is None or entry.amount != reservation_charge(reservation, prices[reservation.id]):
+                wrong_amounts += 1
+        revoked = db.session.execute(
+            select(func.count()).where(RevokedQRToken.reservation_id.in_(ids))
+        ).scalar()
+        drift = reconcile_lot_counters(fix=False)
+    print(f"open {still_open}, wrong amounts {wrong_amounts}, revoked {revoked}/{len(ids)}, "
+          f"drifted lots {len(drift)}")
+    failures += still_open + wrong_amounts + (len(ids) - revoked) + len(drift)
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Offline exits with utils.gate_client against a lot's gate snapshot.
+
+Serves the app over HTTP on a local port and runs two scanner lanes for
+one lot. It times a full snapshot sync, a local code check and a delta
+sync, after the other lane released cars and new cars checked in. It then
+cuts lane A off from the server, releases cars offline and flushes them
+once the server is back. Fails unless:
+- every genuine code checks out locally;
+- forged, edited and other-lot codes are refused;
+- a delta-synced lane matches a fresh full snapshot;
+- no car is released twice;
+- every offline exit is released on flush.
+Run from the project root:
+
+    python -m benchmarks.bench_gate_snapshot --cars 5000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from werkzeug.serving import make_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cars', type=int, default=5000)
+    parser.add_argument('--churn', type=int, default=200, help='Cars leaving and arriving between syncs.')
+    args = parser.parse_args()
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+    from utils.gate import log_gate_changes
+    from utils.gate_client import GateScanner, RejectedScan, GateSyncError
+    from utils.inventory import add_spots, adjust_lot_counters
+    from utils.qrtoken import issue_token, QRSigner
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    now = datetime.now()
+
+    def park(lot_id, count, log):
+        spot_ids = db.session.execute(
+            select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+            .order_by(ParkingSpot.id).limit(count)
+        ).scalars().all()
+        db.session.execute(ParkingSpot.__table__.update().where(ParkingSpot.id.in_(spot_ids)), {'status': 'O'})
+        adjust_lot_counters(lot_id, available=-len(spot_ids), occupied=len(spot_ids))
+        first = (db.session.execute(select(Reservation.id).order_by(Reservation.id.desc())).scalar() or 0) + 1
+        db.session.execute(Reservation.__table__.insert(), [
+            {'spot_id': spot_id, 'user_id': user_id, 'vehicle_number': 'SNAP', 'parking_time': now,
+             'planned_start_time': now, 'planned_end_time': now + timedelta(hours=3), 'checked_in_at': now}
+            for spot_id in spot_ids
+        ])
+        reservations = Reservation.query.filter(Reservation.id >= first).order_by(Reservation.id).all()
+        if log:
+            log_gate_changes([(lot_id, r.id) for r in reservations])
+        db.session.commit()
+        return [issue_token(r) for r in reservations]
+
+    with app.app_context():
+        user = User(email='snap@parkease.test', password='x', fullname='Snap', address='Bench Street',
+                    pincode='000000')
+        lots = [ParkingLot(prime_location_name=f'Snapshot Lot {i}', address='Bench Street', pin_code='000000',
+                           price_per_hour=10) for i in range(2)]
+        db.session.add_all([user, *lots])
+        db.session.flush()
+        user_id = user.id
+        lot_id, other_lot_id = lots[0].id, lots[1].id
+        add_spots(lot_id, args.cars + args.churn)
+        add_spots(other_lot_id, 10)
+        codes = park(lot_id, args.cars, log=False)
+        other_codes = park(other_lot_id, 10, log=False)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    lane_a, lane_b = GateScanner(base_url, lot_id), GateScanner(base_url, lot_id)
+    for lane in (lane_a, lane_b):
+        lane.login('admin@parkease.com', 'admin123')
+    failures = 0
+
+    started = time.perf_counter()
+    snapshot = lane_a.sync()
+    full_ms = (time.perf_counter() - started) * 1000
+    lane_b.sync()
+    raw = json.dumps(snapshot, separators=(',', ':')).encode()
+    print(f"{args.cars} checked-in cars")
+    print(f"full sync   {full_ms:>8.1f} ms  {len(raw) / 1024:>7.0f} KB  ({len(gzip.compress(raw)) / 1024:.0f} KB gzipped)")
+
+    started = time.perf_counter()
+    accepted = 0
+    for code in codes:
+        try:
+            lane_a.check(code)
+            accepted += 1
+        except RejectedScan:
+            pass
+    check_us = (time.perf_counter() - started) / len(codes) * 1e6
+    failures += len(codes) - accepted
+    print(f"local check {check_us:>8.1f} us  {accepted}/{len(codes)} accepted")
+
+    prefix, key_id, claims, signature = codes[0].split('.')
+    with app.app_context():
+        forged = QRSigner([b'not the key']).issue(snapshot['reservations'][0][0], 1, now, now + timedelta(hours=1))
+    bad = {
+        'forged': forged,
+        'edited claims': '.'.join([prefix, key_id, claims[:-2] + ('A' if claims[-2] != 'A' else 'B') + claims[-1],
+                                   signature]),
+        'edited signature': '.'.join([prefix, key_id, claims, signature[::-1]]),
+        'other lot': other_codes[0],
+        'garbage': 'hello',
+    }
+    for case, code in bad.items():
+        try:
+            lane_a.check(code)
+            failures += 1
+            print(f"{case:<17} ACCEPTED")
+        except RejectedScan as e:
+            print(f"{case:<17} refused  {e}")
+
+    # Lane B lets some cars out; others arrive
+    for code in codes[:args.churn]:
+        lane_b.release(code)
+    released_b = lane_b.flush()
+    failures += sum(1 for result in released_b if not result['success'])
+    with app.app_context():
+        arrivals = park(lot_id, args.churn, log=True)
+
+    started = time.perf_counter()
+    delta = lane_a.sync()
+    delta_ms = (time.perf_counter() - started) * 1000
+    delta_kb = len(json.dumps(delta, separators=(',', ':'))) / 1024
+    print(f"delta sync  {delta_ms:>8.1f} ms  {delta_kb:>7.0f} KB  "
+          f"(+{len(delta['reservations'])} -{len(delta.get('removed', []))}, full={delta['full']})")
+    fresh = GateScanner(base_url, lot_id)
+    fresh.opener = lane_a.opener
+    fresh.sync()
+    same = fresh.reservations == lane_a.reservations
+    failures += 0 if same and not delta['full'] else 1
+    print(f"delta matches a fresh snapshot: {'yes' if same else 'NO'}")
+
+    try:
+        lane_a.check(codes[0])
+        failures += 1
+        print("a car released at lane B still checks out at lane A")
+    except RejectedScan:
+        pass
+
+    # The server goes away; lane A keeps letting cars out
+    lane_a.base_url = 'http://127.0.0.1:9'
+    offline = codes[args.churn:args.churn * 2] + arrivals[:args.churn // 2]
+    for code in offline:
+        lane_a.release(code)
+    try:
+        lane_a.sync()
+        failures += 1
+    except GateSyncError:
+        pass
+    try:
+        lane_a.flush()
+        failures += 1
+    except GateSyncError:
+        pass
+    queued = len(lane_a.pending)
+    lane_a.base_url = base_url
+    started = time.perf_counter()
+    results = lane_a.flush()
+    flush_ms = (time.perf_counter() - started) * 1000
+    released = sum(1 for result in results if result['success'])
+    failures += 0 if released == len(offline) == queued else 1
+    print(f"offline exits flushed {flush_ms:>8.1f} ms  {released}/{queued} released")
+
+    with app.app_context():
+        open_left = db.session.execute(
+            select(Reservation.id).join(ParkingSpot).where(ParkingSpot.lot_id == lot_id,
+                                                          Reservation.leaving_time.is_(None))
+        ).scalars().all()
+    expected = args.cars + args.churn - args.churn - len(offline)
+    failures += 0 if len(open_left) == expected else 1
+    print(f"still parked: {len(open_left)} (expected {expected})")
+
+    server.shutdown()
+    os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
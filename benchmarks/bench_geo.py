@@ -0,0 +1,85 @@
+"""Nearest-lot index: grid lookup vs. brute-force distance scan.
+
+Scatters lots over a city-sized area, checks that the grid returns exactly
+the brute-force k nearest, and reports per-query index time. Run from the
+project root:
+
+    python -m benchmarks.bench_geo --lots 5000 --k 5
+"""
+import argparse
+import random
+import time
+
+from utils.geo import LotGridIndex, haversine_km
+
+
+CITY_CENTER = (12.9716, 77.5946)
+CITY_SPREAD_DEG = 0.25
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lots', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    points = {
+        lot_id: (CITY_CENTER[0] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+                 CITY_CENTER[1] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG))
+        for lot_id in range(1, args.lots + 1)
+    }
+
+    started = time.perf_counter()
+    index = LotGridIndex()
+    for lot_id, (lat, lng) in points.items():
+        index.upsert(lot_id, lat, lng)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    queries = [
+        (CITY_CENTER[0] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+         CITY_CENTER[1] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG))
+        for _ in range(args.queries)
+    ]
+
+    def grid(lat, lng):
+        found = []
+        for distance, lot_id in index.iter_nearest(lat, lng):
+            found.append(lot_id)
+            if len(found) == args.k:
+                break
+        return found
+
+    def brute(lat, lng):
+        ranked = sorted((haversine_km(lat, lng, p_lat, p_lng), lot_id) for lot_id, (p_lat, p_lng) in points.items())
+        return [lot_id for _, lot_id in ranked[:args.k]]
+
+    started = time.perf_counter()
+    grid_results = [grid(lat, lng) for lat, lng in queries]
+    grid_us = (time.perf_counter() - started) / len(queries) * 1e6
+
+    brute_queries = queries[:min(len(queries), 200)]
+    started = time.perf_counter()
+    brute_results = [brute(lat, lng) for lat, lng in brute_queries]
+    brute_us = (time.perf_counter() - started) / len(brute_queries) * 1e6
+
+    mismatches = sum(1 for g, b in zip(grid_results, brute_results) if g != b)
+
+    started = time.perf_counter()
+    for lot_id in range(1, min(args.lots, 1000) + 1):
+        lat, lng = points[lot_id]
+        index.upsert(lot_id, lat + 0.001, lng - 0.001)
+    update_us = (time.perf_counter() - started) / min(args.lots, 1000) * 1e6
+
+    print(f"lots={args.lots} k={args.k} queries={args.queries}")
+    print(f"index build:        {build_ms:.1f} ms")
+    print(f"grid k-nearest:     {grid_us:.1f} us/query")
+    print(f"brute-force scan:   {brute_us:.1f} us/query")
+    print(f"incremental update: {update_us:.2f} us/lot")
+    print(f"mismatches vs brute force: {mismatches}/{len(brute_queries)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
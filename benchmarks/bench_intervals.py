@@ -0,0 +1,189 @@
+"""Free-spot lookup on lots with dense future bookings.
+
+Fills every spot with back-to-back future bookings, then compares answering
+"free spot in lot X for [t1, t2)" from the in-memory interval index against
+an overlap query in SQL. Finally books random windows from many threads and
+verifies that no spot ends up with two overlapping bookings. Run from the
+project root:
+
+    python -m benchmarks.bench_intervals --spots 200 --days 30
+    python -m benchmarks.bench_intervals --database-url postgresql://...
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, exists
+
+from benchmarks.bench_booking import build_app
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from utils.intervals import SpotIntervalIndex, OPEN_END, spot_schedules
+from utils.inventory import reserve_spot
+
+
+def seed(spots, days, users, rng):
+    db.drop_all()
+    db.create_all()
+
+    lot = ParkingLot(prime_location_name='Dense Lot', address='Bench Street', pin_code='000000',
+                     price_per_hour=10, spots_total=spots, spots_available=spots)
+    db.session.add(lot)
+    db.session.add_all([
+        User(email=f'bench{i}@parkease.test', password='x', fullname=f'Bench {i}',
+             address='Bench Street', pincode='000000')
+        for i in range(users)
+    ])
+    db.session.flush()
+    db.session.execute(ParkingSpot.__table__.insert(), [{'lot_id': lot.id, 'status': 'A'} for _ in range(spots)])
+    spot_ids = db.session.execute(select(ParkingSpot.id).where(ParkingSpot.lot_id == lot.id)).scalars().all()
+    user_ids = db.session.execute(select(User.id)).scalars().all()
+
+    # Back-to-back bookings of 1-4 hours with random gaps, for `days` days ahead
+    start_of_day = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    horizon = start_of_day + timedelta(days=days)
+    rows = []
+    for spot_id in spot_ids:
+        t = start_of_day + timedelta(minutes=rng.randrange(0, 120, 15))
+        while t < horizon:
+            end = t + timedelta(hours=rng.randint(1, 4))
+            rows.append({'spot_id': spot_id, 'user_id': rng.choice(user_ids), 'vehicle_number': 'BENCH',
+                         'parking_time': t, 'planned_start_time': t, 'planned_end_time': end})
+            t = end + timedelta(minutes=rng.choice([0, 0, 15, 30, 60, 120]))
+    for start in range(0, len(rows), 10000):
+        db.session.execute(Reservation.__table__.insert(), rows[start:start + 10000])
+    db.session.commit()
+    return lot.id, user_ids, start_of_day, horizon, len(rows)
+
+
+def sql_free_spots(lot_id, start, end):
+    overlapping = exists().where(
+        Reservation.spot_id == ParkingSpot.id,
+        Reservation.leaving_time.is_(None),
+        func.coalesce(Reservation.planned_start_time, Reservation.parking_time) < end,
+        func.coalesce(Reservation.planned_end_time, OPEN_END) > start,
+    )
+    return db.session.execute(
+        select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id, ~overlapping).order_by(ParkingSpot.id)
+    ).scalars().all()
+
+
+def random_window(rng, start_of_day, horizon):
+    span = int((horizon - start_of_day).total_seconds() // 900) - 16
+    start = start_of_day + timedelta(minutes=15 * rng.randrange(span))
+    return start, start + timedelta(hours=rng.randint(1, 4))
+
+
+def overlapping_pairs(lot_id):
+    rows = db.session.execute(
+        select(Reservation.spot_id, Reservation.planned_start_time, Reservation.planned_end_time)
+        .join(ParkingSpot).where(ParkingSpot.lot_id == lot_id, Reservation.leaving_time.is_(None))
+        .order_by(Reservation.spot_id, Reservation.planned_start_time)
+    ).all()
+    bad = 0
+    for (spot_a, _, end_a), (spot_b, start_b, _) in zip(rows, rows[1:]):
+        if spot_a == spot_b and start_b < end_a:
+            bad += 1
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--spots', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--bookings', type=int, default=400, help='Concurrent booking attempts in the race check.')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    rng = random.Random(11)
+
+    with app.app_context():
+        started = time.perf_counter()
+        lot_id, user_ids, start_of_day, horizon, booked = seed(args.spots, args.days, args.threads, rng)
+        print(f"seeded {args.spots} spots with {booked} future bookings over {args.days} days "
+              f"in {time.perf_counter() - started:.1f}s ({db.engine.dialect.name})")
+
+        index = SpotIntervalIndex()
+        started = time.perf_counter()
+        index.free_spots(lot_id, start_of_day, start_of_day)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        windows = [random_window(rng, start_of_day, horizon) for _ in range(args.queries)]
+        started = time.perf_counter()
+        index_results = [index.free_spots(lot_id, start, end) for start, end in windows]
+        index_us = (time.perf_counter() - started) / len(windows) * 1e6
+
+        started = time.perf_counter()
+        sql_results = [sql_free_spots(lot_id, start, end) for start, end in windows]
+        sql_us = (time.perf_counter() - started) / len(windows) * 1e6
+        db.session.rollback()
+
+        mismatches = sum(1 for a, b in zip(index_results, sql_results) if a != b)
+        hit_rate = sum(1 for r in index_results if r) / len(index_results)
+        print(f"index load (one lot):   {load_ms:.1f} ms")
+        print(f"index free-spot lookup: {index_us:.1f} us/query")
+        print(f"SQL overlap query:      {sql_us:.1f} us/query")
+        print(f"windows with a free spot: {hit_rate:.0%}; mismatches vs SQL: {mismatches}/{len(windows)}")
+
+    lock = threading.Lock()
+    outcome = {'booked': 0, 'full': 0, 'errors': 0}
+
+    def worker(user_id, attempts):
+        local_rng = random.Random(user_id)
+        with app.app_context():
+            for _ in range(attempts):
+                start, end = random_window(local_rng, start_of_day, horizon)
+                try:
+                    spot_id = reserve_spot(lot_id, start, end)
+                    if spot_id is None:
+                        db.session.rollback()
+                        result = 'full'
+                    else:
+                        reservation = Reservation(spot_id=spot_id, user_id=user_id, vehicle_number='RACE',
+                                                  parking_time=start, planned_start_time=start, planned_end_time=end)
+                        db.session.add(reservation)
+                        db.session.commit()
+                        spot_schedules.add(lot_id, spot_id, reservation.id, start, end)
+                        result = 'booked'
+                except Exception:
+                    db.session.rollback()
+                    result = 'errors'
+                with lock:
+                    outcome[result] += 1
+            db.session.remove()
+
+    per_thread = max(1, args.bookings // args.threads)
+    threads = [threading.Thread(target=worker, args=(user_id, per_thread)) for user_id in user_ids[:args.threads]]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        overlaps = overlapping_pairs(lot_id)
+    print(f"race: {outcome['booked']} booked, {outcome['full']} no free spot, {outcome['errors']} errors "
+          f"in {elapsed:.2f}s with {args.threads} threads ({outcome['booked'] / elapsed:.0f} bookings/s)")
+    print(f"overlapping bookings on one spot: {overlaps}")
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if overlaps or mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
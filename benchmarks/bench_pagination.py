@@ -0,0 +1,120 @@
+"""Paging a heavy user's history and the user list: OFFSET vs keyset.
+
+Seeds one user with a long reservation history and many other users, then
+fetches a page at increasing depths two ways: LIMIT/OFFSET, which reads and
+throws away every row before the page, and utils.pagination.keyset_page(),
+which seeks to the cursor through the index. Checks that both return the
+same rows. Run from the project root:
+
+    python -m benchmarks.bench_pagination --reservations 200000 --users 200000
+    python -m benchmarks.bench_pagination --database-url postgresql://...
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from benchmarks.bench_booking import build_app
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from utils.pagination import keyset_page, encode_cursor, PER_PAGE
+
+
+def seed(reservations, users):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'email': f'pager{i}@parkease.test', 'password': 'x', 'fullname': f'Pager {i}', 'address': 'Bench Street',
+         'pincode': '000000', 'role': 'user'}
+        for i in range(users)
+    ])
+    lot = ParkingLot(prime_location_name='Pager Lot', address='Bench Street', pin_code='000000', price_per_hour=10)
+    db.session.add(lot)
+    db.session.flush()
+    spot = ParkingSpot(lot_id=lot.id, status='A')
+    db.session.add(spot)
+    db.session.flush()
+
+    heavy = db.session.execute(select(User.id).order_by(User.id).limit(1)).scalar()
+    start = datetime.utcnow() - timedelta(days=3 * 365)
+    for offset in range(0, reservations, 20000):
+        rows = []
+        for i in range(offset, min(offset + 20000, reservations)):
+            # Every fifth booking shares its timestamp with the previous one, so ids break ties
+            t = start + timedelta(minutes=10 * (i - i % 5 // 4))
+            rows.append({'spot_id': spot.id, 'user_id': heavy, 'vehicle_number': 'PAGE', 'parking_time': t,
+                         'planned_start_time': t, 'leaving_time': t + timedelta(hours=1)})
+        db.session.execute(Reservation.__table__.insert(), rows)
+    db.session.commit()
+    return heavy
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def compare(label, query, columns, key, descending, depths, per_page):
+    order = [col.desc() if descending else col.asc() for col in columns]
+    failures = 0
+    for depth in depths:
+        offset = depth * per_page
+        offset_ms, expected = timed(lambda: query.order_by(*order).offset(offset).limit(per_page).all())
+        if not expected:
+            continue
+        # The cursor a reader would hold after the previous page
+        before = query.order_by(*order).offset(offset - 1).limit(1).first() if offset else None
+        cursor = encode_cursor(key(before), 'next') if before is not None else None
+        keyset_ms, page = timed(lambda: keyset_page([(query, columns)], key, cursor, per_page, descending))
+        same = [key(row) for row in page] == [key(row) for row in expected]
+        failures += 0 if same else 1
+        print(f"{label:<10} {depth + 1:>7} {offset_ms:>10.2f} {keyset_ms:>10.2f}  {'yes' if same else 'NO'}")
+        db.session.expire_all()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    with app.app_context():
+        heavy = seed(args.reservations, args.users)
+        print(f"{'list':<10} {'page':>7} {'offset ms':>10} {'keyset ms':>10}  same rows")
+
+        history_pages = args.reservations // PER_PAGE
+        failures = compare(
+            'history', Reservation.query.filter_by(user_id=heavy), (Reservation.parking_time, Reservation.id),
+            lambda r: (r.parking_time, r.id), True,
+            [0, history_pages // 100, history_pages // 10, history_pages - 1], PER_PAGE,
+        )
+        user_pages = args.users // 50
+        failures += compare(
+            'users', User.query.filter(User.role != 'admin'), (User.id,), lambda u: (u.id,), False,
+            [0, user_pages // 100, user_pages // 10, user_pages - 1], 50,
+        )
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+"""QR images: the original per-call PIL path vs utils.qrcache.
+
+Renders the QR codes of many distinct signed tokens through the code
+generate_qr_image() used to run, then through render_qr() for each format,
+and through QRImageCache cold, from its directory after a restart, and from
+memory. Prints CPU time per image and bytes per image. It then checks:
+- the cached PNG is byte for byte what the old path produced;
+- the compact PNG and the SVG show the same modules;
+- /reservation/<id>/qr answers a matching If-None-Match with an empty 304
+  and refuses other users' reservations.
+Run from the project root:
+
+    python -m benchmarks.bench_qr_images --codes 500
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+
+
+def legacy_generate(data):
+    # generate_qr_image() before the cache
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def cpu_per_item(fn, items):
+    started = time.process_time()
+    results = [fn(item) for item in items]
+    return (time.process_time() - started) / len(items) * 1000, results
+
+
+def svg_dark_modules(svg):
+    return sum(int(run) for run in re.findall(rb'h(\d+)v1', svg))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, default=500)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    cache_dir = tempfile.mkdtemp(prefix='qr_cache_')
+    os.environ['QR_CACHE_DIR'] = cache_dir
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+    from utils.qrcache import QRImageCache, render_qr, qr_modules, QR_BORDER
+    from utils.qrtoken import signer
+
+    now = datetime.now()
+    with parkease.app.app_context():
+        parkease.init_db(log=lambda message: None)
+        codes = [signer().issue(i, i, now, now + timedelta(hours=2)) for i in range(1, args.codes + 1)]
+
+    failures = 0
+    print(f"{args.codes} distinct codes")
+    print(f"{'path':<26} {'cpu ms/img':>11} {'bytes/img':>10}")
+
+    legacy_ms, legacy = cpu_per_item(legacy_generate, codes)
+    print(f"{'old generate_qr_image':<26} {legacy_ms:>11.2f} {sum(map(len, legacy)) / len(legacy):>10.0f}")
+    rendered = {}
+    for fmt in ('png', 'png1', 'svg'):
+        ms, rendered[fmt] = cpu_per_item(lambda code: render_qr(code, fmt), codes)
+        print(f"{'render ' + fmt:<26} {ms:>11.2f} {sum(map(len, rendered[fmt])) / len(codes):>10.0f}")
+
+    cache = QRImageCache(cache_dir)
+    ms, _ = cpu_per_item(lambda code: cache.get(code, 'png'), codes)
+    print(f"{'cache png, cold':<26} {ms:>11.2f}")
+    restarted = QRImageCache(cache_dir)
+    ms, from_disk = cpu_per_item(lambda code: restarted.get(code, 'png')[0], codes)
+    print(f"{'cache png, from disk':<26} {ms:>11.3f}")
+    ms, from_memory = cpu_per_item(lambda code: restarted.get(code, 'png')[0], codes)
+    print(f"{'cache png, from memory':<26} {ms:>11.3f}")
+
+    same_png = rendered['png'] == legacy == from_disk == from_memory
+    failures += 0 if same_png else 1
+    print(f"png identical to the old path: {'yes' if same_png else 'NO'}")
+
+    mismatched = 0
+    for code, compact, svg in list(zip(codes, rendered['png1'], rendered['svg']))[:50]:
+        modules = qr_modules(code)
+        size = len(modules)
+        pixels = Image.open(BytesIO(compact)).convert('1')
+        inner = [[pixels.getpixel((x + QR_BORDER, y + QR_BORDER)) == 0 for x in range(size)] for y in range(size)]
+        dark = sum(sum(row) for row in modules)
+        if inner != [list(row) for row in modules] or svg_dark_modules(svg) != dark:
+            mismatched += 1
+    failures += mismatched
+    print(f"png1 and svg match the modules: {'yes' if not mismatched else f'NO ({mismatched})'}")
+
+    app = parkease.app
+    with app.app_context():
+        user = User(email='qr@parkease.test', password='x', fullname='QR', address='Bench Street', pincode='000000')
+        other = User(email='qr2@parkease.test', password='x', fullname='QR 2', address='Bench Street', pincode='000000')
+        lot = ParkingLot(prime_location_name='QR Lot', address='Bench Street', pin_code='000000', price_per_hour=10)
+        db.session.add_all([user, other, lot])
+        db.session.flush()
+        spot = ParkingSpot(lot_id=lot.id, status='A')
+        db.session.add(spot)
+        db.session.flush()
+        reservation = Reservation(spot_id=spot.id, user_id=user.id, vehicle_number='QR', parking_time=now,
+                                  planned_start_time=now, planned_end_time=now + timedelta(hours=2))
+        db.session.add(reservation)
+        db.session.commit()
+        reservation_id, user_id, other_id = reservation.id, user.id, other.id
+
+    def client(uid):
+        c = app.test_client()
+        with c.session_transaction() as sess:
+            sess['user_id'] = uid
+            sess['role'] = 'user'
+            sess['user_name'] = 'QR'
+        return c
+
+    owner = client(user_id)
+    url = f'/reservation/{reservation_id}/qr'
+    checks = {}
+    first = owner.get(url + '?format=svg')
+    checks['200 with a strong ETag'] = first.status_code == 200 and first.headers.get('ETag', '').startswith('"')
+    again = owner.get(url + '?format=svg', headers={'If-None-Match': first.headers['ETag']})
+    checks['304 without a body'] = again.status_code == 304 and not again.data
+    png = owner.get(url)
+    checks['formats have their own ETag'] = png.headers['ETag'] != first.headers['ETag'] and png.mimetype == 'image/png'
+    # The app's 404 handler redirects home
+    checks['another user is refused'] = client(other_id).get(url).status_code in (302, 404)
+    checks['unknown format is refused'] = owner.get(url + '?format=gif').status_code in (302, 404)
+    for name, ok in checks.items():
+        failures += 0 if ok else 1
+        print(f"{name:<30} {'ok' if ok else 'FAILED'}")
+
+    shutil.rmtree(cache_dir)
+    os.remove(db_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Gate scans: database-checked reservation ids vs signed QR tokens.
+
+Seeds checked-in reservations, then posts each one's QR code to /verify_qr
+twice: once as the old reservation_id:<id> code, which is looked up in the
+database, and once as the signed token from utils.qrtoken, which is checked
+with its HMAC and the in-memory revocation list. Also times the signature
+check on its own, and fails unless tampered, expired, foreign-key, wrong-spot
+and released codes are all refused. Run from the project root:
+
+    python -m benchmarks.bench_qr_verify --reservations 20000 --scans 2000
+    python -m benchmarks.bench_qr_verify --database-url postgresql://...
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reservations', type=int, default=20000)
+    parser.add_argument('--scans', type=int, default=2000)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+    from utils.inventory import add_spots
+    from utils.qrtoken import QRSigner, InvalidToken, issue_token, signer, revocations
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    now = datetime.now()
+    with app.app_context():
+        user = User(email='gate@parkease.test', password='x', fullname='Gate', address='Bench Street',
+                    pincode='000000')
+        lot = ParkingLot(prime_location_name='Gate Lot', address='Bench Street', pin_code='000000',
+                         price_per_hour=10)
+        db.session.add_all([user, lot])
+        db.session.flush()
+        add_spots(lot.id, args.reservations)
+        spot_ids = db.session.execute(
+            select(ParkingSpot.id).where(ParkingSpot.lot_id == lot.id).order_by(ParkingSpot.id)
+        ).scalars().all()
+        db.session.execute(Reservation.__table__.insert(), [
+            {'spot_id': spot_id, 'user_id': user.id, 'vehicle_number': 'GATE', 'parking_time': now,
+             'planned_start_time': now, 'planned_end_time': now + timedelta(hours=2), 'checked_in_at': now}
+            for spot_id in spot_ids
+        ])
+        db.session.commit()
+        reservations = Reservation.query.filter_by(user_id=user.id).all()
+        codes = [(r.id, r.spot_id, f"reservation_id:{r.id}", issue_token(r)) for r in reservations]
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id
+        sess['role'] = 'admin'
+        sess['user_name'] = 'Bench'
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+    def scan(qr_data, spot_id):
+        return client.post('/verify_qr', json={'qr_data': qr_data, 'spot_id': spot_id}).get_json()
+
+    rng = random.Random(3)
+    sample = [rng.choice(codes) for _ in range(args.scans)]
+    failures = 0
+
+    print(f"{args.reservations} checked-in reservations, {args.scans} scans")
+    print(f"{'code':<10} {'us/scan':>9} {'statements/scan':>16}  all accepted")
+    for label, index in (('legacy', 2), ('signed', 3)):
+        scan(sample[0][index], sample[0][1])
+        statements.clear()
+        started = time.perf_counter()
+        accepted = all(scan(code[index], code[1])['success'] for code in sample)
+        elapsed = (time.perf_counter() - started) / len(sample) * 1e6
+        failures += 0 if accepted else 1
+        print(f"{label:<10} {elapsed:>9.1f} {len(statements) / len(sample):>16.3f}  {'yes' if accepted else 'NO'}")
+
+    tokens = [code[3] for code in sample]
+    started = time.perf_counter()
+    for token in tokens:
+        signer().verify(token)
+    elapsed = (time.perf_counter() - started) / len(tokens) * 1e6
+    print(f"signature check alone: {elapsed:.1f} us/token")
+
+    reservation_id, spot_id, _, token = codes[0]
+    prefix, key_id, claims, signature = token.split('.')
+    tampered_claims = claims[:-2] + ('A' if claims[-2] != 'A' else 'B') + claims[-1]
+    foreign = QRSigner([b'someone else']).issue(reservation_id, spot_id, now, now + timedelta(hours=1))
+    with app.app_context():
+        expired = signer().issue(reservation_id, spot_id, now - timedelta(days=3), now - timedelta(days=1))
+    rejected = {
+        'tampered claims': scan('.'.join([prefix, key_id, tampered_claims, signature]), spot_id),
+        'tampered signature': scan('.'.join([prefix, key_id, claims, signature[::-1]]), spot_id),
+        'foreign key': scan(foreign, spot_id),
+        'expired': scan(expired, spot_id),
+        'wrong spot': scan(token, codes[1][1]),
+        'garbage': scan('PE1.not-a-token', spot_id),
+    }
+    client.post(f'/admin_release/{reservation_id}')
+    revocations.clear()
+    rejected['released'] = scan(token, spot_id)
+
+    for case, reply in rejected.items():
+        refused = not reply['success']
+        failures += 0 if refused else 1
+        print(f"{case:<20} {'refused' if refused else 'ACCEPTED'}  {reply.get('error', '')}")
+    try:
+        signer().verify(token, now=time.time() + 10 * 86400)
+        failures += 1
+    except InvalidToken:
+        pass
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
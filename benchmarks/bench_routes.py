@@ -0,0 +1,294 @@
+"""Load test for the hot routes.
+
+Each worker thread plays one user: it loads the dashboard, polls lot
+availability, books a spot and releases it, and (as an admin) loads the
+dashboard and summary pages. Reports p50/p99 latency and throughput per route
+and saves the numbers under benchmarks/results/, keyed by git commit, so runs
+can be compared across commits. Run from the project root:
+
+    python -m benchmarks.bench_routes                          # seeds a temporary SQLite database
+    python -m benchmarks.bench_routes --database-url sqlite:///database.sqlite3   # after `flask seed-data`
+    python -m benchmarks.bench_routes --base-url http://127.0.0.1:8000 --database-url ...   # live gunicorn
+    python -m benchmarks.bench_routes --compare benchmarks/results/bench_routes-abc1234.json
+
+With --base-url the requests go over HTTP to a running server; the database
+URL must point at the same database, which is read to pick lots and users and
+to find each new reservation id.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+
+ROUTES = ['dashboard', 'check_availability', 'book', 'release', 'admin_dashboard', 'admin_summary']
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+class TestClientDriver:
+    """Requests through the Flask test client, logged in by writing the session."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def login(self, user_id, role, email, password):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['role'] = role
+            sess['user_name'] = 'Bench'
+        return client
+
+    def request(self, client, method, path, data=None):
+        response = client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPDriver:
+    """Requests over HTTP to a running server, logged in through /login."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def login(self, user_id, role, email, password):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+        status = self.request(opener, 'POST', '/login', {'email': email, 'password': password})
+        if status != 302:
+            raise SystemExit(f"login as {email} failed with status {status}")
+        return opener
+
+    def request(self, opener, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD']).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_worker(driver, db, models, user, admin, lot_ids, iterations, latencies, errors, lock):
+    User, ParkingLot, Reservation = models
+    rng = random.Random(user.id)
+    user_client = driver.login(user.id, 'user', user.email, user.password_plain)
+    admin_client = driver.login(admin.id, 'admin', admin.email, admin.password_plain)
+
+    def hit(route, client, method, path, expected, data=None):
+        started = time.perf_counter()
+        status = driver.request(client, method, path, data)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[route].append(elapsed)
+            if status != expected:
+                errors[route] += 1
+        return status == expected
+
+    for _ in range(iterations):
+        lot_id = rng.choice(lot_ids)
+        hit('dashboard', user_client, 'GET', '/dashboard', 200)
+        hit('check_availability', user_client, 'GET', f'/check_availability/{lot_id}', 200)
+
+        now = datetime.now()
+        booked = hit('book', user_client, 'POST', f'/book/{lot_id}/{user.id}', 302, {
+            'vehicle_number': f'KA01BM{user.id % 10000:04d}',
+            'booking_date': now.strftime('%d-%m-%Y'),
+            'booking_time': now.strftime('%H:%M'),
+        })
+        reservation_id = None
+        if booked:
+            reservation_id = db.session.execute(
+                db.select(Reservation.id).where(Reservation.user_id == user.id, Reservation.leaving_time.is_(None))
+            ).scalar()
+            db.session.rollback()
+        if reservation_id is None:
+            with lock:
+                errors['book'] += int(booked)
+        else:
+            hit('release', user_client, 'POST', f'/release/{reservation_id}', 302)
+
+        hit('admin_dashboard', admin_client, 'GET', '/admin_dashboard', 200)
+        hit('admin_summary', admin_client, 'GET', '/admin_summary', 200)
+    db.session.remove()
+
+
+def print_comparison(results, baseline_path):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nvs {baseline['commit']} ({baseline_path})")
+    print(f"{'route':<20} {'p50 ms':>16} {'p99 ms':>16}")
+    for route in ROUTES:
+        now, before = results['routes'].get(route), baseline['routes'].get(route)
+        if not now or not before:
+            continue
+        print(f"{route:<20} {before['p50_ms']:>7.2f} → {now['p50_ms']:<7.2f} {before['p99_ms']:>7.2f} → {now['p99_ms']:<7.2f}")
+    print(f"{'throughput':<20} {baseline['throughput_rps']:>7.1f} → {results['throughput_rps']:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None, help='Existing database; a temporary seeded SQLite file by default.')
+    parser.add_argument('--base-url', default=None, help='Drive a running server over HTTP instead of the test client.')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=50, help='Rounds through the route mix per thread.')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed rounds per thread before measuring.')
+    parser.add_argument('--lots', type=int, default=50, help='Lots to seed into the temporary database.')
+    parser.add_argument('--spots', type=int, default=5000)
+    parser.add_argument('--reservations', type=int, default=20000)
+    parser.add_argument('--admin-email', default='admin@parkease.com')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare against.')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    if args.base_url and not args.database_url:
+        parser.error('--base-url needs --database-url pointing at the server\'s database')
+
+    tmp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, Reservation
+    from utils.ledger import backfill_revenue
+    from utils.seed import SEED_PASSWORD, seed_data
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    models = (User, ParkingLot, Reservation)
+
+    with app.app_context():
+        if tmp_path:
+            started = time.perf_counter()
+            seed_data(users=args.spots + args.threads, lots=args.lots, spots=args.spots,
+                      reservations=args.reservations, log=lambda message: None)
+            backfill_revenue(log=lambda message: None)
+            print(f"seeded {args.lots} lots, {args.spots} spots, {args.reservations} reservations "
+                  f"in {time.perf_counter() - started:.1f}s")
+
+        lot_ids = db.session.execute(db.select(ParkingLot.id).where(ParkingLot.spots_available > args.threads)).scalars().all()
+        busy_users = db.select(Reservation.user_id).where(Reservation.leaving_time.is_(None))
+        users = db.session.execute(
+            db.select(User).where(User.role == 'user', User.email.like('seed%'), User.id.not_in(busy_users))
+            .order_by(User.id).limit(args.threads)
+        ).scalars().all()
+        admin = User.query.filter_by(email=args.admin_email, role='admin').first()
+        if not lot_ids or len(users) < args.threads or admin is None:
+            raise SystemExit("Database needs lots with free spots, an admin and enough idle seeded users; "
+                             "run `flask seed-data` first.")
+        for user in users:
+            user.password_plain = SEED_PASSWORD
+        admin.password_plain = args.admin_password
+        database = db.engine.url.get_backend_name()
+        db.session.expunge_all()
+
+    driver = HTTPDriver(args.base_url) if args.base_url else TestClientDriver(app)
+
+    def run(iterations, latencies, errors):
+        lock = threading.Lock()
+
+        def target(user):
+            with app.app_context():
+                run_worker(driver, db, models, user, admin, lot_ids, iterations, latencies, errors, lock)
+
+        threads = [threading.Thread(target=target, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    run(args.warmup, defaultdict(list), defaultdict(int))
+    latencies, errors = defaultdict(list), defaultdict(int)
+    wall = run(args.iterations, latencies, errors)
+
+    total = sum(len(values) for values in latencies.values())
+    results = {
+        'commit': git_revision(),
+        'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'target': args.base_url or 'test-client',
+        'database': database,
+        'threads': args.threads,
+        'iterations': args.iterations,
+        'wall_seconds': round(wall, 3),
+        'throughput_rps': round(total / wall, 1),
+        'routes': {},
+    }
+
+    print(f"{results['target']} threads={args.threads} iterations={args.iterations} commit={results['commit']}")
+    print(f"{'route':<20} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'req/s':>8}")
+    for route in ROUTES:
+        values = sorted(latencies.get(route, []))
+        if not values:
+            continue
+        stats = {
+            'requests': len(values),
+            'errors': errors.get(route, 0),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'mean_ms': round(sum(values) / len(values) * 1000, 2),
+            'throughput_rps': round(len(values) / wall, 1),
+        }
+        results['routes'][route] = stats
+        print(f"{route:<20} {stats['requests']:>8} {stats['errors']:>6} {stats['p50_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['mean_ms']:>8.2f} {stats['throughput_rps']:>8.1f}")
+    print(f"total: {total} requests in {wall:.2f}s, {results['throughput_rps']} req/s")
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"bench_routes-{results['commit']}.json"
+        path.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"saved {path.relative_to(Path.cwd()) if path.is_relative_to(Path.cwd()) else path}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if any(errors.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
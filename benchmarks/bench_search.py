@@ -0,0 +1,106 @@
+"""Lot search: triple ILIKE scan vs. the search index.
+
+Builds a database of synthetic lots and times both search paths for a mix of
+queries. Run from the project root:
+
+    python -m benchmarks.bench_search --lots 50000
+    python -m benchmarks.bench_search --database-url postgresql://...
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+
+from models.models import db, ParkingLot
+from utils.search import ensure_search_index, search_lots
+
+
+AREAS = ['Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Hebbal', 'Yelahanka', 'Malleshwaram',
+         'Banashankari', 'Marathahalli', 'Electronic City', 'Bellandur', 'Rajajinagar', 'Basavanagudi']
+PLACES = ['Mall', 'Metro Station', 'Tech Park', 'Hospital', 'Stadium', 'Market', 'Bus Depot', 'Plaza',
+          'Convention Centre', 'Railway Station', 'University', 'Temple Road']
+STREETS = ['MG Road', '80 Feet Road', 'Outer Ring Road', 'Hosur Road', 'Bannerghatta Road', 'Old Airport Road',
+           'Sarjapur Road', 'Tumkur Road', 'Residency Road', 'Church Street']
+
+QUERIES = ['mall', 'Koramangala', 'metro station', '5600', 'Ring Road', 'Hospital', 'zzz-no-match', 'MG']
+
+
+def legacy_search(query):
+    results = ParkingLot.query.filter(
+        (ParkingLot.address.ilike(f'%{query}%')) |
+        (ParkingLot.pin_code.ilike(f'%{query}%')) |
+        (ParkingLot.prime_location_name.ilike(f'%{query}%'))
+    ).all()
+    return [lot for lot in results if lot.available_spots_count > 0]
+
+
+def seed(lots):
+    rng = random.Random(42)
+    rows = []
+    for i in range(lots):
+        total = rng.randint(10, 200)
+        available = rng.randint(0, total)
+        rows.append({
+            'prime_location_name': f'{rng.choice(AREAS)} {rng.choice(PLACES)} {i}',
+            'address': f'{rng.randint(1, 999)}, {rng.choice(STREETS)}, {rng.choice(AREAS)}, Bengaluru',
+            'pin_code': f'560{rng.randint(0, 120):03d}',
+            'price_per_hour': rng.choice([10, 20, 30, 50]),
+            'spots_total': total,
+            'spots_available': available,
+            'spots_occupied': total - available,
+        })
+    for start in range(0, len(rows), 10000):
+        db.session.execute(ParkingLot.__table__.insert(), rows[start:start + 10000])
+    db.session.commit()
+
+
+def timed(fn, query, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(query)
+        db.session.rollback()
+    return (time.perf_counter() - started) / repeat * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lots', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ensure_search_index()
+        started = time.perf_counter()
+        seed(args.lots)
+        print(f"seeded {args.lots} lots in {time.perf_counter() - started:.1f}s ({db.engine.dialect.name})")
+
+        print(f"{'query':<16} {'ilike ms':>9} {'rows':>6} {'index ms':>9} {'rows':>6} {'speedup':>8}")
+        for query in QUERIES:
+            legacy_ms, legacy_rows = timed(legacy_search, query, args.repeat)
+            index_ms, index_rows = timed(lambda q: search_lots(q, limit=50), query, args.repeat)
+            print(f"{query:<16} {legacy_ms:>9.2f} {legacy_rows:>6} {index_ms:>9.2f} {index_rows:>6} "
+                  f"{legacy_ms / index_ms if index_ms else 0:>7.1f}x")
+
+    if tmp_path:
+        os.remove(tmp_path)
+
+
+if __name__ == '__main__':
+    main()
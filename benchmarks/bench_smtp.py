@@ -0,0 +1,88 @@
+"""SMTP throughput: one connection per mail vs. pooled sessions.
+
+Starts the local SMTP stand-in with simulated relay latency and sends the same
+messages three ways: a fresh SMTP+login per mail (the old behaviour),
+send_email_with_qr through the pool, and send_bulk_emails. Run from the
+project root:
+
+    python -m benchmarks.bench_smtp --messages 200 --latency 0.02
+"""
+import argparse
+import os
+import smtplib
+import time
+from io import BytesIO
+
+from benchmarks.smtp_standin import StandinSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='simulated seconds of relay latency on connect and AUTH')
+    parser.add_argument('--with-qr', action='store_true', help='attach a QR image to every message')
+    args = parser.parse_args()
+
+    server = StandinSMTPServer(latency=args.latency).start()
+    settings = {
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(server.port),
+        'SMTP_USE_TLS': 'false',
+        'SENDER_EMAIL': 'noreply@parkease.test',
+        'BREVO_LOGIN': 'bench',
+        'SENDER_PASSWORD': 'bench',
+    }
+
+    from utils import utils
+    os.environ.update(settings)
+
+    qr_png = utils.generate_qr_image('reservation_id:1').getvalue() if args.with_qr else None
+
+    def emails():
+        return [
+            (f'user{i}@parkease.test', 'Booking Confirmation - ParkEase', f'<p>Reservation {i}</p>',
+             BytesIO(qr_png) if qr_png else None)
+            for i in range(args.messages)
+        ]
+
+    def per_mail_connection(batch):
+        sender = os.environ['SENDER_EMAIL']
+        for to_email, subject, html_body, qr_buffer in batch:
+            msg = utils.build_email_message(sender, to_email, subject, html_body, qr_buffer)
+            smtp = smtplib.SMTP('127.0.0.1', server.port)
+            smtp.login('bench', 'bench')
+            smtp.sendmail(sender, to_email, msg.as_string())
+            smtp.quit()
+
+    def pooled_single(batch):
+        for email in batch:
+            utils.send_email_with_qr(*email)
+
+    def pooled_bulk(batch):
+        utils.send_bulk_emails(batch)
+
+    print(f"messages={args.messages} latency={args.latency * 1000:.0f}ms qr={'yes' if qr_png else 'no'}")
+    print(f"{'mode':<22} {'seconds':>8} {'msgs/s':>9} {'connections':>12}")
+    for name, run in (('per-mail connection', per_mail_connection),
+                      ('pooled send_email', pooled_single),
+                      ('pooled bulk send', pooled_bulk)):
+        utils.get_smtp_pool().close()
+        connections_before = server.connections
+        received_before = len(server.messages)
+        batch = emails()
+
+        started = time.perf_counter()
+        run(batch)
+        elapsed = time.perf_counter() - started
+
+        received = len(server.messages) - received_before
+        assert received == args.messages, f"{name}: expected {args.messages} messages, got {received}"
+        print(f"{name:<22} {elapsed:>8.3f} {received / elapsed:>9.1f} {server.connections - connections_before:>12}")
+
+    utils.get_smtp_pool().close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
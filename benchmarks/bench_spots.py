@@ -0,0 +1,136 @@
+"""Provisioning and removing spots in bulk, as add_lot and edit_lot do.
+
+Times creating a lot of N spots, growing it by N and shrinking it back, the
+old way (one ORM object per spot, one reservation lookup per spot when
+shrinking) and through utils.inventory.add_spots / remove_unused_spots.
+Every tenth spot has a reservation, so shrinking has to skip those. After
+each run the lot's counters are checked against its spots. Run from the
+project root:
+
+    python -m benchmarks.bench_spots --sizes 10000,50000
+    python -m benchmarks.bench_spots --database-url postgresql://...
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from benchmarks.bench_booking import build_app
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+from utils.inventory import add_spots, remove_unused_spots, adjust_lot_counters
+
+
+def orm_add(lot_id, count):
+    for _ in range(count):
+        db.session.add(ParkingSpot(lot_id=lot_id, status='A'))
+    adjust_lot_counters(lot_id, total=count, available=count)
+
+
+def orm_remove(lot_id, count):
+    lot = db.session.get(ParkingLot, lot_id)
+    available_spots = []
+    for spot in lot.spots:
+        if spot.status == 'A':
+            if not Reservation.query.filter_by(spot_id=spot.id).first():
+                available_spots.append(spot)
+    if count > len(available_spots):
+        return False
+    for spot in available_spots[:count]:
+        db.session.delete(spot)
+    adjust_lot_counters(lot_id, total=-count, available=-count)
+    return True
+
+
+def book_every_tenth(lot_id, user_id):
+    spot_ids = db.session.execute(select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id)).scalars().all()
+    now = datetime.utcnow()
+    db.session.execute(Reservation.__table__.insert(), [
+        {'spot_id': spot_id, 'user_id': user_id, 'vehicle_number': 'BENCH', 'parking_time': now,
+         'planned_start_time': now, 'leaving_time': now}
+        for spot_id in spot_ids[::10]
+    ])
+    db.session.commit()
+
+
+def counters_match(lot_id):
+    lot = db.session.get(ParkingLot, lot_id)
+    db.session.refresh(lot)
+    actual = db.session.execute(
+        select(func.count(ParkingSpot.id)).where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+    ).scalar()
+    total = db.session.execute(select(func.count(ParkingSpot.id)).where(ParkingSpot.lot_id == lot_id)).scalar()
+    return lot.spots_total == total and lot.spots_available == actual
+
+
+def run(method, size, user_id):
+    add, remove = (orm_add, orm_remove) if method == 'orm' else (add_spots, remove_unused_spots)
+    timings = {}
+
+    started = time.perf_counter()
+    lot = ParkingLot(prime_location_name=f'Garage {method} {size}', address='Bench Street', pin_code='000000',
+                     price_per_hour=10)
+    db.session.add(lot)
+    db.session.flush()
+    add(lot.id, size)
+    db.session.commit()
+    timings['create'] = time.perf_counter() - started
+    lot_id = lot.id
+
+    book_every_tenth(lot_id, user_id)
+
+    started = time.perf_counter()
+    add(lot_id, size)
+    db.session.commit()
+    timings['grow'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    removed = remove(lot_id, size)
+    db.session.commit()
+    timings['shrink'] = time.perf_counter() - started
+
+    db.session.expunge_all()
+    return timings, removed and counters_match(lot_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,50000', help='Comma-separated spots per lot.')
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    tmp_path = None
+    database_url = args.database_url
+    if not database_url:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        database_url = f'sqlite:///{tmp_path}'
+
+    app = build_app(database_url)
+    failures = 0
+    print(f"{'spots':>7} {'method':<6} {'create s':>9} {'grow s':>9} {'shrink s':>9}  counters")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='spots@parkease.test', password='x', fullname='Spots', address='Bench Street', pincode='000000')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        for size in [int(s) for s in args.sizes.split(',')]:
+            for method in ('orm', 'bulk'):
+                timings, ok = run(method, size, user_id)
+                failures += 0 if ok else 1
+                print(f"{size:>7} {method:<6} {timings['create']:>9.2f} {timings['grow']:>9.2f} "
+                      f"{timings['shrink']:>9.2f}  {'ok' if ok else 'MISMATCH'}")
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
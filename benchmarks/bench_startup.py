@@ -0,0 +1,124 @@
+"""Worker startup: importing the app and serving its first request.
+
+Prepares a database once with init_db() (what `flask init-db` runs), then
+starts fresh interpreters the way each gunicorn worker does. Each one
+imports app and times GET /login as its first request. Prints the median
+import time and time to first response, the slowest packages app imports
+(from -X importtime), and what each interpreter had loaded. Fails if
+importing the app:
+- runs any SQL or opens a database connection;
+- loads qrcode, PIL, numpy, smtplib or email.mime, which only QR
+  rendering, batch pricing and sending mail need.
+Run from the project root:
+
+    python -m benchmarks.bench_startup --runs 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+LAZY_MODULES = ['qrcode', 'PIL', 'numpy', 'smtplib', 'email.mime']
+
+WORKER = '''
+import json, sys, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+statements, connections = [], []
+event.listen(Engine, 'before_cursor_execute', lambda *a: statements.append(1))
+event.listen(Pool, 'connect', lambda *a: connections.append(1))
+
+started = time.perf_counter()
+import app as parkease
+imported = time.perf_counter()
+lazy = {lazy!r}
+loaded_at_import = [name for name in lazy if name in sys.modules]
+import_statements, import_connections = len(statements), len(connections)
+
+status = parkease.app.test_client().get('/login').status_code
+first_response = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_response - imported) * 1000,
+    'status': status,
+    'statements': import_statements,
+    'connections': import_connections,
+    'loaded_at_import': loaded_at_import,
+    'same_app': parkease.create_app() is parkease.app,
+}}))
+'''.format(lazy=LAZY_MODULES)
+
+
+def run_worker(env, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', WORKER], env=env, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, count):
+    # -X importtime lists "self | cumulative | package" with a package's
+    # imports indented two more spaces and listed just before it
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = len(name) - len(name.lstrip())
+        if depth == 3:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 1:
+            if name.strip() == 'app':
+                return sorted(children, reverse=True)[:count]
+            children = []
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', SECRET_KEY='bench', QR_SIGNING_KEYS='bench',
+               QR_CACHE_DIR='')
+    subprocess.run([sys.executable, '-c', 'import app\nwith app.app.app_context(): app.init_db()'],
+                   env=env, check=True, capture_output=True)
+
+    runs = [run_worker(env)[0] for _ in range(args.runs)]
+    failures = 0
+    print(f"{args.runs} fresh workers")
+    print(f"import app          {statistics.median(r['import_ms'] for r in runs):>8.1f} ms (median)")
+    print(f"first request       {statistics.median(r['first_request_ms'] for r in runs):>8.1f} ms (median)")
+    print(f"import to response  {statistics.median(r['import_ms'] + r['first_request_ms'] for r in runs):>8.1f} ms")
+
+    _, stderr = run_worker(env, '-X', 'importtime')
+    print("slowest imports under app:")
+    for ms, name in slowest_imports(stderr, 6):
+        print(f"  {name:<26} {ms:>8.1f} ms")
+
+    checks = {
+        'first request served': all(r['status'] == 200 for r in runs),
+        'no SQL at import': all(r['statements'] == 0 for r in runs),
+        'no connection at import': all(r['connections'] == 0 for r in runs),
+        'create_app() is idempotent': all(r['same_app'] for r in runs),
+    }
+    loaded = sorted({name for r in runs for name in r['loaded_at_import']})
+    checks[f"lazy imports ({', '.join(LAZY_MODULES)})"] = not loaded
+    for name, ok in checks.items():
+        failures += 0 if ok else 1
+        print(f"{name:<58} {'ok' if ok else 'FAILED'}")
+    if loaded:
+        print(f"loaded at import: {', '.join(loaded)}")
+
+    os.remove(db_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
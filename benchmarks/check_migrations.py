@@ -0,0 +1,179 @@
+"""Migrating a database created before the migration runner existed.
+
+Builds the four tables the original models created (no counters, versions,
+check-in, archive or ledger), fills them with a lot whose spots are free,
+parked and previously used, and runs init_db() (what `flask init-db`
+runs). Every migration has to work against the columns that exist when it
+runs, not the ones the models declare today. Fails unless:
+- every migration applies, and a second run applies none;
+- every table and column the models declare exists afterwards;
+- every row survives, the lot counters match its spots and the parked
+  reservation counts as checked in;
+- the migrated database serves the dashboards, releases the parked
+  reservation and takes a new booking.
+Run from the project root:
+
+    python -m benchmarks.check_migrations
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect, select, text
+
+# The schema db.create_all() built from the original models on SQLite
+PRE_MIGRATION_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER NOT NULL,
+        email VARCHAR(100) NOT NULL,
+        password VARCHAR(255) NOT NULL,
+        fullname VARCHAR(100) NOT NULL,
+        address TEXT NOT NULL,
+        pincode VARCHAR(10) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        UNIQUE (email)
+    )''',
+    '''CREATE TABLE parking_lots (
+        id INTEGER NOT NULL,
+        prime_location_name VARCHAR(100) NOT NULL,
+        address TEXT NOT NULL,
+        pin_code VARCHAR(10) NOT NULL,
+        price_per_hour FLOAT NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY (id)
+    )''',
+    '''CREATE TABLE parking_spots (
+        id INTEGER NOT NULL,
+        lot_id INTEGER NOT NULL,
+        status VARCHAR(1) NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(lot_id) REFERENCES parking_lots (id)
+    )''',
+    '''CREATE TABLE reservations (
+        id INTEGER NOT NULL,
+        spot_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        vehicle_number VARCHAR(20) NOT NULL,
+        parking_time DATETIME NOT NULL,
+        leaving_time DATETIME,
+        planned_start_time DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(spot_id) REFERENCES parking_spots (id),
+        FOREIGN KEY(user_id) REFERENCES users (id)
+    )''',
+]
+
+
+def seed(conn, now):
+    conn.execute(text(
+        "INSERT INTO users (id, email, password, fullname, address, pincode, role, created_at, updated_at) "
+        "VALUES (1, 'old@parkease.test', 'x', 'Old User', 'Bench Street', '000000', 'user', :now, :now)"
+    ), {'now': now})
+    conn.execute(text(
+        "INSERT INTO parking_lots (id, prime_location_name, address, pin_code, price_per_hour, created_at) "
+        "VALUES (1, 'Old Lot', 'Bench Street', '000000', 10, :now)"
+    ), {'now': now})
+    for spot_id, status in ((1, 'A'), (2, 'O'), (3, 'A'), (4, 'A')):
+        conn.execute(text(
+            "INSERT INTO parking_spots (id, lot_id, status, created_at) VALUES (:id, 1, :status, :now)"
+        ), {'id': spot_id, 'status': status, 'now': now})
+    # Spot 2 is parked; spot 3 was used and released
+    conn.execute(text(
+        "INSERT INTO reservations (id, spot_id, user_id, vehicle_number, parking_time, leaving_time) VALUES "
+        "(1, 3, 1, 'OLD1', :earlier, :later), (2, 2, 1, 'OLD2', :later, NULL)"
+    ), {'earlier': now - timedelta(hours=5), 'later': now - timedelta(hours=2)})
+
+
+def main():
+    fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, Reservation, RevenueEntry
+    from utils.inventory import reconcile_lot_counters
+    from utils.migrations import MIGRATIONS, migrate
+
+    app = parkease.app
+    now = datetime.now().replace(microsecond=0)
+    checks = {}
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for ddl in PRE_MIGRATION_SCHEMA:
+                conn.execute(text(ddl))
+            seed(conn, now)
+
+        try:
+            applied = parkease.init_db(log=lambda message: None)
+        except Exception as e:
+            print(f"init_db failed: {type(e).__name__}: {e}")
+            os.remove(db_path)
+            return 1
+        checks['every migration applied'] = applied == [version for version, _, _ in MIGRATIONS]
+        checks['second run applies none'] = migrate(log=lambda message: None) == []
+
+        inspector = inspect(db.engine)
+        missing = [
+            f'{table.name}.{column.name}'
+            for table in db.metadata.sorted_tables
+            for column in table.columns
+            if not inspector.has_table(table.name)
+            or column.name not in {c['name'] for c in inspector.get_columns(table.name)}
+        ]
+        checks['every model column exists'] = not missing
+
+        checks['every row kept'] = (
+            db.session.execute(select(func.count()).select_from(Reservation)).scalar() == 2
+            and db.session.get(ParkingLot, 1) is not None
+        )
+        lot = db.session.get(ParkingLot, 1)
+        checks['lot counters match its spots'] = (
+            (lot.spots_total, lot.spots_available, lot.spots_occupied) == (4, 3, 1)
+            and reconcile_lot_counters(fix=False) == []
+        )
+        checks['parked reservation checked in'] = db.session.get(Reservation, 2).checked_in_at is not None
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+
+    def client(uid, role):
+        c = app.test_client()
+        with c.session_transaction() as sess:
+            sess['user_id'] = uid
+            sess['role'] = role
+            sess['user_name'] = 'Migrated'
+        return c
+
+    driver, admin = client(1, 'user'), client(admin_id, 'admin')
+    checks['admin dashboard served'] = admin.get('/admin_dashboard').status_code == 200
+    checks['user dashboard served'] = driver.get('/dashboard').status_code == 200
+    # The parked reservation from before the migrations releases and is charged
+    driver.post('/release/2')
+    with app.app_context():
+        checks['old reservation released'] = (
+            db.session.get(Reservation, 2).leaving_time is not None
+            and RevenueEntry.query.filter_by(reservation_id=2).count() == 1
+        )
+    driver.post('/book/1/1', data={
+        'vehicle_number': 'NEW1', 'booking_date': now.strftime('%d-%m-%Y'), 'booking_time': now.strftime('%H:%M'),
+    })
+    with app.app_context():
+        booked = Reservation.query.filter_by(vehicle_number='NEW1').first()
+        checks['booking taken'] = booked is not None and booked.id > 2 and reconcile_lot_counters(fix=False) == []
+
+    failures = 0
+    for name, ok in checks.items():
+        failures += 0 if ok else 1
+        print(f"{name:<32} {'ok' if ok else 'FAILED'}")
+    if missing:
+        print(f"missing columns: {', '.join(missing)}")
+
+    os.remove(db_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Agreement between the scalar and vectorised pricing APIs, and their speed.
+
+Prices random reservations with utils.pricing.charge() one at a time and with
+charges() in one call, and exits non-zero if any amount differs. Besides
+uniformly random windows the generator deliberately hits the edges: releases
+exactly on an hour boundary, a microsecond either side of one, exactly at the
+planned start, before it (cancellations), and prices whose quarter or
+multiples land on a half paisa. Run from the project root:
+
+    python -m benchmarks.check_pricing --rows 200000
+    python -m benchmarks.check_pricing --rows 5000000 --seed 7
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.pricing import charge, charges
+
+
+PRICES = [10, 20, 30, 50, 0.01, 0.02, 0.1, 1.05, 2.675, 10.1, 12.345, 99.99, 149.5]
+
+
+def random_rows(n, rng):
+    base = datetime(2025, 1, 1)
+    prices, starts, ends = [], [], []
+    for _ in range(n):
+        start = base + timedelta(seconds=rng.randrange(365 * 86400), microseconds=rng.randrange(10 ** 6))
+        kind = rng.randrange(6)
+        if kind == 0:
+            end = start + timedelta(hours=rng.randint(0, 48))
+        elif kind == 1:
+            end = start + timedelta(hours=rng.randint(1, 48), microseconds=rng.choice([-1, 1]))
+        elif kind == 2:
+            end = start - timedelta(seconds=rng.randint(1, 86400))
+        elif kind == 3:
+            end = start + timedelta(microseconds=rng.randint(-2, 2))
+        else:
+            end = start + timedelta(seconds=rng.uniform(0, 7 * 86400))
+        price = rng.choice(PRICES) if rng.random() < 0.7 else round(rng.uniform(0.01, 500), rng.randint(0, 3))
+        prices.append(price)
+        starts.append(start)
+        ends.append(end)
+    return prices, starts, ends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    prices, starts, ends = random_rows(args.rows, random.Random(args.seed))
+
+    started = time.perf_counter()
+    scalar = [charge(p, s, e) for p, s, e in zip(prices, starts, ends)]
+    scalar_s = time.perf_counter() - started
+
+    start_array = np.array(starts, dtype='datetime64[us]')
+    end_array = np.array(ends, dtype='datetime64[us]')
+    price_array = np.array(prices, dtype=np.float64)
+    started = time.perf_counter()
+    vector = charges(price_array, start_array, end_array)
+    vector_s = time.perf_counter() - started
+
+    mismatches = [i for i, (a, b) in enumerate(zip(scalar, vector.tolist())) if a != b]
+    print(f"{args.rows} rows")
+    print(f"scalar charge():      {scalar_s * 1000:9.1f} ms ({args.rows / scalar_s:,.0f} rows/s)")
+    print(f"vectorised charges(): {vector_s * 1000:9.1f} ms ({args.rows / vector_s:,.0f} rows/s)")
+    print(f"mismatches: {len(mismatches)}")
+    for i in mismatches[:10]:
+        print(f"  price={prices[i]!r} start={starts[i]} end={ends[i]} scalar={scalar[i]!r} vector={vector[i]!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
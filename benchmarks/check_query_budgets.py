@@ -0,0 +1,157 @@
+"""SQL statement budgets for the admin (and busiest user) routes.
+
+Seeds a throwaway database, requests each route through the Flask test client
+and counts the SQL statements it issues. Exits non-zero if any route goes over
+its budget, so an N+1 regression fails the build. The data set is seeded at
+two sizes; a route whose count grows with the data has an N+1 even if it is
+still under budget. Run from the project root:
+
+    python -m benchmarks.check_query_budgets
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+
+# Maximum statements per request. Lower these when a route gets cheaper.
+QUERY_BUDGETS = {
+    'admin_dashboard': 5,
+    'admin_summary': 2,
+    'admin_search_by_id': 2,
+    'admin_search_by_name': 2,
+    'view_users': 2,  # one page of users, and the total
+    'spot_details': 4,
+    'scan_release': 3,
+    'admin_release': 3,
+    'edit_lot': 1,
+    'delete_lot_confirm': 1,
+    'user_dashboard': 2,  # one page of reservations, and the counts
+    'user_summary': 1,
+}
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect the SQL statements executed on engine inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def seed(db, models, lots, spots_per_lot, active_reservations):
+    User, ParkingLot, ParkingSpot, Reservation = models
+    user = User(email=f'budget{lots}@parkease.test', password='x', fullname=f'Budget User {lots}',
+                address='Budget Street', pincode='000000')
+    db.session.add(user)
+
+    lot_objs = []
+    for i in range(lots):
+        lot = ParkingLot(prime_location_name=f'Budget Lot {lots}-{i}', address='Budget Street', pin_code='560001',
+                         price_per_hour=10, spots_total=spots_per_lot, spots_available=spots_per_lot)
+        lot.spots = [ParkingSpot(status='A') for _ in range(spots_per_lot)]
+        lot_objs.append(lot)
+    db.session.add_all(lot_objs)
+    db.session.flush()
+
+    start = datetime.utcnow() - timedelta(hours=2)
+    for i in range(active_reservations):
+        lot = lot_objs[i % lots]
+        spot = lot.spots[i // lots]
+        spot.status = 'O'
+        lot.spots_available -= 1
+        lot.spots_occupied += 1
+        db.session.add(Reservation(spot=spot, user=user, vehicle_number=f'KA01{i:04d}',
+                                   parking_time=start, planned_start_time=start,
+                                   planned_end_time=start + timedelta(hours=4), checked_in_at=start))
+        db.session.add(Reservation(spot=lot.spots[-1], user=user, vehicle_number=f'KA02{i:04d}',
+                                   parking_time=start - timedelta(days=1), planned_start_time=start - timedelta(days=1),
+                                   planned_end_time=start - timedelta(hours=20), checked_in_at=start - timedelta(days=1),
+                                   leaving_time=start - timedelta(hours=20)))
+    db.session.commit()
+    return user, lot_objs
+
+
+def measure(db, Reservation, client, user, lots):
+    reservation = Reservation.query.filter_by(user_id=user.id, leaving_time=None).first()
+    lot = lots[0]
+
+    requests = {
+        'admin_dashboard': ('admin', '/admin_dashboard'),
+        'admin_summary': ('admin', '/admin_summary'),
+        'admin_search_by_id': ('admin', f'/admin_search?search_query={user.id}&search_by=user_id'),
+        'admin_search_by_name': ('admin', f'/admin_search?search_query={user.fullname}&search_by=username'),
+        'view_users': ('admin', '/view_users'),
+        'spot_details': ('admin', f'/spot_details/{reservation.spot_id}'),
+        'scan_release': ('admin', f'/scan_release/{reservation.spot_id}'),
+        'admin_release': ('admin', f'/admin_release/{reservation.id}'),
+        'edit_lot': ('admin', f'/edit_lot/{lot.id}'),
+        'delete_lot_confirm': ('admin', f'/delete_lot_confirm/{lot.id}'),
+        'user_dashboard': ('user', '/dashboard'),
+        'user_summary': ('user', '/user_summary'),
+    }
+
+    counts = {}
+    for name, (role, url) in requests.items():
+        with client.session_transaction() as sess:
+            sess['user_id'] = user.id if role == 'user' else 1
+            sess['role'] = role
+            sess['user_name'] = 'Budget'
+
+        db.session.remove()
+        with count_queries(db.engine) as statements:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise SystemExit(f"{name}: {url} returned {response.status_code}")
+        counts[name] = len(statements)
+    return counts
+
+
+def main():
+    fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    client = app.test_client()
+    models = (User, ParkingLot, ParkingSpot, Reservation)
+
+    results = {}
+    with app.app_context():
+        for label, size in (('small', (3, 4, 2)), ('large', (30, 40, 12))):
+            user, lots = seed(db, models, *size)
+            results[label] = measure(db, Reservation, client, user, lots)
+
+    failed = False
+    print(f"{'route':<22} {'budget':>6} {'small':>6} {'large':>6}")
+    for name, budget in QUERY_BUDGETS.items():
+        small, large = results['small'][name], results['large'][name]
+        status = ''
+        if large > budget or small > budget:
+            status = 'OVER BUDGET'
+        elif large != small:
+            status = 'GROWS WITH DATA'
+        failed = failed or bool(status)
+        print(f"{name:<22} {budget:>6} {small:>6} {large:>6} {status}")
+
+    os.remove(db_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Query plans of the hot queries: they must use the indexes meant for them.
+
+Seeds a throwaway database through the migrations, runs each hot code path
+(the real routes and helpers, not copies of their SQL), captures the SELECTs
+it issues and asks the database for their plans. A check fails if any of its
+statements scans reservations or parking_spots in full, or if the index it
+is meant to use appears in none of its plans. Exits non-zero on failure, so
+a dropped index or a query rewritten past its index fails the build. Run from
+the project root:
+
+    python -m benchmarks.check_query_plans
+    python -m benchmarks.check_query_plans --database-url postgresql://... -v
+
+On PostgreSQL sequential scans are disabled for the session, so the check
+asks "can this query use an index" rather than depending on table sizes.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+
+
+HOT_TABLES = ('reservations', 'reservations_archive', 'parking_spots')
+
+
+@contextmanager
+def capture_selects(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _postgres_nodes(node):
+    relation = node.get('Relation Name')
+    index = node.get('Index Name')
+    line = node['Node Type']
+    if index:
+        line += f' using {index}'
+    if relation:
+        line += f' on {relation}'
+    yield line
+    for child in node.get('Plans', []):
+        yield from _postgres_nodes(child)
+
+
+def explain(engine, statement, parameters):
+    """The plan of one statement as a list of lines."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.exec_driver_sql('SET enable_seqscan = off')
+            result = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+            plan = result if isinstance(result, list) else json.loads(result)
+            return list(_postgres_nodes(plan[0]['Plan']))
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+def full_scans(lines):
+    scans = []
+    for line in lines:
+        for table in HOT_TABLES:
+            # SQLite: "SCAN reservations" (a "SCAN ... USING INDEX" walks an index)
+            # PostgreSQL: "Seq Scan on reservations"
+            if (line.startswith(f'SCAN {table}') and 'INDEX' not in line) or line == f'Seq Scan on {table}':
+                scans.append(line)
+    return scans
+
+
+def sorts_rows(lines):
+    # A page read in index order stops after per_page + 1 rows; one that sorts
+    # has to read every matching row first
+    return [line for line in lines if 'TEMP B-TREE FOR ORDER BY' in line or line.startswith('Sort')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every captured statement and its plan.')
+    args = parser.parse_args()
+
+    tmp_path = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{tmp_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingSpot, Reservation
+    from utils.archive import archive_reservations
+    from utils.billing import lot_usage
+    from utils.gate import gate_snapshot, log_gate_changes
+    from utils.intervals import SpotIntervalIndex
+    from utils.inventory import reserve_spot, _has_overlap
+    from utils.pagination import encode_cursor
+    from utils.seed import seed_data
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+    with app.app_context():
+        seed_data(users=2000, lots=20, spots=2000, reservations=20000, log=lambda message: None)
+        archive_reservations(log=lambda message: None)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        engine = db.engine
+
+        active = db.session.execute(
+            select(Reservation).where(Reservation.leaving_time.is_(None), Reservation.checked_in_at.isnot(None)).limit(1)
+        ).scalar()
+        user_id, spot_id = active.user_id, active.spot_id
+        # Resume from the user's oldest reservations and from the middle of the user list
+        oldest = db.session.execute(
+            select(Reservation.parking_time, Reservation.id).where(Reservation.user_id == user_id)
+            .order_by(Reservation.parking_time, Reservation.id).limit(1)
+        ).one()
+        history_cursor = encode_cursor(oldest, 'next')
+        users_cursor = encode_cursor((1000,), 'next')
+        lot_id = db.session.get(ParkingSpot, spot_id).lot_id
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+        now = datetime.now()
+
+    def client(uid, role):
+        c = app.test_client()
+        with c.session_transaction() as sess:
+            sess['user_id'] = uid
+            sess['role'] = role
+            sess['user_name'] = 'Plans'
+        return c
+
+    def gate_delta():
+        log_gate_changes([(lot_id, active.id)])
+        gate_snapshot(lot_id, since=0)
+
+    def in_rollback(fn):
+        def run():
+            with app.app_context():
+                fn()
+                db.session.rollback()
+        return run
+
+    # (name, code path, indexes its plans must use, whether it may sort)
+    checks = [
+        ('user dashboard', lambda: client(user_id, 'user').get('/dashboard'),
+         ['ix_reservations_user_parking', 'ix_reservations_user_leaving'], False),
+        ('user dashboard, deep page', lambda: client(user_id, 'user').get(f'/dashboard?cursor={history_cursor}'),
+         ['ix_reservations_user_parking'], False),
+        ('user list, deep page', lambda: client(admin_id, 'admin').get(f'/view_users?cursor={users_cursor}'),
+         [], False),
+        ('user summary', in_rollback(lambda: lot_usage(user_id)),
+         ['ix_reservations_user_leaving'], True),
+        ('user summary, archived', in_rollback(lambda: lot_usage(user_id, include_archived=True)),
+         ['ix_reservations_user_leaving', 'ix_reservations_archive_user_leaving'], True),
+        ('spot overlap check', in_rollback(lambda: _has_overlap(spot_id, now, now + timedelta(hours=2))),
+         ['ix_reservations_active_spot'], True),
+        ('interval index load', in_rollback(lambda: SpotIntervalIndex()._load(lot_id)),
+         ['ix_parking_spots_lot_status', 'ix_reservations_active_spot'], True),
+        ('free spot for a booking', in_rollback(lambda: reserve_spot(lot_id, now, now + timedelta(hours=2), occupy=True)),
+         ['ix_parking_spots_lot_status'], True),
+        ('gate snapshot', in_rollback(lambda: gate_snapshot(lot_id)),
+         ['ix_parking_spots_lot_status', 'ix_reservations_active_spot'], True),
+        ('gate snapshot delta', in_rollback(gate_delta),
+         ['ix_gate_changes_lot_id'], False),
+        ('spot holder lookup', lambda: client(admin_id, 'admin').get(f'/spot_details/{spot_id}'),
+         ['ix_reservations_active_spot'], True),
+    ]
+
+    failures = 0
+    print(f"{'query':<28} {'statements':>10}  result")
+    for name, run, expected, may_sort in checks:
+        with capture_selects(engine) as statements:
+            run()
+        plans = [(statement, explain(engine, statement, parameters)) for statement, parameters in statements]
+        lines = [line for _, plan in plans for line in plan]
+        scans = full_scans(lines)
+        missing = [index for index in expected if not any(index in line for line in lines)]
+        sorts = [] if may_sort else sorts_rows(lines)
+
+        ok = bool(plans) and not scans and not missing and not sorts
+        failures += 0 if ok else 1
+        problems = ([f"full scan: {line}" for line in scans] + [f"unused index: {index}" for index in missing]
+                    + [f"sort: {line}" for line in sorts])
+        if not plans:
+            problems.append('no statements captured')
+        print(f"{name:<28} {len(plans):>10}  {'ok' if ok else '; '.join(problems)}")
+        if args.verbose or not ok:
+            for statement, plan in plans:
+                print('    ' + ' '.join(statement.split())[:160])
+                for line in plan:
+                    print('      ' + line)
+
+    if tmp_path:
+        os.remove(tmp_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
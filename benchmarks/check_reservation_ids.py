@@ -0,0 +1,127 @@
+"""Reservation ids are never handed out twice.
+
+Ledger entries, QR revocations and the gate log keep a reservation's id
+after its row is purged, so a reused id makes the new booking collide with
+the old one's history. Drives the app: book, release, delete that spot
+(purging the reservation), book again, and release the second booking.
+Then rebuilds reservations the way older SQLite databases had it (no
+AUTOINCREMENT), purges its newest row, runs migration 13 and checks the
+next id clears every id already used. Fails unless:
+- the second booking gets a new id and releases with its own ledger entry;
+- the migration keeps every row and index and adds AUTOINCREMENT;
+- a booking after the migration gets an id above every purged one.
+Run from the project root:
+
+    python -m benchmarks.check_reservation_ids
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.schema import CreateTable
+
+
+def main():
+    fd, db_path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import app as parkease
+    from models.models import db, User, ParkingLot, Reservation, RevenueEntry
+    from utils.inventory import add_spots
+    from utils.migrations import migrate, schema_migrations
+
+    app = parkease.app
+    with app.app_context():
+        parkease.init_db(log=lambda message: None)
+        user = User(email='ids@parkease.test', password='x', fullname='Ids', address='Bench Street',
+                    pincode='000000')
+        lot = ParkingLot(prime_location_name='Id Lot', address='Bench Street', pin_code='000000', price_per_hour=10)
+        db.session.add_all([user, lot])
+        db.session.flush()
+        add_spots(lot.id, 2)
+        db.session.commit()
+        user_id, lot_id = user.id, lot.id
+        admin_id = db.session.execute(select(User.id).where(User.role == 'admin')).scalar()
+
+    def client(uid, role):
+        c = app.test_client()
+        with c.session_transaction() as sess:
+            sess['user_id'] = uid
+            sess['role'] = role
+            sess['user_name'] = 'Ids'
+        return c
+
+    driver, admin = client(user_id, 'user'), client(admin_id, 'admin')
+
+    def book_and_release():
+        now = datetime.now()
+        driver.post(f'/book/{lot_id}/{user_id}', data={
+            'vehicle_number': 'IDS', 'booking_date': now.strftime('%d-%m-%Y'), 'booking_time': now.strftime('%H:%M'),
+        })
+        with app.app_context():
+            reservation = Reservation.query.filter_by(user_id=user_id).order_by(Reservation.id.desc()).first()
+            reservation_id, spot_id = reservation.id, reservation.spot_id
+        driver.post(f'/release/{reservation_id}')
+        with app.app_context():
+            released = db.session.get(Reservation, reservation_id).leaving_time is not None
+            charged = RevenueEntry.query.filter_by(reservation_id=reservation_id).count() == 1
+        return reservation_id, spot_id, released and charged
+
+    checks = {}
+    first_id, spot_id, ok = book_and_release()
+    checks['first booking released'] = ok
+    admin.post(f'/delete_spot_final/{spot_id}')
+    with app.app_context():
+        checks['its spot and reservation purged'] = db.session.get(Reservation, first_id) is None
+    second_id, _, ok = book_and_release()
+    checks['second booking gets a new id'] = second_id > first_id
+    checks['second booking released'] = ok
+
+    # An older SQLite database: the same table without AUTOINCREMENT
+    with app.app_context():
+        table = Reservation.__table__
+        with db.engine.begin() as conn:
+            legacy = str(CreateTable(table).compile(dialect=conn.dialect))
+            for index in table.indexes:
+                index.drop(conn)
+            conn.execute(text(legacy.replace('CREATE TABLE reservations ', 'CREATE TABLE reservations_legacy ', 1)
+                              .replace(' AUTOINCREMENT', '')))
+            conn.execute(text('INSERT INTO reservations_legacy SELECT * FROM reservations'))
+            conn.execute(text('DROP TABLE reservations'))
+            conn.execute(text('ALTER TABLE reservations_legacy RENAME TO reservations'))
+            for index in table.indexes:
+                index.create(conn)
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'reservations'"))
+            conn.execute(schema_migrations.delete().where(schema_migrations.c.version == 13))
+            # The newest reservation goes, leaving its ledger entry behind
+            conn.execute(delete(Reservation).where(Reservation.id == second_id))
+        rows = db.session.execute(select(func.count()).select_from(Reservation)).scalar()
+        applied = migrate(log=lambda message: None)
+        ddl = db.session.execute(text("SELECT sql FROM sqlite_master WHERE name = 'reservations'")).scalar()
+        indexes = set(db.session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'reservations'"
+        )).scalars())
+        checks['migration 13 applied'] = applied == [13]
+        checks['rebuilt with AUTOINCREMENT'] = 'AUTOINCREMENT' in ddl.upper()
+        checks['every row kept'] = db.session.execute(select(func.count()).select_from(Reservation)).scalar() == rows
+        checks['every index kept'] = {index.name for index in table.indexes} <= indexes
+
+    third_id, _, ok = book_and_release()
+    checks['next id above every purged one'] = third_id > second_id
+    checks['third booking released'] = ok
+
+    failures = 0
+    print(f"reservation ids: {first_id}, {second_id}, {third_id}")
+    for name, ok in checks.items():
+        failures += 0 if ok else 1
+        print(f"{name:<34} {'ok' if ok else 'FAILED'}")
+
+    os.remove(db_path)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
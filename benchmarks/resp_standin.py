@@ -0,0 +1,152 @@
+"""Minimal local Redis stand-in for exercising the shared fragment cache.
+
+Speaks enough RESP for utils.cache.RedisCache (PING, AUTH, SELECT, GET, MGET,
+SET with EX/PX, DEL, FLUSHDB, DBSIZE), keeps everything in memory and
+accepts any password. Point the app at it with:
+
+    FRAGMENT_CACHE_URL=redis://127.0.0.1:6380/0
+
+and run it standalone with:
+
+    python -m benchmarks.resp_standin --port 6380 [--latency 0.001]
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def reply(self, value):
+        self.wfile.write(encode(value))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, as typed into telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        db = 0
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            if not command:
+                continue
+            time.sleep(server.latency)
+            verb, args = command[0].decode().upper(), command[1:]
+            with server.lock:
+                server.commands += 1
+                store = server.databases.setdefault(db, {})
+                if verb == 'PING':
+                    self.reply('+PONG')
+                elif verb == 'AUTH':
+                    self.reply('+OK')
+                elif verb == 'SELECT':
+                    db = int(args[0])
+                    self.reply('+OK')
+                elif verb == 'GET':
+                    self.reply(server.get(store, args[0]))
+                elif verb == 'MGET':
+                    self.reply([server.get(store, key) for key in args])
+                elif verb == 'SET':
+                    expires = None
+                    options = [arg.decode().upper() for arg in args[2:]]
+                    for option, value in zip(options, options[1:]):
+                        if option == 'EX':
+                            expires = time.monotonic() + int(value)
+                        elif option == 'PX':
+                            expires = time.monotonic() + int(value) / 1000
+                    store[args[0]] = (args[1], expires)
+                    self.reply('+OK')
+                elif verb == 'DEL':
+                    self.reply(sum(1 for key in args if store.pop(key, None) is not None))
+                elif verb == 'FLUSHDB':
+                    store.clear()
+                    self.reply('+OK')
+                elif verb == 'DBSIZE':
+                    self.reply(len(store))
+                else:
+                    self.reply(f"-ERR unknown command '{verb}'")
+
+
+def encode(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, str):
+        # '+OK' and '-ERR ...' are sent as they are
+        return f"{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b''.join(encode(item) for item in value)
+    return f"${len(value)}\r\n".encode() + value + b'\r\n'
+
+
+class StandinRESPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__((host, port), RESPHandler)
+        self.latency = latency
+        self.databases = {}
+        self.connections = 0
+        self.commands = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def url(self):
+        return f"redis://{self.server_address[0]}:{self.port}/0"
+
+    def get(self, store, key):
+        entry = store.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del store[key]
+            return None
+        return value
+
+    def start(self):
+        """Serve from a daemon thread and return self, for use inside scripts."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6380)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to stall on every command, to mimic a remote cache')
+    args = parser.parse_args()
+
+    server = StandinRESPServer(args.host, args.port, args.latency).start()
+    print(f"RESP stand-in listening on {server.url}")
+    try:
+        while True:
+            time.sleep(5)
+            keys = sum(len(store) for store in server.databases.values())
+            print(f"{server.connections} connection(s), {server.commands} command(s), {keys} key(s)")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Minimal local SMTP server for exercising email delivery without a real relay.
+
+Accepts any AUTH credentials, never offers STARTTLS and keeps received
+messages in memory. Point the app at it with:
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_USE_TLS=false
+    SENDER_EMAIL=noreply@parkease.test BREVO_LOGIN=test SENDER_PASSWORD=test
+
+and run it standalone with:
+
+    python -m benchmarks.smtp_standin --port 1025 [--latency 0.2]
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        time.sleep(server.latency)
+        self.send("220 parkease-standin ESMTP")
+
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            verb = line.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b"250-parkease-standin\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == 'AUTH':
+                parts = line.split()
+                if len(parts) == 2 and parts[1].upper() == 'LOGIN':
+                    self.send("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.send("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                time.sleep(server.latency)
+                self.send("235 2.7.0 Authentication successful")
+            elif verb == 'MAIL':
+                mail_from, rcpt_to = line[10:].strip(), []
+                self.send("250 OK")
+            elif verb == 'RCPT':
+                rcpt_to.append(line[8:].strip())
+                self.send("250 OK")
+            elif verb == 'DATA':
+                self.send("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data.append(chunk)
+                with server.lock:
+                    server.messages.append((mail_from, rcpt_to, b''.join(data)))
+                self.send("250 OK queued")
+            elif verb in ('RSET', 'NOOP'):
+                mail_from, rcpt_to = None, []
+                self.send("250 OK")
+            elif verb == 'QUIT':
+                self.send("221 Bye")
+                return
+            else:
+                self.send("502 Command not implemented")
+
+
+class StandinSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__((host, port), SMTPHandler)
+        self.latency = latency
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve from a daemon thread and return self, for use inside scripts."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to stall on connect and AUTH, to mimic a remote relay')
+    args = parser.parse_args()
+
+    server = StandinSMTPServer(args.host, args.port, args.latency).start()
+    print(f"SMTP stand-in listening on {args.host}:{server.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{server.connections} connection(s), {len(server.messages)} message(s) received")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -30,25 +30,37 @@ class ParkingLot(db.Model):
     price_per_hour = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
     
+    # Denormalized spot counters, kept in step with parking_spots by utils.inventory
+    spots_total = db.Column(db.Integer, default=0, nullable=False)
+    spots_available = db.Column(db.Integer, default=0, nullable=False)
+    spots_occupied = db.Column(db.Integer, default=0, nullable=False)
+    # Bumped with every change to the lot or its spots; keys cached dashboard fragments
+    version = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Optional WGS84 coordinates for nearest-lot search
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    
     spots = db.relationship('ParkingSpot', backref='lot', lazy=True, cascade='all, delete-orphan')
     
     @property
     def total_spots(self):
-        return len(self.spots)
+        return self.spots_total
     
     @property
     def available_spots_count(self):
-        return len([s for s in self.spots if s.status == 'A'])
+        return self.spots_available
     
     @property
     def occupied_spots_count(self):
-        return len([s for s in self.spots if s.status == 'O'])
+        return self.spots_occupied
     
     def __repr__(self):
         return f'<ParkingLot {self.prime_location_name}>'
 
 class ParkingSpot(db.Model):
     __tablename__ = 'parking_spots'
+    __table_args__ = (db.Index('ix_parking_spots_lot_status', 'lot_id', 'status'),)
     
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
@@ -62,14 +74,31 @@ class ParkingSpot(db.Model):
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_user_leaving', 'user_id', 'leaving_time'),
+        # A user's reservations newest first, paged by (parking_time, id)
+        db.Index('ix_reservations_user_parking', 'user_id', 'parking_time', 'id'),
+        # Partial index over active reservations only: overlap checks and
+        # "who holds this spot" lookups never look at completed ones
+        db.Index('ix_reservations_active_spot', 'spot_id', 'planned_start_time',
+                 sqlite_where=db.text('leaving_time IS NULL'),
+                 postgresql_where=db.text('leaving_time IS NULL')),
+        # Ledger entries, revocations and the gate log outlive the row under
+        # its id, so a purged id must never be handed out again
+        {'sqlite_autoincrement': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     vehicle_number = db.Column(db.String(20), nullable=False)
     parking_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     leaving_time = db.Column(db.DateTime, nullable=True)
     planned_start_time = db.Column(db.DateTime, nullable=True)
+    # Booked window is [planned_start_time, planned_end_time); the spot is only
+    # occupied once the driver checks in
+    planned_end_time = db.Column(db.DateTime, nullable=True)
+    checked_in_at = db.Column(db.DateTime, nullable=True)
     
     user = db.relationship('User', backref='reservations', lazy=True)
     
@@ -77,10 +106,128 @@ class Reservation(db.Model):
     def is_active(self):
         return self.leaving_time is None
     
+    @property
+    def is_checked_in(self):
+        return self.checked_in_at is not None
+    
     @property
     def duration_hours(self):
         end_time = self.leaving_time or datetime.utcnow()
         return (end_time - self.parking_time).total_seconds() / 3600
     
     def __repr__(self):
-        return f'<Reservation {self.id}>'
\ No newline at end of file
+        return f'<Reservation {self.id}>'
+
+class ArchivedReservation(db.Model):
+    """A completed reservation moved out of the live table by utils.archive.
+
+    Same columns as Reservation, under the same id, so ledger entries keep
+    pointing at it.
+    """
+    __tablename__ = 'reservations_archive'
+    __table_args__ = (
+        db.Index('ix_reservations_archive_user_leaving', 'user_id', 'leaving_time'),
+        db.Index('ix_reservations_archive_user_parking', 'user_id', 'parking_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spots.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    vehicle_number = db.Column(db.String(20), nullable=False)
+    parking_time = db.Column(db.DateTime, nullable=False)
+    leaving_time = db.Column(db.DateTime, nullable=False)
+    planned_start_time = db.Column(db.DateTime, nullable=True)
+    planned_end_time = db.Column(db.DateTime, nullable=True)
+    checked_in_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    is_active = False
+
+    @property
+    def is_checked_in(self):
+        return self.checked_in_at is not None
+
+    @property
+    def duration_hours(self):
+        return (self.leaving_time - self.parking_time).total_seconds() / 3600
+
+    def __repr__(self):
+        return f'<ArchivedReservation {self.id}>'
+
+class GateChange(db.Model):
+    """A reservation arriving in or leaving a lot's checked-in set, for scanner deltas."""
+    __tablename__ = 'gate_changes'
+    # The id is the snapshot version scanners sync from, so it must never be reused
+    __table_args__ = (
+        db.Index('ix_gate_changes_lot_id', 'lot_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Plain integers, not foreign keys: the log outlives the rows it mentions
+    lot_id = db.Column(db.Integer, nullable=False)
+    reservation_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<GateChange {self.id} lot {self.lot_id} reservation {self.reservation_id}>'
+
+class RevokedQRToken(db.Model):
+    __tablename__ = 'revoked_qr_tokens'
+    # Workers read new rows by id, so an id must never be reused after pruning
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, nullable=False)
+    # When the revoked code would have expired anyway; the row can go after
+    # that. Matching on it too keeps a reused reservation id from inheriting
+    # an old revocation.
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RevokedQRToken {self.reservation_id}>'
+
+class RevenueEntry(db.Model):
+    __tablename__ = 'revenue_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Plain integer, not a foreign key: the charge is history and outlives the reservation row
+    reservation_id = db.Column(db.Integer, unique=True, nullable=False)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False)
+    released_at = db.Column(db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<RevenueEntry {self.reservation_id} {self.amount}>'
+
+class RevenueRollup(db.Model):
+    __tablename__ = 'revenue_rollups'
+    __table_args__ = (db.UniqueConstraint('lot_id', 'day', name='uq_revenue_rollups_lot_day'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lots.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Float, default=0, nullable=False)
+    reservations = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<RevenueRollup {self.lot_id} {self.day}>'
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    qr_data = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(10), default='pending', nullable=False)  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status}>'
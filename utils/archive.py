@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, literal, union_all, DateTime
+
+from models.models import db, Reservation, ArchivedReservation
+
+
+# Completed reservations that ended longer ago than this move to the archive
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 5000
+
+# Columns copied as they are; archived_at is stamped by the archiver
+_COPIED = [column.name for column in ArchivedReservation.__table__.columns if column.name != 'archived_at']
+
+
+def archive_reservations(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, log=print):
+    """Move completed reservations that ended before the cutoff into reservations_archive.
+
+    Each batch is copied and deleted in one transaction, so a reservation is
+    always in exactly one of the two tables and the archiver can be stopped
+    and rerun at any point. Meant to run on a schedule (flask
+    archive-reservations from cron). Returns the number of reservations moved.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    # SQLite gives a new row max(id) + 1, so the newest reservation stays live
+    # and an archived id is never handed out again
+    newest = db.session.execute(select(func.max(Reservation.id))).scalar()
+    if newest is None:
+        return 0
+
+    live = Reservation.__table__
+    moved = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            select(Reservation.id)
+            .where(Reservation.id > last_id, Reservation.id < newest, Reservation.leaving_time < cutoff)
+            .order_by(Reservation.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        db.session.execute(
+            ArchivedReservation.__table__.insert().from_select(
+                _COPIED + ['archived_at'],
+                select(*[live.c[name] for name in _COPIED], literal(now, DateTime)).where(live.c.id.in_(ids)),
+            )
+        )
+        db.session.execute(
+            delete(Reservation).where(Reservation.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        moved += len(ids)
+        last_id = ids[-1]
+        log(f"Archived {moved} reservations (up to reservation {last_id})")
+
+    return moved
+
+
+def completed_reservations(user_id=None, include_archived=False):
+    """Completed reservations as a subquery, optionally with the archived ones.
+
+    Columns: id, spot_id, user_id, parking_time, planned_start_time and
+    leaving_time. The user filter is applied inside each branch so both
+    tables can use their (user_id, leaving_time) index.
+    """
+    def branch(model):
+        query = select(
+            model.id, model.spot_id, model.user_id, model.parking_time,
+            model.planned_start_time, model.leaving_time,
+        ).where(model.leaving_time.isnot(None))
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        return query
+
+    if not include_archived:
+        return branch(Reservation).subquery('completed')
+    return union_all(branch(Reservation), branch(ArchivedReservation)).subquery('completed')
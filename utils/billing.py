@@ -0,0 +1,92 @@
+from sqlalchemy import select, func, case, cast, extract, Date, Integer, Numeric, Float
+
+from models.models import db, ParkingLot, ParkingSpot
+from utils.archive import completed_reservations
+from utils.pricing import CANCELLATION_FRACTION
+
+
+# Durations under this many hours (a booking released right at its start)
+# are left out of usage totals, as the per-user charts always did.
+MIN_USAGE_HOURS = 0.01
+
+
+def duration_hours(start, end, dialect=None):
+    """SQL expression for the hours between two timestamp columns.
+
+    SQLite has no interval type, so the difference of julianday() values is
+    used; it resolves to about a millisecond. PostgreSQL's epoch extract is
+    exact to the microsecond.
+    """
+    dialect = dialect or db.engine.dialect.name
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 24.0
+    return cast(extract('epoch', end - start), Float) / 3600.0
+
+
+def ceil_hours(hours, dialect=None):
+    """SQL ceil() of a non-negative number of hours.
+
+    ceil() is only in SQLite builds with the math functions enabled, so there
+    it is spelled with an integer cast. Hours are rounded to the millisecond
+    first so julianday's float noise doesn't push an exact hour up by one.
+    """
+    dialect = dialect or db.engine.dialect.name
+    if dialect == 'sqlite':
+        hours = func.round(hours * 3600000) / 3600000.0
+        whole = cast(hours, Integer)
+        return whole + case((hours > whole, 1), else_=0)
+    return func.ceil(cast(hours, Numeric))
+
+
+def charge_amount(price_per_hour, start, end, dialect=None):
+    """SQL expression for utils.pricing.charge(), before rounding to the paisa."""
+    dialect = dialect or db.engine.dialect.name
+    return case(
+        (end < start, price_per_hour * CANCELLATION_FRACTION),
+        else_=ceil_hours(duration_hours(start, end, dialect), dialect) * price_per_hour,
+    )
+
+
+def day_of(timestamp, dialect=None):
+    """SQL expression for the calendar date of a timestamp column."""
+    dialect = dialect or db.engine.dialect.name
+    if dialect == 'sqlite':
+        # CAST(... AS DATE) has numeric affinity in SQLite and keeps only the year
+        return func.date(timestamp)
+    return cast(timestamp, Date)
+
+
+def lot_usage(user_id=None, include_archived=False):
+    """Completed reservations aggregated per lot in the database.
+
+    Returns one (lot_id, lot name, reservations, hours, revenue) row per lot
+    that has any completed reservation (for user_id's reservations only, if
+    given), ordered by lot id. Hours count only stays longer than
+    MIN_USAGE_HOURS; revenue is the ceil-hour charge summed over every
+    completed reservation. Archived reservations count only if
+    include_archived is set.
+    """
+    dialect = db.engine.dialect.name
+    completed = completed_reservations(user_id, include_archived)
+    start = func.coalesce(completed.c.planned_start_time, completed.c.parking_time)
+    hours = duration_hours(start, completed.c.leaving_time, dialect)
+    charge = charge_amount(ParkingLot.price_per_hour, start, completed.c.leaving_time, dialect)
+
+    query = (
+        select(
+            ParkingLot.id,
+            ParkingLot.prime_location_name,
+            func.count(completed.c.id),
+            func.coalesce(func.sum(case((hours > MIN_USAGE_HOURS, hours), else_=0)), 0),
+            func.coalesce(func.sum(charge), 0),
+        )
+        .join(ParkingSpot, ParkingSpot.lot_id == ParkingLot.id)
+        .join(completed, completed.c.spot_id == ParkingSpot.id)
+        .group_by(ParkingLot.id, ParkingLot.prime_location_name)
+        .order_by(ParkingLot.id)
+    )
+
+    return [
+        (lot_id, name, count, float(hours), round(float(revenue), 2))
+        for lot_id, name, count, hours, revenue in db.session.execute(query)
+    ]
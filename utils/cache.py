@@ -0,0 +1,200 @@
+import hashlib
+import os
+import socket
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from utils.metrics import metrics
+
+
+FRAGMENT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Versioned keys never go stale, so this only bounds how long a shared cache
+# keeps fragments for versions nobody asks for any more
+FRAGMENT_TTL_SECONDS = 24 * 3600
+
+
+class CacheError(Exception):
+    pass
+
+
+class LRUCache:
+    """In-process cache that evicts the least recently used entries past max_bytes.
+
+    Sizes are counted in characters of the cached strings. Each worker keeps
+    its own copy, so it is warm only for the requests that worker answered.
+    """
+
+    def __init__(self, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def set_many(self, mapping, ttl=None):
+        with self._lock:
+            for key, value in mapping.items():
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._size -= len(old)
+                if len(value) > self.max_bytes:
+                    continue
+                self._entries[key] = value
+                self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """Shared cache on a Redis server, or anything else that speaks RESP.
+
+    Only MGET and SET ... EX are needed, so this talks the protocol directly
+    over one socket per thread rather than pulling in a client library. A
+    connection or protocol error closes the socket and raises CacheError.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=0.5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        parts = urlsplit(url)
+        db = int(parts.path.lstrip('/') or 0)
+        return cls(parts.hostname or 'localhost', parts.port or 6379, db, parts.password, **kwargs)
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        values = self._pipeline([['MGET', *keys]])[0]
+        return {key: value.decode() for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, mapping, ttl=None):
+        if not mapping:
+            return
+        ttl_args = ['EX', str(ttl)] if ttl else []
+        self._pipeline([['SET', key, value, *ttl_args] for key, value in mapping.items()])
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._local.sock, self._local.reader = sock, sock.makefile('rb')
+        setup = ([['AUTH', self.password]] if self.password else []) + ([['SELECT', str(self.db)]] if self.db else [])
+        if setup:
+            self._pipeline(setup)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = self._local.reader = None
+
+    def _pipeline(self, commands):
+        """Send every command, then read one reply per command."""
+        try:
+            if getattr(self._local, 'sock', None) is None:
+                self._connect()
+            self._local.sock.sendall(b''.join(_encode(command) for command in commands))
+            replies = [self._read_reply() for _ in commands]
+        except (OSError, ValueError) as e:
+            self._close()
+            raise CacheError(f"{self.host}:{self.port}: {e}") from e
+        errors = [reply for reply in replies if isinstance(reply, CacheError)]
+        if errors:
+            raise errors[0]
+        return replies
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ValueError('connection closed')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return CacheError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ValueError('connection closed')
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ValueError(f"unexpected reply {line[:20]!r}")
+
+
+def _encode(command):
+    parts = [f"*{len(command)}\r\n".encode()]
+    for arg in command:
+        data = arg.encode() if isinstance(arg, str) else arg
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b''.join(parts)
+
+
+class FragmentCache:
+    """Rendered HTML fragments, looked up and stored many keys at a time.
+
+    Keys carry whatever makes a fragment stale (for a lot card, the lot's
+    version counter), so entries are never invalidated: a changed lot asks
+    for a new key and its old entry ages out of the backend. A backend that
+    fails counts as a miss, so pages are rendered in full rather than broken.
+    """
+
+    def __init__(self, backend=None, name='fragments', ttl=FRAGMENT_TTL_SECONDS):
+        self.backend = backend or LRUCache()
+        self.name = name
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        try:
+            found = self.backend.get_many(keys)
+        except CacheError as e:
+            print(f"Fragment cache error: {e}")
+            found = {}
+        metrics.record_cache_lookups(self.name, len(found), len(keys) - len(found))
+        return found
+
+    def set_many(self, mapping):
+        try:
+            self.backend.set_many(mapping, ttl=self.ttl)
+        except CacheError as e:
+            print(f"Fragment cache error: {e}")
+
+
+fragment_cache = FragmentCache()
+
+
+def init_fragment_cache():
+    """Use a shared RESP cache when FRAGMENT_CACHE_URL (redis://host:port/db) is set."""
+    url = os.getenv('FRAGMENT_CACHE_URL')
+    if url:
+        fragment_cache.backend = RedisCache.from_url(url)
+
+
+def template_digest(env, name):
+    """Short hash of a template's source, for keys that must change when the template does."""
+    source, _, _ = env.loader.get_source(env, name)
+    return hashlib.sha1(source.encode()).hexdigest()[:8]
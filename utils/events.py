@@ -0,0 +1,207 @@
+import json
+import os
+import queue
+import select as io_select
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+from models.models import db, ParkingLot
+
+
+KEEPALIVE_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 100
+NOTIFY_CHANNEL = 'parkease_events'
+
+
+class Subscription:
+    """A subscriber's queue of pending events.
+
+    When a slow client falls behind, the oldest events are dropped. Every event
+    carries absolute counters rather than deltas, so the newest one is enough
+    to bring a screen up to date.
+    """
+
+    def __init__(self, topics, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.topics = frozenset(topics)
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """In-process publish/subscribe of availability events by topic.
+
+    Topics are 'lots' and 'lot:<id>' for lot counters, and 'spots' and
+    'spot:<id>' for spot status changes. With a fan-out attached, publish()
+    goes through it and every worker (this one included) dispatches what it
+    receives; without one, events only reach subscribers in this process.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.fanout = None
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        if self.fanout is not None:
+            self.fanout.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscribers.values())) if self._subscribers else 0
+
+    def publish(self, topics, event):
+        if self.fanout is not None:
+            self.fanout.send(topics, event)
+        else:
+            self.dispatch(topics, event)
+
+    def dispatch(self, topics, event):
+        with self._lock:
+            targets = set()
+            for topic in topics:
+                targets.update(self._subscribers.get(topic, ()))
+        for subscription in targets:
+            subscription.put(event)
+
+
+class PostgresFanout:
+    """Relays events between workers through PostgreSQL LISTEN/NOTIFY.
+
+    NOTIFY is sent on a short-lived engine connection after the publishing
+    transaction has committed. One listener thread per worker, started on the
+    first subscription (so after gunicorn forks), feeds what arrives into the
+    local bus.
+    """
+
+    def __init__(self, bus, engine):
+        self.bus = bus
+        self.engine = engine
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def send(self, topics, event):
+        payload = json.dumps({'topics': list(topics), 'event': event})
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': NOTIFY_CHANNEL, 'payload': payload})
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._listen_forever, name='event-fanout', daemon=True).start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Event fan-out listener error: {e}")
+                time.sleep(2)
+
+    def _listen(self):
+        conn = self.engine.raw_connection()
+        try:
+            dbapi_conn = conn.driver_connection
+            dbapi_conn.autocommit = True
+            cursor = dbapi_conn.cursor()
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            while True:
+                if io_select.select([dbapi_conn], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    message = json.loads(notify.payload)
+                    self.bus.dispatch(message['topics'], message['event'])
+        finally:
+            conn.invalidate()
+
+
+event_bus = EventBus()
+
+
+def init_event_bus(engine):
+    """Attach the PostgreSQL fan-out when EVENT_FANOUT=postgres and the database supports it."""
+    if os.getenv('EVENT_FANOUT', '').lower() == 'postgres':
+        if engine.dialect.name == 'postgresql':
+            event_bus.fanout = PostgresFanout(event_bus, engine)
+        else:
+            print(f"EVENT_FANOUT=postgres ignored on {engine.dialect.name}; events stay in-process")
+
+
+def lot_snapshot(lot_ids=None):
+    """Current counters for the given lots (all lots if None) as 'lot' events."""
+    query = select(ParkingLot.id, ParkingLot.spots_total, ParkingLot.spots_available, ParkingLot.spots_occupied)
+    if lot_ids is not None:
+        query = query.where(ParkingLot.id.in_(lot_ids))
+    return [
+        {'type': 'lot', 'lot_id': lot_id, 'spots_total': total, 'spots_available': available, 'spots_occupied': occupied}
+        for lot_id, total, available, occupied in db.session.execute(query)
+    ]
+
+
+def publish_spot_change(lot_id, spot_id, status, **details):
+    """Publish a spot's new status and its lot's counters. Call after commit.
+
+    Extra details (reservation id, planned start, final amount, ...) go only
+    to the admin-facing spot topics.
+    """
+    publish_spot_changes([(lot_id, spot_id, status, details)])
+
+
+def publish_spot_changes(changes):
+    """publish_spot_change() for many (lot_id, spot_id, status, details) at once.
+
+    Each lot's counters are read and published once, however many of its
+    spots changed.
+    """
+    try:
+        now = datetime.utcnow().isoformat(timespec='seconds') + 'Z'
+        for event in lot_snapshot(sorted({lot_id for lot_id, _, _, _ in changes})):
+            event['at'] = now
+            event_bus.publish(['lots', f"lot:{event['lot_id']}"], event)
+        for lot_id, spot_id, status, details in changes:
+            spot_event = {'type': 'spot', 'lot_id': lot_id, 'spot_id': spot_id, 'status': status, 'at': now}
+            spot_event.update(details)
+            event_bus.publish(['spots', f'spot:{spot_id}'], spot_event)
+    except Exception as e:
+        # A lost event only delays screens until their next reconnect snapshot
+        print(f"Event publish error: {e}")
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import select, update, delete, func
+
+from models.models import db, ParkingLot, ParkingSpot, Reservation, GateChange
+from utils.inventory import free_spots, lock_reservation_spots
+from utils.ledger import record_releases
+from utils.qrtoken import (signer, revocations, accept_legacy, token_window, token_fingerprints, InvalidToken,
+                           TOKEN_PREFIX, LEGACY_PREFIX)
+
+
+# Bounds how long one batch holds its spot locks
+GATE_BATCH_LIMIT = 500
+# Scanners that last synced longer ago than this get a full snapshot again
+GATE_LOG_KEEP = timedelta(days=2)
+# A delta also resends changes logged this long before the scanner's version:
+# on PostgreSQL a transaction can take a lower id but commit after a sync.
+GATE_DELTA_OVERLAP = timedelta(seconds=30)
+
+
+def log_gate_changes(changes):
+    """Note (lot_id, reservation_id) pairs that checked in or left. The caller commits.
+
+    Scanners syncing a delta get the current state of every reservation
+    noted since their version. Rows older than GATE_LOG_KEEP are pruned on
+    the way, except the newest, which always marks the current version.
+    """
+    if not changes:
+        return
+    db.session.execute(
+        delete(GateChange)
+        .where(
+            GateChange.created_at < datetime.utcnow() - GATE_LOG_KEEP,
+            GateChange.id < select(func.max(GateChange.id)).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(GateChange.__table__.insert(), [
+        {'lot_id': lot_id, 'reservation_id': reservation_id} for lot_id, reservation_id in changes
+    ])
+
+
+def gate_snapshot(lot_id, since=None):
+    """The checked-in reservations of a lot, for a scanner to verify exits offline.
+
+    Each reservation is [id, spot id, code expiry (epoch seconds), code
+    fingerprints]; bookings made before signed codes have no expiry and no
+    fingerprints, and scan by id while accept_legacy is true. With since
+    (a version from an earlier snapshot) still in the log, only the
+    reservations that changed come back, as entries to upsert and ids to
+    drop. Otherwise, or without since, the whole set comes back with full
+    set to true.
+    """
+    # Read first: anything committed meanwhile is resent by the next delta
+    version = db.session.execute(select(func.max(GateChange.id))).scalar() or 0
+    active = (
+        select(
+            Reservation.id,
+            Reservation.spot_id,
+            Reservation.parking_time,
+            Reservation.planned_start_time,
+            Reservation.planned_end_time,
+            ParkingSpot.lot_id,
+        )
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .where(Reservation.leaving_time.is_(None), Reservation.checked_in_at.isnot(None))
+        .order_by(Reservation.id)
+    )
+    snapshot = {'lot_id': lot_id, 'version': version, 'accept_legacy': accept_legacy()}
+
+    floor = None
+    if since == 0:
+        # Version 0 was an empty log; a delta from it needs every row ever written
+        oldest = db.session.execute(select(func.min(GateChange.id))).scalar()
+        floor = 1 if oldest in (None, 1) else None
+    elif since is not None:
+        since_at = db.session.execute(select(GateChange.created_at).where(GateChange.id == since)).scalar()
+        if since_at is not None:
+            floor = select(func.min(GateChange.id)).where(
+                GateChange.created_at >= since_at - GATE_DELTA_OVERLAP
+            ).scalar_subquery()
+    if floor is None:
+        rows = db.session.execute(active.where(ParkingSpot.lot_id == lot_id)).all()
+        snapshot.update(full=True, reservations=[_snapshot_entry(row) for row in rows])
+        return snapshot
+
+    changed = set(db.session.execute(
+        select(GateChange.reservation_id)
+        .where(GateChange.lot_id == lot_id, GateChange.id >= floor)
+    ).scalars())
+    # Looked up by id and checked against the lot here: with the lot in the
+    # WHERE clause SQLite walks every spot of the lot instead
+    rows = [
+        row for row in (db.session.execute(active.where(Reservation.id.in_(changed))).all() if changed else [])
+        if row.lot_id == lot_id
+    ]
+    snapshot.update(
+        full=False,
+        since=since,
+        reservations=[_snapshot_entry(row) for row in rows],
+        removed=sorted(changed - {row.id for row in rows}),
+    )
+    return snapshot
+
+
+def _snapshot_entry(row):
+    if row.planned_end_time is None:
+        return [row.id, row.spot_id, None, []]
+    _, expires = token_window(row)
+    return [row.id, row.spot_id, int(expires.timestamp()), token_fingerprints(row)]
+
+
+def scanned_reservation_id(qr_data):
+    """The reservation a scanned QR code is for; raises InvalidToken if it is not usable.
+
+    Signed codes are checked against their signature, window and the
+    revocation list without a query; legacy reservation_id:<id> codes only
+    while accept_legacy() allows them.
+    """
+    if qr_data.startswith(TOKEN_PREFIX + '.'):
+        claims = signer().verify(qr_data)
+        if revocations.is_revoked(claims):
+            raise InvalidToken('This booking has already been released or cancelled')
+        return claims.reservation_id
+    if qr_data.startswith(LEGACY_PREFIX) and accept_legacy():
+        try:
+            return int(qr_data[len(LEGACY_PREFIX):])
+        except ValueError:
+            pass
+    raise InvalidToken('Invalid QR code format')
+
+
+def release_scans(scans, now=None):
+    """Verify scanned QR codes and release every matching reservation in one transaction.
+
+    scans is a list of (qr_data, spot_id); spot_id may be None when the lane
+    does not know which spot the car left. Returns one result dict per scan,
+    in order, plus the (lot_id, spot_id, status, details) changes to publish
+    and the revoked keys to pass to revocations.remember() once the caller
+    has committed. Only checked-in reservations that are
+    still open are released; a booking that never checked in has to be
+    cancelled from its release page. The caller owns the transaction.
+    """
+    now = now or datetime.utcnow()
+    results = [{'success': False} for _ in scans]
+
+    wanted = {}
+    for result, (qr_data, spot_id) in zip(results, scans):
+        try:
+            reservation_id = scanned_reservation_id(qr_data)
+        except InvalidToken as e:
+            result['error'] = str(e)
+            continue
+        result['reservation_id'] = reservation_id
+        if reservation_id in wanted:
+            result['error'] = 'Scanned twice in this batch'
+            continue
+        wanted[reservation_id] = (result, spot_id)
+
+    if not wanted:
+        return results, [], []
+
+    lock_reservation_spots(list(wanted))
+    rows = db.session.execute(
+        select(
+            Reservation.id,
+            Reservation.spot_id,
+            Reservation.parking_time,
+            Reservation.planned_start_time,
+            Reservation.planned_end_time,
+            Reservation.checked_in_at,
+            Reservation.leaving_time,
+            ParkingSpot.status,
+            ParkingLot.id.label('lot_id'),
+            ParkingLot.price_per_hour,
+        )
+        .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+        .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+        .where(Reservation.id.in_(list(wanted)))
+    ).all()
+    found = {row.id: row for row in rows}
+
+    released = []
+    for reservation_id, (result, spot_id) in wanted.items():
+        row = found.get(reservation_id)
+        if row is None:
+            result['error'] = 'Reservation not found'
+        elif row.leaving_time is not None:
+            result['error'] = 'This booking has already been released or cancelled'
+        elif row.checked_in_at is None or row.status != 'O':
+            result['error'] = 'This booking has not checked in'
+        elif spot_id is not None and spot_id != row.spot_id:
+            result['error'] = 'This car is parked at another spot'
+        else:
+            released.append(SimpleNamespace(**{**row._asdict(), 'leaving_time': now}))
+
+    if not released:
+        return results, [], []
+
+    db.session.execute(
+        update(Reservation)
+        .where(Reservation.id.in_([row.id for row in released]))
+        .values(leaving_time=now)
+        .execution_options(synchronize_session=False)
+    )
+    free_spots({row.spot_id: row.lot_id for row in released})
+    amounts = record_releases(released)
+    revoked = revocations.revoke_many(released)
+    log_gate_changes([(row.lot_id, row.id) for row in released])
+
+    changes = []
+    for row, amount in zip(released, amounts):
+        result = wanted[row.id][0]
+        result.update(success=True, spot_id=row.spot_id, lot_id=row.lot_id, amount=amount)
+        changes.append((row.lot_id, row.spot_id, 'A', {'reservation_id': row.id, 'amount': amount}))
+    return results, changes, revoked
@@ -0,0 +1,162 @@
+"""Scanner-side client for a lot's gate snapshot, to keep exits moving offline.
+
+Uses only the standard library and does not import the app, so it can run
+on the scanner device itself:
+
+    scanner = GateScanner('https://parkease.example', lot_id=3)
+    scanner.login('gate3@parkease.example', password)
+    scanner.sync()                      # full snapshot, then deltas
+    reservation_id = scanner.release(qr_data)   # raises RejectedScan
+    scanner.flush()                     # bulk-release queued exits
+
+Codes are checked against the last synced snapshot: a signed code must be
+unexpired and hash to one of its reservation's fingerprints (see
+utils.qrtoken). The device never holds the signing key, so it can tell
+genuine codes apart without being able to make them.
+Releases are queued and sent to /admin/gate/release by flush(); while the
+server is unreachable they stay queued and the lane keeps working.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import struct
+import time
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, Request
+
+# Must match utils.qrtoken
+TOKEN_PREFIX = 'PE1'
+LEGACY_PREFIX = 'reservation_id:'
+FINGERPRINT_CHARS = 16
+_CLAIMS = struct.Struct('>IIII')
+# Must match utils.gate.GATE_BATCH_LIMIT
+BATCH_LIMIT = 500
+
+
+class RejectedScan(ValueError):
+    pass
+
+
+class GateSyncError(Exception):
+    pass
+
+
+class GateScanner:
+    def __init__(self, base_url, lot_id, timeout=5):
+        self.base_url = base_url.rstrip('/')
+        self.lot_id = lot_id
+        self.timeout = timeout
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.version = 0
+        self.accept_legacy = False
+        self.reservations = {}
+        self.pending = []
+        self.synced_at = None
+
+    def login(self, email, password):
+        """Sign in as an admin; the session cookie is kept for later calls."""
+        data = urlencode({'email': email, 'password': password}).encode()
+        self._open(Request(f"{self.base_url}/login", data=data))
+
+    def sync(self):
+        """Bring the snapshot up to date, with a delta when the server still has one.
+
+        Raises GateSyncError if the server cannot be reached; the previous
+        snapshot stays in use.
+        """
+        url = f"{self.base_url}/admin/gate/{self.lot_id}/snapshot"
+        if self.synced_at is not None:
+            url += f"?since={self.version}"
+        snapshot = json.loads(self._open(Request(url)))
+
+        if snapshot['full']:
+            self.reservations = {}
+        for reservation_id in snapshot.get('removed', []):
+            self.reservations.pop(reservation_id, None)
+        for reservation_id, spot_id, expires, fingerprints in snapshot['reservations']:
+            self.reservations[reservation_id] = (spot_id, expires, set(fingerprints))
+        # Exits queued here but not yet flushed must not come back with the snapshot
+        for scan in self.pending:
+            self.reservations.pop(scan['reservation_id'], None)
+        self.version = snapshot['version']
+        self.accept_legacy = snapshot['accept_legacy']
+        self.synced_at = time.time()
+        return snapshot
+
+    def check(self, qr_data, spot_id=None, now=None):
+        """The reservation a code releases, checked against the snapshot; raises RejectedScan."""
+        if qr_data.startswith(LEGACY_PREFIX) and self.accept_legacy:
+            try:
+                reservation_id = int(qr_data[len(LEGACY_PREFIX):])
+            except ValueError:
+                raise RejectedScan('Invalid QR code format')
+            entry = self.reservations.get(reservation_id)
+        elif qr_data.startswith(TOKEN_PREFIX + '.'):
+            reservation_id, expires, fingerprint = _read_token(qr_data)
+            entry = self.reservations.get(reservation_id)
+            if entry is not None and fingerprint not in entry[2]:
+                raise RejectedScan('QR code signature is not valid')
+            if (time.time() if now is None else now) >= expires:
+                raise RejectedScan('QR code has expired')
+        else:
+            raise RejectedScan('Invalid QR code format')
+
+        if entry is None:
+            raise RejectedScan('No checked-in booking for this code')
+        if spot_id is not None and spot_id != entry[0]:
+            raise RejectedScan('This car is parked at another spot')
+        return reservation_id
+
+    def release(self, qr_data, spot_id=None, now=None):
+        """check() a code, then queue its release and drop it from the snapshot."""
+        reservation_id = self.check(qr_data, spot_id, now)
+        del self.reservations[reservation_id]
+        self.pending.append({'qr_data': qr_data, 'spot_id': spot_id, 'reservation_id': reservation_id})
+        return reservation_id
+
+    def flush(self):
+        """Send queued releases to the server in batches; returns the server's results.
+
+        Batches that could not be sent stay queued for the next flush.
+        """
+        results = []
+        while self.pending:
+            batch = self.pending[:BATCH_LIMIT]
+            body = json.dumps({'scans': [
+                {'qr_data': scan['qr_data'], 'spot_id': scan['spot_id']} for scan in batch
+            ]}).encode()
+            reply = json.loads(self._open(Request(
+                f"{self.base_url}/admin/gate/release", data=body, headers={'Content-Type': 'application/json'}
+            )))
+            if not reply.get('success'):
+                raise GateSyncError(reply.get('error', 'release failed'))
+            results.extend(reply['results'])
+            del self.pending[:len(batch)]
+        return results
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                if '/login' in response.url and not request.full_url.endswith('/login'):
+                    raise GateSyncError('not signed in as an admin')
+                return response.read()
+        except (URLError, OSError) as e:
+            raise GateSyncError(f"{request.full_url}: {e}") from e
+
+
+def _read_token(token):
+    """(reservation id, expiry, fingerprint) of a signed code, read without its key."""
+    try:
+        _, _, claims, signature = token.split('.')
+        claims, signature = _b64decode(claims), _b64decode(signature)
+        reservation_id, _, _, expires = _CLAIMS.unpack(claims)
+    except (ValueError, binascii.Error, struct.error):
+        raise RejectedScan('Invalid QR code format')
+    return reservation_id, expires, hashlib.sha256(claims + signature).hexdigest()[:FINGERPRINT_CHARS]
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
@@ -0,0 +1,187 @@
+import heapq
+import math
+import threading
+import time
+
+from sqlalchemy import select
+
+from models.models import db, ParkingLot
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_coordinates(lat, lng):
+    """Validate a latitude/longitude pair from a form. Returns (lat, lng) or None if both are blank."""
+    lat = (lat or '').strip()
+    lng = (lng or '').strip()
+    if not lat and not lng:
+        return None
+
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Coordinates out of range")
+    return lat, lng
+
+
+class LotGridIndex:
+    """In-memory uniform grid over lot coordinates for k-nearest queries.
+
+    Lots are bucketed into cells of cell_deg degrees. A query walks outward
+    ring by ring and yields lots in increasing distance, so callers can stop
+    as soon as they have enough matches. Updates touch a single cell.
+    """
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def upsert(self, lot_id, lat, lng):
+        with self._lock:
+            self.remove(lot_id)
+            if lat is None or lng is None:
+                return
+            self._points[lot_id] = (lot_id, lat, lng)
+            self._cells.setdefault(self._cell(lat, lng), set()).add(lot_id)
+
+    def remove(self, lot_id):
+        with self._lock:
+            point = self._points.pop(lot_id, None)
+            if point is None:
+                return
+            cell = self._cell(point[1], point[2])
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(lot_id)
+                if not bucket:
+                    del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+
+    def iter_nearest(self, lat, lng, max_km=50.0):
+        """Yield (distance_km, lot_id) in increasing distance, up to max_km away."""
+        if not self._points:
+            return
+
+        ci, cj = self._cell(lat, lng)
+        # Smallest cell edge near the query point; any lot outside rings 0..r
+        # is at least r edges away, which bounds what can already be yielded.
+        edge_km = self.cell_deg * KM_PER_DEGREE * max(0.01, math.cos(math.radians(min(89.0, abs(lat) + self.cell_deg))))
+        max_ring = int(max_km / edge_km) + 1
+        heap = []
+
+        for ring in range(max_ring + 1):
+            # Only hold the lock while reading cells, not across yields, so a
+            # slow consumer never blocks writers or other queries.
+            with self._lock:
+                points = [
+                    self._points[lot_id]
+                    for cell in self._ring_cells(ci, cj, ring)
+                    for lot_id in self._cells.get(cell, ())
+                ]
+            for lot_id, p_lat, p_lng in points:
+                distance = haversine_km(lat, lng, p_lat, p_lng)
+                if distance <= max_km:
+                    heapq.heappush(heap, (distance, lot_id))
+
+            bound = ring * edge_km
+            while heap and heap[0][0] <= bound:
+                yield heapq.heappop(heap)
+
+        while heap:
+            yield heapq.heappop(heap)
+
+    @staticmethod
+    def _ring_cells(ci, cj, ring):
+        if ring == 0:
+            yield ci, cj
+            return
+        for dj in range(-ring, ring + 1):
+            yield ci - ring, cj + dj
+            yield ci + ring, cj + dj
+        for di in range(-ring + 1, ring):
+            yield ci + di, cj - ring
+            yield ci + di, cj + ring
+
+
+# Each worker keeps its own index. Changes made by this worker are applied
+# immediately; a periodic rebuild picks up lots edited through other workers.
+REBUILD_INTERVAL_SECONDS = 300
+
+lot_index = LotGridIndex()
+_built_at = None
+_build_lock = threading.Lock()
+
+
+def rebuild_lot_index():
+    global _built_at
+    rows = db.session.execute(
+        select(ParkingLot.id, ParkingLot.latitude, ParkingLot.longitude)
+        .where(ParkingLot.latitude.isnot(None), ParkingLot.longitude.isnot(None))
+    ).all()
+    with lot_index._lock:
+        lot_index.clear()
+        for lot_id, lat, lng in rows:
+            lot_index.upsert(lot_id, lat, lng)
+    _built_at = time.monotonic()
+
+
+def get_lot_index():
+    with _build_lock:
+        if _built_at is None or time.monotonic() - _built_at > REBUILD_INTERVAL_SECONDS:
+            rebuild_lot_index()
+    return lot_index
+
+
+def nearest_available_lots(lat, lng, k=5, max_km=50.0):
+    """The k nearest lots with free spots, as (lot, distance_km) pairs.
+
+    Candidates come from the grid in distance order and are checked against
+    the availability counters a batch at a time.
+    """
+    results = []
+    batch = []
+    index = get_lot_index()
+
+    def flush():
+        lots = {
+            lot.id: lot for lot in ParkingLot.query.filter(
+                ParkingLot.id.in_([lot_id for _, lot_id in batch]),
+                ParkingLot.spots_available > 0,
+            ).all()
+        }
+        for distance, lot_id in batch:
+            if lot_id in lots and len(results) < k:
+                results.append((lots[lot_id], distance))
+        batch.clear()
+
+    for candidate in index.iter_nearest(lat, lng, max_km):
+        batch.append(candidate)
+        if len(batch) >= k * 2:
+            flush()
+            if len(results) >= k:
+                break
+
+    if batch and len(results) < k:
+        flush()
+    return results
@@ -0,0 +1,148 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from models.models import db, ParkingSpot, Reservation
+
+
+# Reservations without a planned end (booked before windows existed) hold
+# their spot until they are released.
+OPEN_END = datetime.max
+DEFAULT_BOOKING_HOURS = 2
+MAX_BOOKING_HOURS = 24
+# A booking starting within this margin is checked in on the spot, and a
+# booked reservation may be checked in this long before its start.
+CHECK_IN_MARGIN = timedelta(minutes=15)
+
+
+def reservation_window(reservation):
+    start = reservation.planned_start_time or reservation.parking_time
+    return start, reservation.planned_end_time or OPEN_END
+
+
+class SpotSchedule:
+    """Booked [start, end) windows on one spot, kept sorted by start.
+
+    Windows on a spot never overlap, so sorted by start is also sorted by end
+    and an overlap test only needs the window just before `end`.
+    """
+
+    __slots__ = ('starts', 'ends', 'reservation_ids')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.reservation_ids = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_free(self, start, end):
+        i = bisect.bisect_left(self.starts, end)
+        return i == 0 or self.ends[i - 1] <= start
+
+    def add(self, reservation_id, start, end):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.reservation_ids.insert(i, reservation_id)
+
+    def remove(self, reservation_id):
+        try:
+            i = self.reservation_ids.index(reservation_id)
+        except ValueError:
+            return
+        del self.starts[i], self.ends[i], self.reservation_ids[i]
+
+
+class SpotIntervalIndex:
+    """Per-worker index of booked windows for every spot, loaded a lot at a time.
+
+    It narrows "which spot in lot X is free for [t1, t2)" to candidates
+    without touching the database; the booking transaction re-checks the
+    chosen spot under a row lock, so a stale index costs a retry, never a
+    double booking. Lots are reloaded after REBUILD_INTERVAL_SECONDS to pick
+    up bookings made through other workers.
+    """
+
+    REBUILD_INTERVAL_SECONDS = 300
+
+    def __init__(self):
+        self._lots = {}
+        self._loaded_at = {}
+        self._reservations = {}
+        self._lock = threading.RLock()
+
+    def _load(self, lot_id):
+        spot_ids = db.session.execute(
+            select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id)
+        ).scalars().all()
+        rows = db.session.execute(
+            select(
+                Reservation.id,
+                Reservation.spot_id,
+                func.coalesce(Reservation.planned_start_time, Reservation.parking_time),
+                Reservation.planned_end_time,
+            )
+            .join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+            .where(ParkingSpot.lot_id == lot_id, Reservation.leaving_time.is_(None))
+        ).all()
+
+        schedules = {spot_id: SpotSchedule() for spot_id in spot_ids}
+        with self._lock:
+            for reservation_id in [rid for rid, (lid, _) in self._reservations.items() if lid == lot_id]:
+                del self._reservations[reservation_id]
+            for reservation_id, spot_id, start, end in rows:
+                schedules[spot_id].add(reservation_id, start, end or OPEN_END)
+                self._reservations[reservation_id] = (lot_id, spot_id)
+            self._lots[lot_id] = schedules
+            self._loaded_at[lot_id] = time.monotonic()
+        return schedules
+
+    def _schedules(self, lot_id):
+        with self._lock:
+            loaded_at = self._loaded_at.get(lot_id)
+            if loaded_at is not None and time.monotonic() - loaded_at <= self.REBUILD_INTERVAL_SECONDS:
+                return self._lots[lot_id]
+        return self._load(lot_id)
+
+    def free_spots(self, lot_id, start, end):
+        """Spot ids in lot_id with nothing booked overlapping [start, end), lowest id first."""
+        schedules = self._schedules(lot_id)
+        with self._lock:
+            return [spot_id for spot_id, schedule in schedules.items() if schedule.is_free(start, end)]
+
+    def add(self, lot_id, spot_id, reservation_id, start, end):
+        with self._lock:
+            schedules = self._lots.get(lot_id)
+            if schedules is None:
+                return
+            self.remove(reservation_id)
+            schedules.setdefault(spot_id, SpotSchedule()).add(reservation_id, start, end or OPEN_END)
+            self._reservations[reservation_id] = (lot_id, spot_id)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            location = self._reservations.pop(reservation_id, None)
+            if location is None:
+                return
+            lot_id, spot_id = location
+            schedule = self._lots.get(lot_id, {}).get(spot_id)
+            if schedule is not None:
+                schedule.remove(reservation_id)
+
+    def invalidate(self, lot_id=None):
+        """Drop one lot (or all of them); it is reloaded on next use."""
+        with self._lock:
+            lot_ids = list(self._lots) if lot_id is None else [lot_id]
+            for lid in lot_ids:
+                self._lots.pop(lid, None)
+                self._loaded_at.pop(lid, None)
+            for reservation_id in [rid for rid, (lid, _) in self._reservations.items() if lid in lot_ids]:
+                del self._reservations[reservation_id]
+
+
+spot_schedules = SpotIntervalIndex()
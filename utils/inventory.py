@@ -0,0 +1,440 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, func, case, and_
+from models.models import db, ParkingLot, ParkingSpot, Reservation, ArchivedReservation
+from utils.intervals import spot_schedules, reservation_window, OPEN_END
+
+
+COUNTER_COLUMNS = ('spots_total', 'spots_available', 'spots_occupied')
+# Purging a lot's history runs in short transactions with a pause between
+# them. SQLite's busy handler backs off up to 100 ms between retries, so a
+# shorter pause can leave a waiting writer asleep through every gap.
+PURGE_CHUNK_SIZE = 5000
+PURGE_PAUSE_SECONDS = 0.1
+# Status of a spot being deleted: no booking can take it
+CLOSED = 'C'
+
+
+def adjust_lot_counters(lot_id, total=0, available=0, occupied=0):
+    """Apply relative changes to a lot's spot counters in the current transaction.
+
+    Every spot status change goes through here, so this also bumps the lot's
+    version.
+    """
+    values = {}
+    if total:
+        values['spots_total'] = ParkingLot.spots_total + total
+    if available:
+        values['spots_available'] = ParkingLot.spots_available + available
+    if occupied:
+        values['spots_occupied'] = ParkingLot.spots_occupied + occupied
+    if not values:
+        return
+    values['version'] = ParkingLot.version + 1
+
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(**values)
+        .execution_options(synchronize_session='evaluate')
+    )
+
+
+def bump_lot_version(lot_id):
+    """Mark a lot as changed (name, price, ...) in the current transaction."""
+    db.session.execute(
+        update(ParkingLot)
+        .where(ParkingLot.id == lot_id)
+        .values(version=ParkingLot.version + 1)
+        .execution_options(synchronize_session='evaluate')
+    )
+
+
+def free_spot(spot_id, lot_id):
+    """Mark an occupied spot as available again.
+
+    Returns False if the spot was not occupied, e.g. a concurrent release
+    already freed it, in which case the counters are left untouched.
+    """
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status == 'O')
+        .values(status='A')
+        .execution_options(synchronize_session='evaluate')
+    )
+    if result.rowcount != 1:
+        return False
+
+    adjust_lot_counters(lot_id, available=1, occupied=-1)
+    return True
+
+
+def free_spots(spot_lots):
+    """free_spot() for many spots at once, given as {spot_id: lot_id}.
+
+    The spots must already be locked (lock_reservation_spots) and known to
+    be occupied, so one UPDATE frees them all and each lot's counters move
+    by the number of its spots in the batch.
+    """
+    if not spot_lots:
+        return
+    db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id.in_(list(spot_lots)), ParkingSpot.status == 'O')
+        .values(status='A')
+        .execution_options(synchronize_session=False)
+    )
+    per_lot = {}
+    for lot_id in spot_lots.values():
+        per_lot[lot_id] = per_lot.get(lot_id, 0) + 1
+    for lot_id, count in per_lot.items():
+        adjust_lot_counters(lot_id, available=count, occupied=-count)
+
+
+def lock_reservation_spots(reservation_ids):
+    """Lock the spots of the given reservations, like _lock_spot() in one statement.
+
+    Every release frees its spot, so holding these locks keeps the
+    reservations from being released by anyone else until commit.
+    """
+    db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id.in_(
+            select(Reservation.spot_id).where(Reservation.id.in_(reservation_ids)).scalar_subquery()
+        ))
+        .values(status=ParkingSpot.status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reserve_spot(lot_id, start, end, occupy=False, exclude_reservation_id=None, attempts=10):
+    """Pick a spot in a lot with nothing else booked in [start, end).
+
+    Candidates come from the interval index; the chosen spot's row is locked
+    and its bookings re-checked in the database, so two transactions can never
+    book overlapping windows on one spot. With occupy=True the spot must also
+    be free right now and is marked occupied (the booking checks in
+    immediately). Returns the spot id, or None if the lot has no free spot
+    for the window. The caller owns the transaction.
+    """
+    spot_id = _reserve_from_index(lot_id, start, end, occupy, exclude_reservation_id, attempts)
+    if spot_id is None:
+        # Spots released or cancelled through another worker only show up
+        # once the lot is reloaded; do that before calling the lot full.
+        spot_schedules.invalidate(lot_id)
+        spot_id = _reserve_from_index(lot_id, start, end, occupy, exclude_reservation_id, attempts)
+    return spot_id
+
+
+def _reserve_from_index(lot_id, start, end, occupy, exclude_reservation_id, attempts):
+    candidates = spot_schedules.free_spots(lot_id, start, end)
+    if occupy and candidates:
+        # A car that overstays its window still holds the spot; skip those
+        # rather than spending attempts on them.
+        available = set(db.session.execute(
+            select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id, ParkingSpot.status == 'A')
+        ).scalars())
+        candidates = [spot_id for spot_id in candidates if spot_id in available]
+
+    for spot_id in candidates[:attempts]:
+        if occupy:
+            # The conditional flip doubles as the row lock.
+            if not _set_status(spot_id, 'A', 'O'):
+                continue
+        elif not _lock_spot(spot_id):
+            continue
+
+        if _has_overlap(spot_id, start, end, exclude_reservation_id):
+            # Booked through another worker since the index was loaded.
+            if occupy:
+                _set_status(spot_id, 'O', 'A')
+            spot_schedules.invalidate(lot_id)
+            continue
+
+        if occupy:
+            adjust_lot_counters(lot_id, available=-1, occupied=1)
+        return spot_id
+
+    return None
+
+
+def check_in_reservation(reservation, lot_id, now):
+    """Start occupancy for a booked reservation, marking its spot occupied.
+
+    If the booked spot is still held (someone overstayed), the reservation
+    moves to another spot that is free for the rest of its window. Returns
+    the spot id it is checked in on, or None if nothing is free.
+    """
+    spot_id = reservation.spot_id
+    if _set_status(spot_id, 'A', 'O'):
+        adjust_lot_counters(lot_id, available=-1, occupied=1)
+    else:
+        _, end = reservation_window(reservation)
+        spot_id = reserve_spot(lot_id, now, end, occupy=True, exclude_reservation_id=reservation.id)
+        if spot_id is None:
+            return None
+        reservation.spot_id = spot_id
+
+    reservation.checked_in_at = datetime.utcnow()
+    return spot_id
+
+
+def add_spots(lot_id, count, batch_size=5000):
+    """Insert count available spots into a lot and raise its counters.
+
+    Rows go in with executemany in batches rather than one ORM object per
+    spot. The caller owns the transaction.
+    """
+    now = datetime.utcnow()
+    table = ParkingSpot.__table__
+    for start in range(0, count, batch_size):
+        rows = [{'lot_id': lot_id, 'status': 'A', 'created_at': now} for _ in range(min(batch_size, count - start))]
+        db.session.execute(table.insert(), rows)
+    adjust_lot_counters(lot_id, total=count, available=count)
+
+
+def remove_unused_spots(lot_id, count):
+    """Delete count available spots that no reservation, past, future or archived, refers to.
+
+    One DELETE picks the newest such spots with a NOT EXISTS subquery, so a
+    spot booked concurrently is never removed. Returns False if the lot has
+    fewer than count removable spots; the caller must then roll back, as the
+    statement may have removed some. The caller owns the transaction.
+    """
+    unused = (
+        select(ParkingSpot.id)
+        .where(
+            ParkingSpot.lot_id == lot_id,
+            ParkingSpot.status == 'A',
+            ~select(Reservation.id).where(Reservation.spot_id == ParkingSpot.id).exists(),
+            ~select(ArchivedReservation.id).where(ArchivedReservation.spot_id == ParkingSpot.id).exists(),
+        )
+        .order_by(ParkingSpot.id.desc())
+        .limit(count)
+    )
+    result = db.session.execute(
+        delete(ParkingSpot)
+        .where(ParkingSpot.id.in_(unused))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != count:
+        return False
+
+    adjust_lot_counters(lot_id, total=-count, available=-count)
+    return True
+
+
+def purge_completed_reservations(spot_ids, chunk_size=PURGE_CHUNK_SIZE, pause=PURGE_PAUSE_SECONDS):
+    """Delete completed and archived reservations on the given spots, chunk_size rows per transaction.
+
+    spot_ids is a SELECT of spot ids. Committing after every chunk keeps
+    each write lock short, so bookings elsewhere carry on while a lot with a
+    long history is deleted. Close the spots first (close_spots()), or a
+    booking could land on one after its history is gone. Returns the number
+    of reservations deleted.
+    """
+    deleted = 0
+    for model in (Reservation, ArchivedReservation):
+        while True:
+            chunk = (
+                select(model.id)
+                .where(model.spot_id.in_(spot_ids), model.leaving_time.isnot(None))
+                .limit(chunk_size)
+            )
+            count = db.session.execute(
+                delete(model)
+                .where(model.id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            deleted += count
+            if count < chunk_size:
+                break
+            time.sleep(pause)
+    return deleted
+
+
+def _spots(lot_id, spot_id=None):
+    spots = ParkingSpot.lot_id == lot_id
+    if spot_id is not None:
+        spots = and_(spots, ParkingSpot.id == spot_id)
+    return spots
+
+
+def close_spots(lot_id, spot_id=None):
+    """Take every spot in a lot (or just spot_id) out of service, ahead of deleting it.
+
+    The spots are locked first, and the same lock is what a booking takes
+    before it inserts a reservation. So the check that none of them is
+    occupied or holds an active reservation still holds when they close,
+    and reserve_spot() skips them from then on. Returns False, closing
+    nothing, if the check fails. The caller owns the transaction, and
+    should commit it before purge_completed_reservations().
+    """
+    spots = _spots(lot_id, spot_id)
+    db.session.execute(
+        update(ParkingSpot)
+        .where(spots)
+        .values(status=ParkingSpot.status)
+        .execution_options(synchronize_session=False)
+    )
+
+    busy = db.session.execute(
+        select(
+            select(ParkingSpot.id).where(spots, ParkingSpot.status.notin_(['A', CLOSED])).exists()
+            | select(Reservation.id).where(Reservation.spot_id.in_(select(ParkingSpot.id).where(spots)),
+                                           Reservation.leaving_time.is_(None)).exists()
+        )
+    ).scalar()
+    if busy:
+        return False
+
+    # Spots still closed from an earlier attempt that failed stay as they are
+    closed = db.session.execute(
+        update(ParkingSpot)
+        .where(spots, ParkingSpot.status == 'A')
+        .values(status=CLOSED)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    adjust_lot_counters(lot_id, available=-closed)
+    return True
+
+
+def reopen_spots(lot_id, spot_id=None):
+    """Put spots closed by close_spots() back in service. The caller owns the transaction."""
+    reopened = db.session.execute(
+        update(ParkingSpot)
+        .where(_spots(lot_id, spot_id), ParkingSpot.status == CLOSED)
+        .values(status='A')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    adjust_lot_counters(lot_id, available=reopened)
+
+
+def delete_spots(lot_id, spot_id=None):
+    """Delete every spot in a lot (or just spot_id) with any remaining reservations.
+
+    The spots must have been closed by close_spots(), so no booking can
+    have reached them since; call purge_completed_reservations() in between
+    so this transaction stays short. Returns False, deleting nothing, if one
+    of them is not closed (added to the lot meanwhile). The caller owns the
+    transaction.
+    """
+    spots = _spots(lot_id, spot_id)
+    spot_ids = select(ParkingSpot.id).where(spots)
+
+    locked = db.session.execute(
+        update(ParkingSpot)
+        .where(spots)
+        .values(status=ParkingSpot.status)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    not_closed = db.session.execute(
+        select(select(ParkingSpot.id).where(spots, ParkingSpot.status != CLOSED).exists())
+    ).scalar()
+    if not_closed:
+        return False
+
+    for model in (Reservation, ArchivedReservation):
+        db.session.execute(
+            delete(model)
+            .where(model.spot_id.in_(spot_ids))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.execute(delete(ParkingSpot).where(spots).execution_options(synchronize_session=False))
+    adjust_lot_counters(lot_id, total=-locked)
+    return True
+
+
+def _set_status(spot_id, current, new):
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status == current)
+        .values(status=new)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _lock_spot(spot_id):
+    # A no-op UPDATE takes the row lock on PostgreSQL and the write lock on
+    # SQLite, where SELECT ... FOR UPDATE is not available. Closed spots are
+    # not locked, so they cannot be booked.
+    result = db.session.execute(
+        update(ParkingSpot)
+        .where(ParkingSpot.id == spot_id, ParkingSpot.status != CLOSED)
+        .values(status=ParkingSpot.status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _has_overlap(spot_id, start, end, exclude_reservation_id=None):
+    query = (
+        select(Reservation.id)
+        .where(
+            Reservation.spot_id == spot_id,
+            Reservation.leaving_time.is_(None),
+            func.coalesce(Reservation.planned_start_time, Reservation.parking_time) < end,
+            func.coalesce(Reservation.planned_end_time, OPEN_END) > start,
+        )
+        .limit(1)
+    )
+    if exclude_reservation_id is not None:
+        query = query.where(Reservation.id != exclude_reservation_id)
+    return db.session.execute(query).first() is not None
+
+
+def reconcile_lot_counters(fix=True, bump_version=True):
+    """Compare the stored counters with the spot table and optionally repair them.
+
+    Returns a list of (lot_id, stored, actual) tuples for every lot that drifted,
+    where stored and actual are (total, available, occupied). A repair bumps
+    each lot's version unless bump_version is False, for migrations that run
+    before the version column exists.
+    """
+    actual_counts = (
+        select(
+            ParkingSpot.lot_id,
+            func.count(ParkingSpot.id).label('total'),
+            func.sum(case((ParkingSpot.status == 'A', 1), else_=0)).label('available'),
+            func.sum(case((ParkingSpot.status == 'O', 1), else_=0)).label('occupied'),
+        )
+        .group_by(ParkingSpot.lot_id)
+        .subquery()
+    )
+
+    rows = db.session.execute(
+        select(
+            ParkingLot.id,
+            ParkingLot.spots_total,
+            ParkingLot.spots_available,
+            ParkingLot.spots_occupied,
+            func.coalesce(actual_counts.c.total, 0),
+            func.coalesce(actual_counts.c.available, 0),
+            func.coalesce(actual_counts.c.occupied, 0),
+        ).outerjoin(actual_counts, actual_counts.c.lot_id == ParkingLot.id)
+    ).all()
+
+    drift = []
+    for lot_id, *counts in rows:
+        stored, actual = tuple(counts[:3]), tuple(counts[3:])
+        if stored != actual:
+            drift.append((lot_id, stored, actual))
+
+    if fix and drift:
+        for lot_id, _, (total, available, occupied) in drift:
+            values = dict(spots_total=total, spots_available=available, spots_occupied=occupied)
+            if bump_version:
+                # A new version, or lot cards cached under the old one keep the stale counts
+                values['version'] = ParkingLot.version + 1
+            db.session.execute(
+                update(ParkingLot)
+                .where(ParkingLot.id == lot_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+    return drift
@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.models import db, ParkingLot, ParkingSpot, Reservation, ArchivedReservation, RevenueEntry, RevenueRollup
+from utils.pricing import reservation_charge, charges
+
+
+def record_release(reservation, lot):
+    """Write the ledger entry and rollup delta for a just-released reservation.
+
+    Must run in the same transaction that sets reservation.leaving_time. The
+    unique reservation_id on the ledger rejects a second concurrent release.
+    """
+    amount = reservation_charge(reservation, lot.price_per_hour)
+
+    db.session.add(RevenueEntry(
+        reservation_id=reservation.id,
+        lot_id=lot.id,
+        amount=amount,
+        released_at=reservation.leaving_time,
+    ))
+    _add_to_rollups({(lot.id, reservation.leaving_time.date()): (amount, 1)})
+    return amount
+
+
+def record_releases(rows):
+    """record_release() for many reservations at once; returns their amounts.
+
+    Each row needs id, lot_id, price_per_hour, parking_time,
+    planned_start_time and leaving_time. The charges are computed in one
+    vectorised pass and written with one insert and one rollup upsert.
+    """
+    if not rows:
+        return []
+
+    entries = []
+    rollups = defaultdict(lambda: [0.0, 0])
+    amounts = charges(
+        [row.price_per_hour for row in rows],
+        [row.planned_start_time or row.parking_time for row in rows],
+        [row.leaving_time for row in rows],
+    ).tolist()
+    for row, amount in zip(rows, amounts):
+        entries.append({
+            'reservation_id': row.id,
+            'lot_id': row.lot_id,
+            'amount': amount,
+            'released_at': row.leaving_time,
+        })
+        bucket = rollups[(row.lot_id, row.leaving_time.date())]
+        bucket[0] += amount
+        bucket[1] += 1
+
+    db.session.execute(RevenueEntry.__table__.insert(), entries)
+    _add_to_rollups(rollups)
+    return amounts
+
+
+def _add_to_rollups(totals):
+    """Add {(lot_id, day): (amount, count)} to the daily rollups.
+
+    On PostgreSQL and SQLite this is one upsert statement executed for all
+    keys at once, so a backfill batch costs a single round of compilation
+    rather than one per (lot, day).
+    """
+    rows = [
+        {'lot_id': lot_id, 'day': day, 'amount': amount, 'reservations': count}
+        for (lot_id, day), (amount, count) in totals.items()
+    ]
+    if not rows:
+        return
+
+    table = RevenueRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['lot_id', 'day'],
+            set_={
+                'amount': table.c.amount + stmt.excluded.amount,
+                'reservations': table.c.reservations + stmt.excluded.reservations,
+            },
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = db.session.execute(
+            update(RevenueRollup)
+            .where(RevenueRollup.lot_id == row['lot_id'], RevenueRollup.day == row['day'])
+            .values(amount=RevenueRollup.amount + row['amount'],
+                    reservations=RevenueRollup.reservations + row['reservations'])
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.add(RevenueRollup(**row))
+            db.session.flush()
+
+
+def total_revenue():
+    return db.session.execute(select(func.coalesce(func.sum(RevenueRollup.amount), 0))).scalar()
+
+
+def revenue_by_lot():
+    """(lot name, revenue) for every lot that has earned anything, one row per lot."""
+    return db.session.execute(
+        select(ParkingLot.prime_location_name, func.sum(RevenueRollup.amount))
+        .join(RevenueRollup, RevenueRollup.lot_id == ParkingLot.id)
+        .group_by(ParkingLot.id, ParkingLot.prime_location_name)
+        .order_by(ParkingLot.id)
+    ).all()
+
+
+def forget_lot_revenue(lot_id):
+    """Drop ledger history for a lot that is being deleted."""
+    db.session.execute(delete(RevenueRollup).where(RevenueRollup.lot_id == lot_id))
+    db.session.execute(delete(RevenueEntry).where(RevenueEntry.lot_id == lot_id))
+
+
+def backfill_revenue(batch_size=5000, log=print):
+    """Populate the ledger from completed reservations that have no entry yet.
+
+    Walks the live reservations and then the archived ones, in batches
+    ordered by reservation id, and commits after each batch, so it can be
+    interrupted and resumed. Returns the number of entries written.
+    """
+    written = 0
+    for model in (Reservation, ArchivedReservation):
+        written = _backfill_from(model, batch_size, written, log)
+    return written
+
+
+def _backfill_from(model, batch_size, written, log):
+    last_id = 0
+
+    while True:
+        rows = db.session.execute(
+            select(
+                model.id,
+                model.parking_time,
+                model.planned_start_time,
+                model.leaving_time,
+                ParkingLot.id.label('lot_id'),
+                ParkingLot.price_per_hour,
+            )
+            .join(ParkingSpot, model.spot_id == ParkingSpot.id)
+            .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+            .outerjoin(RevenueEntry, RevenueEntry.reservation_id == model.id)
+            .where(
+                model.leaving_time.isnot(None),
+                RevenueEntry.id.is_(None),
+                model.id > last_id,
+            )
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+
+        if not rows:
+            break
+
+        record_releases(rows)
+        db.session.commit()
+
+        written += len(rows)
+        last_id = rows[-1][0]
+        log(f"Backfilled {written} ledger entries (up to {model.__tablename__} {last_id})")
+
+    return written
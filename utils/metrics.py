@@ -0,0 +1,182 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+
+    def observe(self, labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts, _, _ = state
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = ('le', _format_value(float(bound)))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {bucket_count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    Every gunicorn worker keeps its own registry, so a scrape shows the worker
+    that answered it; scrape each worker (or run one) for a complete picture.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = Histogram(
+            'parkease_http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+        self.requests = Counter(
+            'parkease_http_requests_total', 'Requests by endpoint and status.', ('endpoint', 'method', 'status'))
+        self.request_statements = Histogram(
+            'parkease_sql_statements_per_request', 'SQL statements issued per request.', ('endpoint',),
+            buckets=STATEMENT_BUCKETS)
+        self.sql_statements = Counter(
+            'parkease_sql_statements_total', 'SQL statements executed, by endpoint.', ('endpoint',))
+        self.sql_seconds = Counter(
+            'parkease_sql_duration_seconds_total', 'Time spent in SQL, by endpoint.', ('endpoint',))
+        self.operations = Histogram(
+            'parkease_operation_duration_seconds', 'Duration of QR, email and other slow operations.', ('operation',))
+        self.cache_lookups = Counter(
+            'parkease_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ('cache', 'result'))
+        self._metrics = [self.request_latency, self.requests, self.request_statements,
+                         self.sql_statements, self.sql_seconds, self.operations, self.cache_lookups]
+
+    def record_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        with self._lock:
+            self.request_latency.observe((endpoint, method), seconds)
+            self.requests.inc((endpoint, method, str(status)))
+            self.request_statements.observe((endpoint,), statements)
+            self.sql_statements.inc((endpoint,), statements)
+            self.sql_seconds.inc((endpoint,), sql_seconds)
+
+    def record_sql_outside_request(self, seconds):
+        with self._lock:
+            self.sql_statements.inc(('background',))
+            self.sql_seconds.inc(('background',), seconds)
+
+    def record_operation(self, operation, seconds):
+        with self._lock:
+            self.operations.observe((operation,), seconds)
+
+    def record_cache_lookups(self, cache, hits, misses):
+        with self._lock:
+            self.cache_lookups.inc((cache, 'hit'), hits)
+            self.cache_lookups.inc((cache, 'miss'), misses)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def timed(operation):
+    """Record how long the block (or decorated function) takes under parkease_operation_duration_seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_operation(operation, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('parkease_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['parkease_query_start'].pop()
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_statements += 1
+        g.metrics_sql_seconds += elapsed
+    else:
+        metrics.record_sql_outside_request(elapsed)
+
+
+def init_metrics(app, engine):
+    """Hook request timing into app and SQL counting into engine."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_sql_seconds = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' in g:
+            metrics.record_request(
+                request.endpoint or 'unmatched',
+                request.method,
+                response.status_code,
+                time.perf_counter() - g.metrics_started,
+                g.metrics_statements,
+                g.metrics_sql_seconds,
+            )
+        return response
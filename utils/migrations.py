@@ -0,0 +1,217 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text, Table, Column, Integer, String, DateTime, MetaData
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import IntegrityError
+from models.models import db
+
+
+# Applied migrations are recorded here, one row per version. It lives in its
+# own MetaData so db.create_all() and the models never touch it.
+_version_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register a schema migration.
+
+    Migrations run once each, in version order. A database created by this
+    version of the code already has every table, column and index the models
+    declare, so each migration must also be a no-op where its change is
+    already in place.
+    """
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _add_column(table_name, name, ddl):
+    """ALTER TABLE ADD COLUMN unless the column exists. Returns True if it was added."""
+    existing = {col['name'] for col in inspect(db.engine).get_columns(table_name)}
+    if name in existing:
+        return False
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {name} {ddl}'))
+    return True
+
+
+def _create_indexes(*names):
+    """Create model-declared indexes by name if the database lacks them."""
+    wanted = set(names)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in wanted:
+                index.create(db.engine, checkfirst=True)
+                wanted.discard(index.name)
+    if wanted:
+        raise ValueError(f"No model declares indexes {sorted(wanted)}")
+
+
+@migration(1, 'create tables')
+def _create_tables():
+    db.create_all()
+
+
+@migration(2, 'lot spot counters')
+def _lot_spot_counters():
+    from utils.inventory import reconcile_lot_counters
+
+    added = [
+        _add_column('parking_lots', name, 'INTEGER NOT NULL DEFAULT 0')
+        for name in ('spots_total', 'spots_available', 'spots_occupied')
+    ]
+    if any(added):
+        # parking_lots.version only arrives with migration 10
+        reconcile_lot_counters(fix=True, bump_version=False)
+
+
+@migration(3, 'lot coordinates')
+def _lot_coordinates():
+    _add_column('parking_lots', 'latitude', 'FLOAT')
+    _add_column('parking_lots', 'longitude', 'FLOAT')
+
+
+@migration(4, 'reservation windows and check-in')
+def _reservation_windows():
+    _add_column('reservations', 'planned_end_time', 'TIMESTAMP')
+    if _add_column('reservations', 'checked_in_at', 'TIMESTAMP'):
+        # Reservations made before check-in existed occupied their spot from booking
+        with db.engine.begin() as conn:
+            conn.execute(text(
+                'UPDATE reservations SET checked_in_at = COALESCE(planned_start_time, parking_time) '
+                'WHERE checked_in_at IS NULL'
+            ))
+
+
+@migration(5, 'reservation spot index')
+def _reservation_spot_index():
+    _create_indexes('ix_reservations_spot_id')
+
+
+@migration(6, 'hot query indexes')
+def _hot_query_indexes():
+    _create_indexes('ix_reservations_user_leaving', 'ix_reservations_active_spot', 'ix_parking_spots_lot_status')
+
+
+@migration(7, 'lot search index')
+def _lot_search_index():
+    from utils.search import ensure_search_index
+
+    ensure_search_index()
+
+
+@migration(8, 'reservation archive')
+def _reservation_archive():
+    from models.models import ArchivedReservation
+
+    ArchivedReservation.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(9, 'history pagination indexes')
+def _history_pagination_indexes():
+    _create_indexes('ix_reservations_user_parking', 'ix_reservations_archive_user_parking')
+
+
+@migration(10, 'lot versions')
+def _lot_versions():
+    _add_column('parking_lots', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@migration(11, 'QR token revocations')
+def _qr_token_revocations():
+    from models.models import RevokedQRToken
+
+    RevokedQRToken.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(12, 'gate change log')
+def _gate_change_log():
+    from models.models import GateChange
+
+    GateChange.__table__.create(db.engine, checkfirst=True)
+
+
+@migration(13, 'reservation ids never reused')
+def _reservation_autoincrement():
+    # SQLite hands out max(id) + 1 unless the table is AUTOINCREMENT, so
+    # deleting the newest reservation let the next booking take its id and
+    # collide with its ledger entry. PostgreSQL's sequence never reuses one.
+    if db.engine.dialect.name != 'sqlite':
+        return
+    from models.models import Reservation
+
+    table = Reservation.__table__
+    with db.engine.begin() as conn:
+        ddl = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reservations'"
+        )).scalar()
+        if 'AUTOINCREMENT' in ddl.upper():
+            return
+
+        # SQLite cannot add AUTOINCREMENT in place: copy into a new table
+        # and swap it in, then recreate the indexes
+        for name in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'reservations' AND sql IS NOT NULL"
+        )).scalars().all():
+            conn.execute(text(f'DROP INDEX "{name}"'))
+        create = str(CreateTable(table).compile(dialect=conn.dialect))
+        conn.execute(text(create.replace('CREATE TABLE reservations ', 'CREATE TABLE reservations_rebuilt ', 1)))
+        columns = ', '.join(column.name for column in table.columns)
+        conn.execute(text(f'INSERT INTO reservations_rebuilt ({columns}) SELECT {columns} FROM reservations'))
+        conn.execute(text('DROP TABLE reservations'))
+        conn.execute(text('ALTER TABLE reservations_rebuilt RENAME TO reservations'))
+        for index in table.indexes:
+            index.create(conn)
+
+        # Ids already purged from the top must not come back either
+        last_id = conn.execute(text(
+            'SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM reservations'
+            ' UNION ALL SELECT MAX(id) FROM reservations_archive'
+            ' UNION ALL SELECT MAX(reservation_id) FROM revenue_entries)'
+        )).scalar() or 0
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'reservations'"))
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('reservations', :seq)"), {'seq': last_id})
+
+
+def applied_versions():
+    schema_migrations.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [(version, name) for version, name, _ in MIGRATIONS if version not in applied]
+
+
+def migrate(log=print):
+    """Apply every pending migration in order. Returns the versions applied.
+
+    Databases that predate this runner (and were patched at startup instead)
+    simply replay every migration; each finds its change in place.
+    """
+    applied = applied_versions()
+    done = []
+    for version, name, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        log(f"Applying migration {version}: {name}")
+        fn()
+        db.session.commit()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(schema_migrations.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        except IntegrityError:
+            # Another worker applied it at the same time; every migration is idempotent
+            pass
+        done.append(version)
+    return done
@@ -0,0 +1,85 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models.models import db, EmailOutbox
+from utils.utils import generate_qr_image, send_bulk_emails
+
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+
+
+def enqueue_email(to_email, subject, html_body, qr_data=None):
+    """Queue an email in the current transaction; the worker delivers it after commit."""
+    message = EmailOutbox(to_email=to_email, subject=subject, html_body=html_body, qr_data=qr_data)
+    db.session.add(message)
+    return message
+
+
+def backoff_delay(attempts):
+    """Exponential backoff after the given number of failed attempts."""
+    return timedelta(seconds=min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempts - 1)))
+
+
+def deliver_pending(batch_size=50, max_attempts=MAX_ATTEMPTS, log=print):
+    """Send one batch of due messages. Returns (sent, failed) counts for the batch."""
+    now = datetime.utcnow()
+    # SKIP LOCKED lets several workers drain the outbox on PostgreSQL without
+    # sending the same message twice; SQLite ignores the clause.
+    messages = db.session.execute(
+        select(EmailOutbox)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    # The whole batch goes out over one pooled SMTP session.
+    results = send_bulk_emails([
+        (message.to_email, message.subject, message.html_body,
+         generate_qr_image(message.qr_data) if message.qr_data else None)
+        for message in messages
+    ]) if messages else []
+
+    sent = failed = 0
+    for message, (success, error) in zip(messages, results):
+        message.attempts += 1
+        if success:
+            message.status = 'sent'
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+            sent += 1
+            continue
+
+        failed += 1
+        message.last_error = error
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+            log(f"Outbox message {message.id} to {message.to_email} gave up after {message.attempts} attempts: {error}")
+        else:
+            message.next_attempt_at = datetime.utcnow() + backoff_delay(message.attempts)
+
+    db.session.commit()
+    return sent, failed
+
+
+def run_worker(poll_interval=2.0, batch_size=50, once=False, log=print):
+    """Drain the outbox until interrupted, sleeping when there is nothing due."""
+    while True:
+        try:
+            sent, failed = deliver_pending(batch_size=batch_size, log=log)
+        except Exception as e:
+            db.session.rollback()
+            log(f"Outbox worker error: {e}")
+            sent, failed = 0, 0
+
+        if sent or failed:
+            log(f"Outbox: {sent} sent, {failed} failed")
+
+        if sent + failed < batch_size:
+            if once:
+                return
+            time.sleep(poll_interval)
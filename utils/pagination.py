@@ -0,0 +1,107 @@
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime
+
+from flask import request, url_for
+from sqlalchemy import tuple_
+
+
+PER_PAGE = 20
+
+
+class Page:
+    """One page of rows plus opaque cursors for its neighbours (None at either end)."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values, direction):
+    payload = [direction] + [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """(direction, key values) from a cursor, or None if it is missing or malformed.
+
+    Values are converted back with the python type of each column, so a
+    timestamp compares as a timestamp and not as a string.
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        direction, values = payload[0], payload[1:]
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            return None
+        return direction, [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (binascii.Error, ValueError, TypeError, IndexError, AttributeError, NotImplementedError):
+        return None
+
+
+def keyset_page(sources, key, cursor=None, per_page=PER_PAGE, descending=False):
+    """Fetch one page by seeking past the cursor's key instead of skipping rows.
+
+    sources is a list of (query, columns): ORM queries over the same kind of
+    rows and the unique key columns they are ordered by, e.g.
+    [(Reservation.query.filter_by(user_id=1), (Reservation.parking_time, Reservation.id))].
+    More than one source is merged, which is how archived rows are paged
+    together with live ones. key(row) gives a row's key values in the same
+    order. Every source fetches at most per_page + 1 rows with a row-value
+    comparison, so with an index on the key columns a page deep into the
+    history costs the same as the first one.
+    """
+    columns = sources[0][1]
+    decoded = decode_cursor(cursor, columns)
+    direction, values = decoded if decoded else ('next', None)
+    # Walking backwards flips the order; the page is put back in order below
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+
+    fetched = []
+    for query, cols in sources:
+        if values is not None:
+            seek = tuple_(*cols) > tuple_(*values) if not reverse else tuple_(*cols) < tuple_(*values)
+            query = query.filter(seek)
+        order = [col.desc() if reverse else col.asc() for col in cols]
+        fetched.append(query.order_by(None).order_by(*order).limit(per_page + 1).all())
+
+    rows = list(heapq.merge(*fetched, key=key, reverse=reverse)) if len(fetched) > 1 else fetched[0]
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return Page([])
+    first, last = key(rows[0]), key(rows[-1])
+    has_next = more if not backwards else True
+    has_prev = values is not None if not backwards else more
+    return Page(
+        rows,
+        next_cursor=encode_cursor(last, 'next') if has_next else None,
+        prev_cursor=encode_cursor(first, 'prev') if has_prev else None,
+    )
+
+
+def cursor_url(cursor):
+    """The current page's URL with its query string kept and the cursor replaced.
+
+    The route's own arguments win over query-string keys of the same name.
+    """
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **{**args, **request.view_args})
@@ -0,0 +1,61 @@
+import math
+
+
+# Releasing before the planned start costs this fraction of one hour.
+CANCELLATION_FRACTION = 0.25
+SECONDS_PER_HOUR = 3600
+
+
+def _round_money(amount):
+    # round(x * 100) / 100 rather than round(x, 2) so that np.rint in the
+    # vectorised path rounds the very same float the same way.
+    return round(amount * 100) / 100
+
+
+def cancellation_fee(price_per_hour):
+    return _round_money(price_per_hour * CANCELLATION_FRACTION)
+
+
+def billed_hours(planned_start, end):
+    """Hours parked between the planned start and end, never negative."""
+    return max(0.0, (end - planned_start).total_seconds() / SECONDS_PER_HOUR)
+
+
+def charge(price_per_hour, planned_start, end):
+    """Cost of a reservation that starts at planned_start and is released at end.
+
+    Every started hour is billed in full; releasing before the planned start
+    is a cancellation and costs CANCELLATION_FRACTION of an hour.
+    """
+    if end < planned_start:
+        return cancellation_fee(price_per_hour)
+    return _round_money(math.ceil(billed_hours(planned_start, end)) * price_per_hour)
+
+
+def reservation_charge(reservation, price_per_hour, end=None):
+    """charge() for a Reservation, released at end (its leaving time if not given)."""
+    planned_start = reservation.planned_start_time or reservation.parking_time
+    return charge(price_per_hour, planned_start, end or reservation.leaving_time)
+
+
+def charges(price_per_hour, planned_start, end):
+    """Vectorised charge() over equal-length sequences, returned as a float array.
+
+    Datetimes may be given as lists of datetime or as datetime64 arrays;
+    price_per_hour may also be a scalar. Gives exactly the amounts charge()
+    gives row by row.
+    """
+    # Loaded by the first batch release or backfill rather than when a worker starts
+    import numpy as np
+
+    start = np.asarray(planned_start, dtype='datetime64[us]')
+    end = np.asarray(end, dtype='datetime64[us]')
+    price = np.asarray(price_per_hour, dtype=np.float64)
+
+    hours = (end - start).astype(np.int64) / 1e6 / SECONDS_PER_HOUR
+    amount = np.where(
+        end < start,
+        price * CANCELLATION_FRACTION,
+        np.ceil(np.maximum(hours, 0.0)) * price,
+    )
+    return np.rint(amount * 100) / 100
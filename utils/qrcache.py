@@ -0,0 +1,199 @@
+import hashlib
+import os
+import tempfile
+import threading
+from io import BytesIO
+
+from utils.cache import LRUCache
+from utils.metrics import metrics
+
+
+# Bump when a renderer changes its output, so cached images and ETags turn over
+RENDER_VERSION = 1
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_MEMORY_MAX_BYTES = 8 * 1024 * 1024
+QR_DISK_MAX_BYTES = 256 * 1024 * 1024
+# Pruning the directory stops once it is this far under its limit
+QR_DISK_LOW_WATER = 0.9
+
+QR_FORMATS = {
+    # What emails have always carried: 10px modules, already 1-bit
+    'png': ('image/png', '.png'),
+    # One pixel per module, for screens that scale it up (image-rendering: pixelated)
+    'png1': ('image/png', '.png'),
+    'svg': ('image/svg+xml', '.svg'),
+}
+
+
+def qr_modules(data):
+    """The module matrix generate_qr_image() has always drawn, as rows of booleans."""
+    # qrcode and PIL load on the first render, not when a worker starts
+    import qrcode
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=QR_BOX_SIZE,
+                       border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.modules
+
+
+def render_qr(data, fmt='png'):
+    """Render data as a QR code in one of QR_FORMATS, without any caching."""
+    modules = qr_modules(data)
+    if fmt == 'svg':
+        return _render_svg(modules, QR_BORDER)
+    if fmt == 'png1':
+        return _render_png(modules, 1, QR_BORDER, optimize=True)
+    if fmt == 'png':
+        return _render_png(modules, QR_BOX_SIZE, QR_BORDER)
+    raise ValueError(f"unknown QR format {fmt!r}")
+
+
+def _render_png(modules, box_size, border, **save_options):
+    # Drawn from the matrix in one pass and scaled up, rather than one
+    # rectangle per module; byte for byte what qrcode's own PIL image saves
+    from PIL import Image
+    size = len(modules) + 2 * border
+    image = Image.new('1', (size, size), 1)
+    pixels = image.load()
+    for y, row in enumerate(modules):
+        for x, dark in enumerate(row):
+            if dark:
+                pixels[x + border, y + border] = 0
+    if box_size != 1:
+        image = image.resize((size * box_size, size * box_size), Image.NEAREST)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', **save_options)
+    return buffer.getvalue()
+
+
+def _render_svg(modules, border):
+    # One path, one subpath per horizontal run of dark modules, in module units
+    size = len(modules) + 2 * border
+    runs = []
+    for y, row in enumerate(modules):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            runs.append(f"M{start + border} {y + border}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/><path d="{"".join(runs)}"/></svg>'
+    ).encode()
+
+
+class QRImageCache:
+    """Rendered QR images keyed by a hash of what they show and how.
+
+    Entries never go stale, since the key is the content: a memory LRU in
+    front of a directory of files named by key. The directory is shared by
+    every worker on the host and survives restarts; past max_disk_bytes the
+    least recently used files (by mtime, touched on every hit) are removed.
+    """
+
+    def __init__(self, directory=None, max_bytes=QR_MEMORY_MAX_BYTES, max_disk_bytes=QR_DISK_MAX_BYTES):
+        self.memory = LRUCache(max_bytes)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data, fmt='png'):
+        """The content address of data rendered as fmt; also the image's strong ETag."""
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"unknown QR format {fmt!r}")
+        return hashlib.sha256(f"{RENDER_VERSION}\0{fmt}\0{data}".encode()).hexdigest()[:32]
+
+    def get(self, data, fmt='png'):
+        """(image bytes, key) for data as fmt, rendering it only on a miss at both levels."""
+        key = self.key(data, fmt)
+        image = self.memory.get_many([key]).get(key)
+        if image is not None:
+            metrics.record_cache_lookups('qr_memory', 1, 0)
+            return image, key
+        metrics.record_cache_lookups('qr_memory', 0, 1)
+
+        image = self._read(key, fmt)
+        metrics.record_cache_lookups('qr_disk', int(image is not None), int(image is None))
+        if image is None:
+            image = render_qr(data, fmt)
+            self._write(key, fmt, image)
+        self.memory.set_many({key: image})
+        return image, key
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], key + QR_FORMATS[fmt][1])
+
+    def _read(self, key, fmt):
+        if not self.directory:
+            return None
+        path = self._path(key, fmt)
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+            os.utime(path)
+            return image
+        except OSError:
+            return None
+
+    def _write(self, key, fmt, image):
+        if not self.directory:
+            return
+        path = self._path(key, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and renamed, so another worker never reads half a file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"QR cache write error: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._files())
+            else:
+                self._disk_bytes += len(image)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._prune()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _prune(self):
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * QR_DISK_LOW_WATER
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+qr_cache = QRImageCache()
+
+
+def init_qr_cache(default_directory):
+    """Configure from QR_CACHE_DIR (empty to keep images in memory only) and the size limits."""
+    qr_cache.directory = os.getenv('QR_CACHE_DIR', default_directory) or None
+    qr_cache.memory.max_bytes = int(os.getenv('QR_CACHE_MAX_BYTES', QR_MEMORY_MAX_BYTES))
+    qr_cache.max_disk_bytes = int(os.getenv('QR_CACHE_DISK_MAX_BYTES', QR_DISK_MAX_BYTES))
@@ -0,0 +1,225 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+
+from models.models import db, RevokedQRToken
+from utils.intervals import CHECK_IN_MARGIN
+
+
+TOKEN_PREFIX = 'PE1'
+LEGACY_PREFIX = 'reservation_id:'
+# A car may leave this long after its booking ends and still scan out
+EXIT_GRACE = timedelta(hours=24)
+# Truncated HMAC-SHA256: 128 bits is plenty and keeps the QR code small
+SIGNATURE_BYTES = 16
+FINGERPRINT_CHARS = 16
+# reservation id, spot id, valid from, valid until (epoch seconds)
+_CLAIMS = struct.Struct('>IIII')
+
+QRClaims = namedtuple('QRClaims', 'reservation_id spot_id not_before expires')
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class QRSigner:
+    """Signs and checks QR payloads with HMAC-SHA256, without the database.
+
+    A token is PE1.<key id>.<claims>.<signature>, base64url without padding.
+    The first configured key signs; every configured key verifies, so a key
+    can be rotated in while tokens signed with the old one are still out.
+    """
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('at least one QR signing key is required')
+        self._keys = {self.key_id(key): key for key in keys}
+        self._signing_id = self.key_id(keys[0])
+
+    @staticmethod
+    def key_id(key):
+        return hashlib.sha256(key).hexdigest()[:6]
+
+    def _sign(self, key_id, claims):
+        return hmac.new(self._keys[key_id], f"{TOKEN_PREFIX}.{key_id}.".encode() + claims,
+                        hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+    def issue(self, reservation_id, spot_id, not_before, expires):
+        claims = _CLAIMS.pack(reservation_id, spot_id, int(not_before.timestamp()), int(expires.timestamp()))
+        signature = self._sign(self._signing_id, claims)
+        return f"{TOKEN_PREFIX}.{self._signing_id}.{_b64encode(claims)}.{_b64encode(signature)}"
+
+    def fingerprints(self, reservation_id, spot_id, not_before, expires):
+        """fingerprint() of the signature each configured key gives these claims."""
+        claims = _CLAIMS.pack(reservation_id, spot_id, int(not_before.timestamp()), int(expires.timestamp()))
+        return [fingerprint(claims, self._sign(key_id, claims)) for key_id in self._keys]
+
+    def verify(self, token, now=None):
+        """The token's claims if it is genuine and valid at now; raises InvalidToken otherwise."""
+        try:
+            prefix, key_id, claims, signature = token.split('.')
+            claims, signature = _b64decode(claims), _b64decode(signature)
+        except (ValueError, binascii.Error):
+            raise InvalidToken('Invalid QR code format')
+        if prefix != TOKEN_PREFIX or key_id not in self._keys or len(claims) != _CLAIMS.size:
+            raise InvalidToken('Invalid QR code format')
+        if not hmac.compare_digest(signature, self._sign(key_id, claims)):
+            raise InvalidToken('QR code signature is not valid')
+
+        found = QRClaims(*_CLAIMS.unpack(claims))
+        now = time.time() if now is None else now
+        if now < found.not_before:
+            raise InvalidToken('QR code is not valid yet')
+        if now >= found.expires:
+            raise InvalidToken('QR code has expired')
+        return found
+
+
+def fingerprint(claims, signature):
+    """Short hash of a token's claims and signature.
+
+    Offline scanners match codes against these: they can tell a genuine
+    code from a forged one without being able to mint codes themselves.
+    """
+    return hashlib.sha256(claims + signature).hexdigest()[:FINGERPRINT_CHARS]
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def token_window(reservation):
+    """(not_before, expires) of a reservation's QR code, in server local time like the booking."""
+    start = reservation.planned_start_time or reservation.parking_time
+    return start - CHECK_IN_MARGIN, reservation.planned_end_time + EXIT_GRACE
+
+
+def issue_token(reservation):
+    not_before, expires = token_window(reservation)
+    return signer().issue(reservation.id, reservation.spot_id, not_before, expires)
+
+
+def token_fingerprints(reservation):
+    """Fingerprints of the codes issue_token() would give reservation, one per configured key.
+
+    A reservation moved to another spot at check-in no longer matches the
+    code it was sent, which names the booked spot.
+    """
+    not_before, expires = token_window(reservation)
+    return signer().fingerprints(reservation.id, reservation.spot_id, not_before, expires)
+
+
+class RevocationList:
+    """Per-worker copy of revoked QR tokens, so checking one needs no query.
+
+    Revocations are rows in revoked_qr_tokens, written in the same
+    transaction that cancels or releases the reservation. Each worker picks
+    up new rows incrementally (by id) at most every REFRESH_SECONDS, so a
+    token cancelled through another worker is refused within that delay.
+    The worker that revoked it passes the keys to remember() once it has
+    committed, and refuses the token straight away. Releasing still
+    re-checks the reservation row when it commits.
+    """
+
+    REFRESH_SECONDS = 2
+
+    def __init__(self):
+        self._revoked = set()
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        rows = db.session.execute(
+            select(RevokedQRToken.id, RevokedQRToken.reservation_id, RevokedQRToken.expires_at)
+            .where(RevokedQRToken.id > self._last_id)
+            .order_by(RevokedQRToken.id)
+        ).all()
+        now = datetime.now().timestamp()
+        with self._lock:
+            for row in rows:
+                self._revoked.add((row.reservation_id, int(row.expires_at.timestamp())))
+                self._last_id = row.id
+            self._revoked = {key for key in self._revoked if key[1] > now}
+            self._refreshed_at = time.monotonic()
+
+    def is_revoked(self, claims):
+        if time.monotonic() - self._refreshed_at >= self.REFRESH_SECONDS:
+            self._refresh()
+        with self._lock:
+            return (claims.reservation_id, claims.expires) in self._revoked
+
+    def revoke(self, reservation):
+        """Record that reservation's QR code no longer releases anything. The caller commits.
+
+        Reservations booked before signed codes (no planned end) have nothing
+        to revoke. Rows past their token's expiry are pruned on the way.
+        Returns the revoked keys, for remember() after the commit.
+        """
+        return self.revoke_many([reservation])
+
+    def revoke_many(self, reservations):
+        """revoke() for many reservations (or rows with the same columns) in one insert."""
+        rows = [
+            {'reservation_id': reservation.id, 'expires_at': token_window(reservation)[1]}
+            for reservation in reservations if reservation.planned_end_time is not None
+        ]
+        if not rows:
+            return []
+        db.session.execute(delete(RevokedQRToken).where(RevokedQRToken.expires_at <= datetime.now()))
+        db.session.execute(RevokedQRToken.__table__.insert(), rows)
+        return [(row['reservation_id'], int(row['expires_at'].timestamp())) for row in rows]
+
+    def remember(self, keys):
+        """Refuse keys from revoke() in this worker now, without waiting for a refresh. Call after commit."""
+        with self._lock:
+            self._revoked.update(keys)
+
+    def clear(self):
+        with self._lock:
+            self._revoked = set()
+            self._last_id = 0
+            self._refreshed_at = 0.0
+
+
+revocations = RevocationList()
+_signer = None
+_signer_lock = threading.Lock()
+
+
+def init_qr_signing():
+    """Load the signing keys from QR_SIGNING_KEYS (comma-separated, newest first)."""
+    global _signer
+    keys = [key.strip().encode() for key in os.getenv('QR_SIGNING_KEYS', '').split(',') if key.strip()]
+    if not keys:
+        # Codes signed with a throwaway key stop verifying when the process
+        # restarts, and other workers cannot verify them at all
+        print("QR_SIGNING_KEYS is not set; QR codes are signed with a per-process key")
+        keys = [os.urandom(32)]
+    with _signer_lock:
+        _signer = QRSigner(keys)
+
+
+def signer():
+    if _signer is None:
+        init_qr_signing()
+    return _signer
+
+
+def accept_legacy():
+    """Whether plain reservation_id:<id> codes, issued before signing, still scan."""
+    return os.getenv('QR_ACCEPT_LEGACY', 'true').lower() != 'false'
@@ -0,0 +1,111 @@
+from sqlalchemy import select, inspect, text, func, or_, literal_column, table, column
+from models.models import db, ParkingLot
+
+
+# SQLite keeps an external-content FTS5 table over parking_lots. The trigram
+# tokenizer matches arbitrary substrings, so results are the same as the old
+# ILIKE '%q%' scans but come from the index. Triggers keep it in step with
+# every insert, update and delete, including add_lot and edit_lot.
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE parking_lots_fts USING fts5(
+        prime_location_name, address, pin_code,
+        content='parking_lots', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER parking_lots_fts_ai AFTER INSERT ON parking_lots BEGIN
+        INSERT INTO parking_lots_fts(rowid, prime_location_name, address, pin_code)
+        VALUES (new.id, new.prime_location_name, new.address, new.pin_code);
+    END""",
+    """CREATE TRIGGER parking_lots_fts_ad AFTER DELETE ON parking_lots BEGIN
+        INSERT INTO parking_lots_fts(parking_lots_fts, rowid, prime_location_name, address, pin_code)
+        VALUES ('delete', old.id, old.prime_location_name, old.address, old.pin_code);
+    END""",
+    """CREATE TRIGGER parking_lots_fts_au AFTER UPDATE OF prime_location_name, address, pin_code ON parking_lots BEGIN
+        INSERT INTO parking_lots_fts(parking_lots_fts, rowid, prime_location_name, address, pin_code)
+        VALUES ('delete', old.id, old.prime_location_name, old.address, old.pin_code);
+        INSERT INTO parking_lots_fts(rowid, prime_location_name, address, pin_code)
+        VALUES (new.id, new.prime_location_name, new.address, new.pin_code);
+    END""",
+    "INSERT INTO parking_lots_fts(parking_lots_fts) VALUES ('rebuild')",
+]
+
+# PostgreSQL uses a pg_trgm GIN index on one concatenated search document. An
+# expression index is maintained by the database itself, so it cannot drift.
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE INDEX IF NOT EXISTS ix_parking_lots_search_trgm ON parking_lots
+       USING gin ((prime_location_name || ' ' || address || ' ' || pin_code) gin_trgm_ops)""",
+]
+
+TRIGRAM_MIN_LENGTH = 3
+
+fts_table = table('parking_lots_fts', column('rowid'))
+
+
+def _search_document():
+    return ParkingLot.prime_location_name + ' ' + ParkingLot.address + ' ' + ParkingLot.pin_code
+
+
+def ensure_search_index():
+    """Create the lot search index for the current database if it is missing."""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite':
+        if inspect(db.engine).has_table('parking_lots_fts'):
+            return False
+        with db.engine.begin() as conn:
+            for statement in SQLITE_FTS_DDL:
+                conn.execute(text(statement))
+        return True
+
+    if dialect == 'postgresql':
+        with db.engine.begin() as conn:
+            for statement in POSTGRES_TRGM_DDL:
+                conn.execute(text(statement))
+        return True
+
+    return False
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_lots(query, limit=50, only_available=True):
+    """Lots whose name, address or pin code contains query, best matches first.
+
+    Availability comes from the lot's counter columns, so the whole search is
+    one statement returning at most limit rows.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    stmt = select(ParkingLot)
+    if only_available:
+        stmt = stmt.where(ParkingLot.spots_available > 0)
+
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite' and len(query) >= TRIGRAM_MIN_LENGTH:
+        phrase = '"' + query.replace('"', '""') + '"'
+        stmt = (
+            stmt.join(fts_table, fts_table.c.rowid == ParkingLot.id)
+            .where(literal_column('parking_lots_fts').op('MATCH')(phrase))
+            .order_by(func.bm25(literal_column('parking_lots_fts')), ParkingLot.id)
+        )
+    elif dialect == 'postgresql':
+        document = _search_document()
+        stmt = (
+            stmt.where(document.ilike(f'%{_escape_like(query)}%', escape='\\'))
+            .order_by(func.word_similarity(query, document).desc(), ParkingLot.id)
+        )
+    else:
+        # Too short for trigrams (or no index for this database): plain scan.
+        pattern = f'%{_escape_like(query)}%'
+        stmt = stmt.where(or_(
+            ParkingLot.address.ilike(pattern, escape='\\'),
+            ParkingLot.pin_code.ilike(pattern, escape='\\'),
+            ParkingLot.prime_location_name.ilike(pattern, escape='\\'),
+        )).order_by(ParkingLot.id)
+
+    return db.session.execute(stmt.limit(limit)).scalars().all()
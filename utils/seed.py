@@ -0,0 +1,204 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+
+from models.models import db, User, ParkingLot, ParkingSpot, Reservation
+
+
+# Every seeded user shares this password so load tests can log in as any of them.
+SEED_PASSWORD = 'parkease-seed'
+# Created by `flask init-db` on a database without any admin
+DEFAULT_ADMIN_EMAIL = 'admin@parkease.com'
+DEFAULT_ADMIN_PASSWORD = 'admin123'
+
+AREAS = ['Koramangala', 'Indiranagar', 'Whitefield', 'Jayanagar', 'Hebbal', 'Yelahanka', 'Malleshwaram',
+         'Banashankari', 'Marathahalli', 'Electronic City', 'Bellandur', 'Rajajinagar', 'Basavanagudi']
+PLACES = ['Mall', 'Metro Station', 'Tech Park', 'Hospital', 'Stadium', 'Market', 'Bus Depot', 'Plaza',
+          'Convention Centre', 'Railway Station', 'University', 'Temple Road']
+STREETS = ['MG Road', '80 Feet Road', 'Outer Ring Road', 'Hosur Road', 'Bannerghatta Road', 'Old Airport Road',
+           'Sarjapur Road', 'Tumkur Road', 'Residency Road', 'Church Street']
+CITY_CENTER = (12.9716, 77.5946)
+CITY_SPREAD_DEG = 0.25
+HISTORY_DAYS = 180
+
+
+def _next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _insert_batches(table, rows, batch_size, log=None, label=None):
+    """executemany() rows into table, committing every batch_size rows."""
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+            if log and inserted % (batch_size * 50) == 0:
+                log(f"  {inserted} {label}...")
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        inserted += len(batch)
+    return inserted
+
+
+def _reset_sequences(*models):
+    # Rows are inserted with explicit ids, which PostgreSQL's serial
+    # sequences don't see; move them past the new rows.
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        ))
+    db.session.commit()
+
+
+def create_default_admin():
+    """Create the default admin unless some admin exists. Returns whether it was created."""
+    if db.session.execute(select(User.id).where(User.role == 'admin').limit(1)).first():
+        return False
+    db.session.add(User(
+        email=DEFAULT_ADMIN_EMAIL,
+        password=generate_password_hash(DEFAULT_ADMIN_PASSWORD),
+        fullname='Administrator',
+        address='Admin Office',
+        pincode='000000',
+        role='admin',
+    ))
+    db.session.commit()
+    return True
+
+
+def seed_data(users=100000, lots=1000, spots=200000, reservations=5000000, occupancy=0.3,
+              batch_size=10000, seed=42, log=print):
+    """Bulk-insert synthetic users, lots, spots and reservations.
+
+    Spots are spread evenly over the lots and about `occupancy` of them are
+    held by an active reservation, each for a different user (so occupancy is
+    capped by the number of users); the rest of the reservations are completed
+    ones spread over the last HISTORY_DAYS days. Lot counters are written
+    consistent with the spots. Rows are appended after any existing data, so
+    the command can be run against a database that is already in use.
+    Returns a dict of row counts per table.
+    """
+    if lots < 1 or spots < lots:
+        raise ValueError("Need at least one lot and at least one spot per lot")
+    if users < 1:
+        raise ValueError("Need at least one user")
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    user_start = _next_id(User)
+    lot_start = _next_id(ParkingLot)
+    spot_start = _next_id(ParkingSpot)
+    reservation_start = _next_id(Reservation)
+
+    password = generate_password_hash(SEED_PASSWORD)
+    log(f"Seeding {users} users...")
+    _insert_batches(User.__table__, (
+        {
+            'id': user_start + i,
+            'email': f'seed{user_start + i}@parkease.test',
+            'password': password,
+            'fullname': f'Seed User {user_start + i}',
+            'address': f'{rng.randint(1, 999)}, {rng.choice(STREETS)}, {rng.choice(AREAS)}, Bengaluru',
+            'pincode': f'560{rng.randint(0, 120):03d}',
+            'role': 'user',
+            'created_at': now,
+            'updated_at': now,
+        }
+        for i in range(users)
+    ), batch_size)
+
+    per_lot, extra = divmod(spots, lots)
+    lot_sizes = [per_lot + (1 if i < extra else 0) for i in range(lots)]
+    lot_occupied = [min(size, int(round(size * occupancy))) for size in lot_sizes]
+    active = min(sum(lot_occupied), reservations, users)
+    # Trim occupancy from the last lots if there are fewer reservations (or users) than occupied spots
+    surplus = sum(lot_occupied) - active
+    for i in range(lots - 1, -1, -1):
+        if not surplus:
+            break
+        cut = min(surplus, lot_occupied[i])
+        lot_occupied[i] -= cut
+        surplus -= cut
+
+    log(f"Seeding {lots} lots...")
+    _insert_batches(ParkingLot.__table__, (
+        {
+            'id': lot_start + i,
+            'prime_location_name': f'{rng.choice(AREAS)} {rng.choice(PLACES)} {lot_start + i}',
+            'address': f'{rng.randint(1, 999)}, {rng.choice(STREETS)}, {rng.choice(AREAS)}, Bengaluru',
+            'pin_code': f'560{rng.randint(0, 120):03d}',
+            'price_per_hour': rng.choice([10, 20, 30, 50]),
+            'created_at': now,
+            'spots_total': size,
+            'spots_available': size - occupied,
+            'spots_occupied': occupied,
+            'latitude': CITY_CENTER[0] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+            'longitude': CITY_CENTER[1] + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+        }
+        for i, (size, occupied) in enumerate(zip(lot_sizes, lot_occupied))
+    ), batch_size)
+
+    def spot_rows():
+        spot_id = spot_start
+        for i, (size, occupied) in enumerate(zip(lot_sizes, lot_occupied)):
+            for n in range(size):
+                yield {'id': spot_id, 'lot_id': lot_start + i, 'status': 'O' if n < occupied else 'A', 'created_at': now}
+                spot_id += 1
+
+    log(f"Seeding {spots} spots...")
+    _insert_batches(ParkingSpot.__table__, spot_rows(), batch_size, log, 'spots')
+
+    def reservation_rows():
+        reservation_id = reservation_start
+        # The first `occupied` spots of each lot hold the active reservations,
+        # one per user as the booking flow enforces.
+        active_users = iter(rng.sample(range(users), active))
+        first_spot = spot_start
+        for size, occupied in zip(lot_sizes, lot_occupied):
+            for n in range(occupied):
+                start = now - timedelta(minutes=rng.randint(5, 600))
+                yield {
+                    'id': reservation_id,
+                    'spot_id': first_spot + n,
+                    'user_id': user_start + next(active_users),
+                    'vehicle_number': f'KA{rng.randint(1, 60):02d}{rng.randint(0, 9999):04d}',
+                    'parking_time': start,
+                    'planned_start_time': start,
+                    'planned_end_time': start + timedelta(hours=rng.randint(1, 12)),
+                    'checked_in_at': start,
+                    'leaving_time': None,
+                }
+                reservation_id += 1
+            first_spot += size
+
+        for _ in range(reservations - active):
+            start = now - timedelta(days=HISTORY_DAYS) + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+            yield {
+                'id': reservation_id,
+                'spot_id': spot_start + rng.randrange(spots),
+                'user_id': user_start + rng.randrange(users),
+                'vehicle_number': f'KA{rng.randint(1, 60):02d}{rng.randint(0, 9999):04d}',
+                'parking_time': start,
+                'planned_start_time': start,
+                'planned_end_time': start + timedelta(hours=rng.randint(1, 10)),
+                'checked_in_at': start,
+                'leaving_time': min(now, start + timedelta(minutes=rng.randint(15, 600))),
+            }
+            reservation_id += 1
+
+    log(f"Seeding {reservations} reservations ({active} active)...")
+    _insert_batches(Reservation.__table__, reservation_rows(), batch_size, log, 'reservations')
+
+    _reset_sequences(User, ParkingLot, ParkingSpot, Reservation)
+    return {'users': users, 'lots': lots, 'spots': spots, 'reservations': reservations, 'active': active}
@@ -1,42 +1,22 @@
-import qrcode
 from io import BytesIO
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
+import queue
+import threading
+import time
 import os
 from datetime import datetime
-from dotenv import load_dotenv
-from pathlib import Path
+from utils.metrics import timed
+from utils.qrcache import qr_cache
 
-# Load environment variables
-BASE_DIR = Path(__file__).resolve().parent.parent 
-env_path = BASE_DIR / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
-
-# Debug print
-print(f"Utils.py loading .env from: {env_path}")
-print(f"SENDER_EMAIL in utils: {os.getenv('SENDER_EMAIL')}")
+# smtplib and email.mime load on the first send: web workers only queue mail
+# in the outbox, and the send-emails worker delivers it
 
+@timed('qr_generate')
 def generate_qr_image(data):
     """Generate QR code image and return as BytesIO buffer"""
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        return buffer
+        # Re-sends and retries of the same code are served from the QR cache
+        image, _ = qr_cache.get(data, 'png')
+        return BytesIO(image)
     except Exception as e:
         print(f"QR generation error: {e}")
         return None
@@ -95,56 +75,171 @@ def build_booking_email(user, lot, reservation_id, booking_datetime=None):
     
     return html_body
 
-def send_email_with_qr(to_email, subject, html_body, qr_buffer):
-    """Send email with QR code attachment"""
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions open and reuses them across messages.
+
+    Sessions idle for longer than idle_timeout are probed with NOOP before
+    reuse, and a message that hits a dropped connection is retried once on a
+    fresh session. At most max_size sessions are open at a time.
+    """
+
+    def __init__(self, host, port, login, password, use_tls=True, max_size=2, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.use_tls = use_tls
+        self.idle_timeout = idle_timeout
+        self.connections_opened = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        import smtplib
+        with timed('smtp_connect'):
+            server = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.use_tls:
+                server.starttls()
+            server.login(self.login, self.password)
+        self.connections_opened += 1
+        return server
+
+    def _checkout(self):
+        import smtplib
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            if time.monotonic() - last_used < self.idle_timeout:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(server)
+
+    def _discard(self, server):
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def send_many(self, sender, messages):
+        """Send (to_email, MIME message) pairs over one session.
+
+        Returns a list of (success, message) tuples in the same order.
+        """
+        import smtplib
+        results = []
+        self._slots.acquire()
+        server = None
+        try:
+            for to_email, msg in messages:
+                text = msg.as_string()
+                for attempt in (1, 2):
+                    try:
+                        if server is None:
+                            server = self._checkout()
+                        with timed('email_send'):
+                            server.sendmail(sender, to_email, text)
+                        results.append((True, "Email sent successfully"))
+                        break
+                    except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError) as e:
+                        if server is not None:
+                            self._discard(server)
+                            server = None
+                        if attempt == 2:
+                            results.append((False, f"Email error: {str(e)} (Type: {type(e).__name__})"))
+                    except smtplib.SMTPException as e:
+                        results.append((False, f"Email error: {str(e)} (Type: {type(e).__name__})"))
+                        break
+        finally:
+            if server is not None:
+                self._idle.put((server, time.monotonic()))
+            self._slots.release()
+        return results
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                server.quit()
+            except Exception:
+                self._discard(server)
+
+
+_smtp_pools = {}
+_smtp_pools_lock = threading.Lock()
+
+def get_smtp_pool():
+    """Process-wide pool for the SMTP settings currently in the environment."""
+    settings = (
+        os.getenv('SMTP_SERVER', 'smtp-relay.brevo.com'),
+        int(os.getenv('SMTP_PORT', 587)),
+        os.getenv('BREVO_LOGIN'),
+        os.getenv('SENDER_PASSWORD'),
+        os.getenv('SMTP_USE_TLS', 'true').lower() != 'false',
+    )
+    with _smtp_pools_lock:
+        pool = _smtp_pools.get(settings)
+        if pool is None:
+            pool = _smtp_pools[settings] = SMTPConnectionPool(
+                *settings, max_size=int(os.getenv('SMTP_POOL_SIZE', 2))
+            )
+        return pool
+
+def build_email_message(sender_email, to_email, subject, html_body, qr_buffer):
+    """Build the MIME message for an HTML email with an optional QR attachment"""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.image import MIMEImage
+
+    msg = MIMEMultipart('related')
+    msg['From'] = sender_email  
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    
+    msg.attach(MIMEText(html_body, 'html'))
+    
+    if qr_buffer:
+        qr_buffer.seek(0)
+        qr_image = MIMEImage(qr_buffer.read())
+        qr_image.add_header('Content-ID', '<qr_code>')
+        qr_image.add_header('Content-Disposition', 'attachment', filename='qr_code.png')
+        msg.attach(qr_image)
+    
+    return msg
+
+def send_bulk_emails(emails):
+    """Send many (to_email, subject, html_body, qr_buffer) emails over a pooled session.
+
+    Returns a list of (success, message) tuples in the same order.
+    """
+    sender_email = os.getenv('SENDER_EMAIL')
+    if not all([sender_email, os.getenv('BREVO_LOGIN'), os.getenv('SENDER_PASSWORD')]):
+        print("ERROR: Email credentials missing")
+        return [(False, "Email credentials not configured")] * len(emails)
+
     try:
-        smtp_server = os.getenv('SMTP_SERVER', 'smtp-relay.brevo.com')
-        smtp_port = int(os.getenv('SMTP_PORT', 587))
-        sender_email = os.getenv('SENDER_EMAIL')  
-        brevo_login = os.getenv('BREVO_LOGIN')    
-        sender_password = os.getenv('SENDER_PASSWORD')  
-        
-        print(f"=== EMAIL DEBUG ===")
-        print(f"SMTP Server: {smtp_server}")
-        print(f"Port: {smtp_port}")
-        print(f"From (Display): {sender_email}")
-        print(f"Login Username: {brevo_login}")
-        print(f"Password set: {'Yes' if sender_password else 'No'}")
-        
-        if not all([sender_email, brevo_login, sender_password]):
-            print("ERROR: Email credentials missing")
-            return False, "Email credentials not configured"
-        
-        msg = MIMEMultipart('related')
-        msg['From'] = sender_email  
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        if qr_buffer:
-            qr_buffer.seek(0)
-            qr_image = MIMEImage(qr_buffer.read())
-            qr_image.add_header('Content-ID', '<qr_code>')
-            qr_image.add_header('Content-Disposition', 'attachment', filename='qr_code.png')
-            msg.attach(qr_image)
-        
-        print("Connecting to SMTP server...")
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        
-        print("Logging in...")
-        server.login(brevo_login, sender_password)  
-        
-        print("Sending email...")
-        text = msg.as_string()
-        server.sendmail(sender_email, to_email, text)  
-        server.quit()
-        
-        print("Email sent successfully!")
-        return True, "Email sent successfully"
-        
+        messages = [
+            (to_email, build_email_message(sender_email, to_email, subject, html_body, qr_buffer))
+            for to_email, subject, html_body, qr_buffer in emails
+        ]
+        return get_smtp_pool().send_many(sender_email, messages)
     except Exception as e:
         error_msg = f"Email error: {str(e)} (Type: {type(e).__name__})"
         print(error_msg)
-        return False, error_msg
\ No newline at end of file
+        return [(False, error_msg)] * len(emails)
+
+def send_email_with_qr(to_email, subject, html_body, qr_buffer):
+    """Send email with QR code attachment"""
+    success, message = send_bulk_emails([(to_email, subject, html_body, qr_buffer)])[0]
+    if not success:
+        print(message)
+    return success, message